@@ -55,10 +55,10 @@ class UserResponse(BaseModel):
         from_attributes = True
     
     @classmethod
-    def model_validate(cls, user):
+    def model_validate(cls, user, interests=None):
+        """Build from a User row; pass ``interests`` when they were bulk-loaded"""
         import json
         photos = []
-        interests = []
         
         try:
             if user.photos:
@@ -71,17 +71,18 @@ class UserResponse(BaseModel):
             photos = []
             
         # Get interests from database
-        try:
-            from app.core.database import SessionLocal, user_interests
-            db = SessionLocal()
-            interest_rows = db.execute(
-                user_interests.select().where(user_interests.c.user_id == user.id)
-            ).fetchall()
-            interests = [row.interest for row in interest_rows]
-            db.close()
-        except Exception as e:
-            print(f"Error loading interests: {e}")
-            interests = []
+        if interests is None:
+            try:
+                from app.core.database import SessionLocal, user_interests
+                db = SessionLocal()
+                interest_rows = db.execute(
+                    user_interests.select().where(user_interests.c.user_id == user.id)
+                ).fetchall()
+                interests = [row.interest for row in interest_rows]
+                db.close()
+            except Exception as e:
+                print(f"Error loading interests: {e}")
+                interests = []
         
         return cls(
             id=user.id,
@@ -104,6 +105,18 @@ class UserResponse(BaseModel):
             longitude=user.longitude
         )
 
+def load_interests(db: Session, user_ids) -> dict:
+    """Interests for many users in one query, keyed by user id"""
+    from app.core.database import user_interests
+    interests = {user_id: [] for user_id in user_ids}
+    if interests:
+        rows = db.execute(
+            user_interests.select().where(user_interests.c.user_id.in_(list(interests)))
+        ).fetchall()
+        for row in rows:
+            interests[row.user_id].append(row.interest)
+    return interests
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -119,20 +132,31 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def decode_user_id(token: str) -> Optional[str]:
+    """The user id a token was issued for, or None if it isn't valid"""
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
+async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> str:
+    """The user id from a valid token, without loading the user (for hot paths)"""
+    user_id = decode_user_id(token)
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user_id
+
+async def get_current_user(user_id: str = Depends(get_current_user_id), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
     user = db.query(User).filter(User.id == user_id).first()
     if user is None:
         raise credentials_exception
@@ -1,14 +1,18 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, case
 from pydantic import BaseModel
 from typing import Optional
 from ...core.database import get_db, CallHistory, User
 from ...models.user import User as UserModel
 from ..routes.auth import get_current_user
 from datetime import datetime
-import uuid
+import base64
+import json
+import time
 
 class CallHistoryData(BaseModel):
+    call_id: Optional[str] = None
     other_user_id: str
     call_type: str  # 'video' or 'audio'
     duration: Optional[int] = 0
@@ -16,28 +20,70 @@ class CallHistoryData(BaseModel):
 
 router = APIRouter()
 
+def _encode_cursor(created_at: datetime, call_id: str) -> str:
+    raw = f"{created_at.isoformat()}|{call_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, call_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), call_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _first_photo(photos) -> Optional[str]:
+    try:
+        photos = json.loads(photos) if isinstance(photos, str) else photos
+    except ValueError:
+        return None
+    return photos[0] if photos else None
+
 @router.get("/history")
 async def get_call_history(
+    cursor: Optional[str] = None,
+    limit: int = 50,
     current_user: UserModel = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get call history for current user"""
+    """Call history for current user, newest first.
+    
+    Paginate by passing ``next_cursor`` back as ``cursor``.
+    """
+    limit = max(1, min(limit, 100))
+    before = _decode_cursor(cursor) if cursor else None
+    
     try:
-        calls = db.query(CallHistory).filter(
-            (CallHistory.caller_id == current_user.id) | 
+        other_user_id = case(
+            (CallHistory.caller_id == current_user.id, CallHistory.callee_id),
+            else_=CallHistory.caller_id
+        )
+        query = db.query(CallHistory, other_user_id, User.name, User.photos).outerjoin(
+            User, User.id == other_user_id
+        ).filter(
+            (CallHistory.caller_id == current_user.id) |
             (CallHistory.callee_id == current_user.id)
-        ).order_by(CallHistory.created_at.desc()).limit(50).all()
+        )
+        
+        if before:
+            query = query.filter(or_(
+                CallHistory.created_at < before[0],
+                and_(CallHistory.created_at == before[0], CallHistory.id < before[1])
+            ))
+        
+        rows = query.order_by(CallHistory.created_at.desc(), CallHistory.id.desc()).limit(limit + 1).all()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1][0].created_at, rows[-1][0].id)
         
         call_list = []
-        for call in calls:
-            other_user_id = call.callee_id if call.caller_id == current_user.id else call.caller_id
-            other_user = db.query(User).filter(User.id == other_user_id).first()
-            
+        for call, other_id, other_name, other_photos in rows:
             call_list.append({
                 "id": call.id,
-                "other_user_id": other_user_id,
-                "other_user_name": other_user.name if other_user else "Unknown",
-                "other_user_photo": other_user.photos if other_user else None,
+                "other_user_id": other_id,
+                "other_user_name": other_name or "Unknown",
+                "other_user_photo": _first_photo(other_photos),
                 "call_type": call.call_type,
                 "duration": call.duration,
                 "status": call.status,
@@ -45,30 +91,35 @@ async def get_call_history(
                 "is_incoming": call.callee_id == current_user.id
             })
         
-        return {"calls": call_list}
+        return {"calls": call_list, "next_cursor": next_cursor}
     except Exception as e:
-        return {"calls": []}
+        return {"calls": [], "next_cursor": None}
 
 @router.post("/history")
 async def save_call_history(
     call_data: CallHistoryData,
-    current_user: UserModel = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: UserModel = Depends(get_current_user)
 ):
-    """Save call history after P2P call ends"""
+    """Save call history after P2P call ends.
+    
+    Calls signaled through the server are already logged by the call
+    registry, so their reports are ignored; the rest are queued with them.
+    """
     try:
-        call_history = CallHistory(
-            id=str(uuid.uuid4()),
-            caller_id=current_user.id,
-            callee_id=call_data.other_user_id,
-            call_type=call_data.call_type,
-            duration=call_data.duration or 0,
-            status=call_data.status,
-            created_at=datetime.utcnow()
-        )
+        calls = request.app.state.call_registry
+        if call_data.call_id and await calls.tracked(current_user.id, call_data.other_user_id, call_data.call_id):
+            return {"success": True}
         
-        db.add(call_history)
-        db.commit()
+        await calls.record({
+            "call_id": call_data.call_id,
+            "caller_id": current_user.id,
+            "callee_id": call_data.other_user_id,
+            "call_type": call_data.call_type,
+            "duration": call_data.duration or 0,
+            "status": call_data.status,
+            "started_at": time.time()
+        })
         return {"success": True}
     except Exception as e:
         return {"success": False, "error": str(e)}
\ No newline at end of file
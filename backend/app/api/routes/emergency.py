@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from app.core.database import get_db, Match, Message
+from app.core.database import get_db, Match, Message, append_message
+from app.services.inbox_cache import message_preview
 from app.models.user import User
 from app.api.routes.auth import get_current_user
 from pydantic import BaseModel
@@ -19,17 +20,18 @@ class EmergencyAlertRequest(BaseModel):
 @router.post("/alert")
 async def send_emergency_alert(
     alert_data: EmergencyAlertRequest,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Send emergency alert to all matched users"""
     
     try:
-        # Get all matches for current user
+        # Get all matches for current user, locked for seq allocation
         matches = db.query(Match).filter(
             ((Match.user1_id == current_user.id) | (Match.user2_id == current_user.id)),
             Match.is_active == True
-        ).all()
+        ).with_for_update().all()
         
         print(f"Found {len(matches)} matches for user {current_user.name}")
         
@@ -39,6 +41,8 @@ async def send_emergency_alert(
             location_text = f" at location {alert_data.latitude:.6f}, {alert_data.longitude:.6f}"
         
         # Create emergency message in ALL matches
+        now = datetime.utcnow()
+        alerts = []
         for match in matches:
             print(f"Creating emergency message for match {match.id}")
             
@@ -47,13 +51,27 @@ async def send_emergency_alert(
                 sender_id="system",
                 content=f"🚨 EMERGENCY ALERT: {current_user.name} needs help{location_text}. Please check on them immediately!",
                 message_type="emergency",
-                is_read=False
+                is_read=False,
+                created_at=now
             )
             
-            db.add(emergency_message)
+            append_message(db, emergency_message, match)
+            match.last_message_at = now
+            match.record_activity(now)
+            alerts.append((match.id, emergency_message.seq, (match.user1_id, match.user2_id), message_preview({
+                "content": emergency_message.content,
+                "sender_id": emergency_message.sender_id,
+                "message_type": emergency_message.message_type
+            })))
             alert_count += 1
         
         db.commit()
+        
+        # System messages are unread for both participants
+        for match_id, seq, participants, preview in alerts:
+            for user_id in participants:
+                await request.app.state.unread_counter.increment(user_id, match_id, seq)
+                await request.app.state.inbox_cache.touch(user_id, match_id, now, preview)
         print(f"Emergency alert sent to {alert_count} matches for user {current_user.name}")
         
         return {
@@ -86,7 +104,7 @@ async def _create_emergency_notification(
         ((Match.user1_id == user_id) & (Match.user2_id == sender_id)) |
         ((Match.user1_id == sender_id) & (Match.user2_id == user_id)),
         Match.is_active == True
-    ).first()
+    ).with_for_update().first()
     
     if match:
         print(f"Creating emergency message for match {match.id}")
@@ -99,7 +117,7 @@ async def _create_emergency_notification(
             is_read=False
         )
         
-        db.add(emergency_message)
+        append_message(db, emergency_message, match)
         db.commit()
         
         print(f"Emergency message saved to database for match {match.id}")
@@ -1,14 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
+from sqlalchemy import case
 from datetime import datetime, timedelta
-from app.core.database import get_db
+from app.core.database import get_db, Match
 from app.models.user import User
-from app.api.routes.auth import get_current_user
+from app.api.routes.auth import get_current_user, UserResponse, load_interests
+from app.api.routes.matches import load_inbox_rows
 from pydantic import BaseModel
 from typing import Optional
 
 router = APIRouter()
 
+# Sorted match list orders, besides "recent", which is served from the inbox cache
+SORT_ORDERS = {
+    "new": (Match.created_at.desc(),),
+    "active": (Match.activity_score.desc(),),
+    "super": (Match.is_super_like.desc(), Match.created_at.desc()),
+}
+
 class BoostRequest(BaseModel):
     duration_minutes: int = 30
     boost_type: str = "free"  # free, premium
@@ -60,51 +69,59 @@ async def get_boost_status(
 
 @router.get("/matches/sorted")
 async def get_sorted_matches(
+    request: Request,
     sort_by: str = "recent",  # recent, new, active, super
+    page: int = 1,
+    limit: int = 20,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get matches sorted by specified criteria"""
     
-    from app.core.database import Match
-    from app.api.routes.auth import UserResponse
+    if sort_by != "recent" and sort_by not in SORT_ORDERS:
+        raise HTTPException(status_code=400, detail="Invalid sort_by")
     
-    # Get user's matches
-    matches_query = db.query(Match).filter(
-        (Match.user1_id == current_user.id) | (Match.user2_id == current_user.id),
-        Match.is_active == True
-    )
+    page = max(1, page)
+    limit = max(1, min(limit, 100))
+    offset = (page - 1) * limit
     
-    # Apply sorting
     if sort_by == "recent":
-        matches_query = matches_query.order_by(Match.last_message_at.desc())
-    elif sort_by == "new":
-        matches_query = matches_query.order_by(Match.created_at.desc())
-    elif sort_by == "active":
-        # Sort by recent activity (placeholder)
-        matches_query = matches_query.order_by(Match.last_message_at.desc())
-    elif sort_by == "super":
-        # Sort super likes first (placeholder)
-        matches_query = matches_query.order_by(Match.created_at.desc())
-    
-    matches = matches_query.all()
+        # Same order as the inbox, so serve it from the inbox cache
+        rows, next_cursor = await load_inbox_rows(request, db, current_user.id, limit, offset=offset)
+        rows = [(match, other_user) for match, other_user, _ in rows]
+        has_more = next_cursor is not None
+    else:
+        # Every order is backed by a (user, sort key) index on each side of the match
+        other_user_id = case(
+            (Match.user1_id == current_user.id, Match.user2_id),
+            else_=Match.user1_id
+        )
+        rows = db.query(Match, User).join(
+            User, User.id == other_user_id
+        ).filter(
+            (Match.user1_id == current_user.id) | (Match.user2_id == current_user.id),
+            Match.is_active == True
+        ).order_by(*SORT_ORDERS[sort_by], Match.id.desc()).offset(offset).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
     
-    result = []
-    for match in matches:
-        other_user_id = match.user2_id if match.user1_id == current_user.id else match.user1_id
-        other_user = db.query(User).filter(User.id == other_user_id).first()
-        
-        if other_user:
-            result.append({
-                "id": match.id,
-                "other_user": UserResponse.model_validate(other_user),
-                "created_at": match.created_at,
-                "last_message_at": match.last_message_at,
-                "is_active": match.is_active
-            })
+    interests = load_interests(db, {other_user.id for _, other_user in rows})
+    result = [
+        {
+            "id": match.id,
+            "other_user": UserResponse.model_validate(other_user, interests=interests[other_user.id]),
+            "created_at": match.created_at,
+            "last_message_at": match.last_message_at,
+            "is_super_like": match.is_super_like,
+            "is_active": match.is_active
+        }
+        for match, other_user in rows
+    ]
     
     return {
         "matches": result,
         "sort_by": sort_by,
+        "page": page,
+        "has_more": has_more,
         "total_count": len(result)
     }
\ No newline at end of file
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from typing import List
@@ -14,6 +14,7 @@ router = APIRouter()
 
 @router.get("/photos")
 async def get_feed_photos(
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -111,6 +112,7 @@ async def get_feed_photos(
                 if photos:
                     # Show all photos but prioritize by algorithm score
                     total_score = user[9] + user[10] + user[11] + interest_score
+                    location = _format_location(request.app.state.geocoder, user[4], user[5]) if user[4] and user[5] else "Unknown"
                     
                     for i, photo_url in enumerate(photos):
                         photo_id = f"{user[0]}_{i}"
@@ -130,7 +132,7 @@ async def get_feed_photos(
                             "user_name": user[1],
                             "user_age": user[2],
                             "photo_url": photo_url,
-                            "location": _format_location(user[4], user[5]) if user[4] and user[5] else "Unknown",
+                            "location": location,
                             "timestamp": user[8].isoformat() if hasattr(user[8], 'isoformat') else str(user[8]),
                             "likes_count": base_likes,
                             "is_liked": photo_id in user_liked_photos,
@@ -175,53 +177,12 @@ async def get_feed_photos(
         print(f"Error getting feed photos: {e}")
         return {"feed_items": []}
 
-def _format_location(lat, lng):
-    """Convert coordinates to real location using reverse geocoding"""
-    try:
-        if lat and lng:
-            import requests
-            # Use free OpenStreetMap Nominatim API for reverse geocoding
-            url = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={lat}&lon={lng}&zoom=10&addressdetails=1"
-            
-            headers = {
-                'User-Agent': 'Amora Dating App (contact@amora.app)'
-            }
-            
-            response = requests.get(url, headers=headers, timeout=5)
-            
-            if response.status_code == 200:
-                data = response.json()
-                address = data.get('address', {})
-                
-                # Extract city/town/village
-                city = (address.get('city') or 
-                       address.get('town') or 
-                       address.get('village') or 
-                       address.get('suburb'))
-                
-                state = address.get('state')
-                country = address.get('country')
-                
-                if city and country:
-                    if state and country == 'India':
-                        return f"{city}, {state}"
-                    else:
-                        return f"{city}, {country}"
-                elif state and country:
-                    return f"{state}, {country}"
-                elif country:
-                    return country
-            
-            # Fallback to coordinates if API fails
-            return f"{lat:.1f}°N, {lng:.1f}°E"
-        
-        return "Unknown"
-    except Exception as e:
-        print(f"Geocoding error: {e}")
-        # Fallback to coordinates
-        if lat and lng:
-            return f"{lat:.1f}°N, {lng:.1f}°E"
-        return "Unknown"
+def _format_location(geocoder, lat, lng):
+    """Convert coordinates to a place name with the offline reverse geocoder"""
+    if lat and lng:
+        # Fallback to coordinates away from any known place
+        return geocoder.label(lat, lng) or f"{lat:.1f}°N, {lng:.1f}°E"
+    return "Unknown"
 
 class LikeRequest(BaseModel):
     is_like: bool
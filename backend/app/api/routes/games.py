@@ -1,21 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from ...core.database import get_db
 from ...models.user import User
 from ..routes.auth import get_current_user
+from ...services.game_rooms import GameRoomError, new_room, snapshot
 from datetime import datetime
 import json
 import uuid
 
 router = APIRouter()
 
-# In-memory storage for game rooms (in production, use Redis or database)
-game_rooms: Dict[str, Dict[str, Any]] = {}
+class QuickMatchRequest(BaseModel):
+    prefer_matches: bool = False  # group with people you've matched with first
+
+def _player(user: User) -> Dict[str, Any]:
+    return {
+        "id": user.id,
+        "name": user.name,
+        "avatar": user.photos[0] if user.photos else None,
+        "is_connected": True,
+        "is_muted": False
+    }
 
 @router.post("/rooms/create")
 async def create_game_room(
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -24,105 +36,62 @@ async def create_game_room(
     try:
         room_id = str(uuid.uuid4())[:8]  # Short room ID
         
-        room_data = {
-            "id": room_id,
-            "creator_id": current_user.id,
-            "players": [
-                {
-                    "id": current_user.id,
-                    "name": current_user.name,
-                    "avatar": current_user.photos[0] if current_user.photos else None,
-                    "is_connected": True,
-                    "is_muted": False
-                }
-            ],
-            "state": "waiting",
-            "current_question": None,
-            "selected_player": None,
-            "round": 1,
-            "created_at": datetime.now().isoformat()
-        }
+        room_data = new_room(room_id, _player(current_user), datetime.now().isoformat())
         
-        game_rooms[room_id] = room_data
+        await request.app.state.game_rooms.create(room_data)
         
         return {
             "room_id": room_id,
             "players": room_data["players"],
-            "state": room_data["state"]
+            "state": room_data["state"],
+            "version": room_data["version"]
         }
         
+    except GameRoomError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create room: {str(e)}")
 
 @router.post("/rooms/{room_id}/join")
 async def join_game_room(
     room_id: str,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Join an existing game room"""
     
     try:
-        if room_id not in game_rooms:
-            raise HTTPException(status_code=404, detail="Room not found")
-        
-        room = game_rooms[room_id]
-        
-        # Check if user already in room
-        if any(p["id"] == current_user.id for p in room["players"]):
-            return {
-                "players": room["players"],
-                "state": room["state"]
-            }
-        
-        # Check room capacity (max 4 players)
-        if len(room["players"]) >= 4:
-            raise HTTPException(status_code=400, detail="Room is full")
-        
-        # Add player to room
-        new_player = {
-            "id": current_user.id,
-            "name": current_user.name,
-            "avatar": current_user.photos[0] if current_user.photos else None,
-            "is_connected": True,
-            "is_muted": False
-        }
-        
-        room["players"].append(new_player)
+        # Applied by the room's actor; already-joined players are let back
+        # in, and the room's player cap holds under concurrent joins
+        room = await request.app.state.room_actors.join(room_id, _player(current_user))
         
-        return {
-            "players": room["players"],
-            "state": room["state"]
-        }
+        # The joiner starts from this snapshot and applies game_delta frames
+        # with higher versions
+        return snapshot(room)
         
-    except HTTPException:
-        raise
+    except GameRoomError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to join room: {str(e)}")
 
 @router.post("/rooms/{room_id}/leave")
 async def leave_game_room(
     room_id: str,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Leave a game room"""
     
     try:
-        if room_id not in game_rooms:
-            return {"success": True}
-        
-        room = game_rooms[room_id]
-        
-        # Remove player from room
-        room["players"] = [p for p in room["players"] if p["id"] != current_user.id]
-        
-        # Delete room if empty
-        if not room["players"]:
-            del game_rooms[room_id]
+        # The room is deleted along with its last player
+        await request.app.state.room_actors.leave(room_id, current_user.id)
         
         return {"success": True}
         
+    except GameRoomError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to leave room: {str(e)}")
 
@@ -130,61 +99,144 @@ async def leave_game_room(
 async def update_game_state(
     room_id: str,
     state_data: dict,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Update game room state"""
+    """Update game room state.
+    
+    Passing the room "version" the client last saw makes the update
+    conditional: it fails with 409 if anyone changed the room since.
+    """
     
     try:
-        if room_id not in game_rooms:
-            raise HTTPException(status_code=404, detail="Room not found")
-        
-        room = game_rooms[room_id]
+        expected_version = state_data.get("version")
+        if expected_version is not None and not isinstance(expected_version, int):
+            raise HTTPException(status_code=400, detail="version must be an integer")
         
         # Update room state
+        fields = {}
         if "state" in state_data:
-            room["state"] = state_data["state"]
+            fields["state"] = state_data["state"]
         
         if "selected_player" in state_data:
-            room["selected_player"] = state_data["selected_player"]
+            fields["selected_player"] = state_data["selected_player"]
         
         if "question" in state_data:
-            room["current_question"] = state_data["question"]
+            fields["current_question"] = state_data["question"]
         
         if "round" in state_data:
-            room["round"] = state_data["round"]
+            fields["round"] = state_data["round"]
         
-        return {"success": True}
+        if not fields:
+            room = await request.app.state.game_rooms.get(room_id)
+            if room is None:
+                raise HTTPException(status_code=404, detail="Room not found")
+            return {"success": True, "version": room.get("version", 0)}
+        
+        version = await request.app.state.room_actors.update(room_id, fields, expected_version)
+        
+        return {"success": True, "version": version}
         
     except HTTPException:
         raise
+    except GameRoomError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update state: {str(e)}")
 
+@router.get("/rooms/mine")
+async def get_my_game_rooms(
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Rooms the current user is in, from the per-user room index"""
+    
+    try:
+        return {"rooms": await request.app.state.game_rooms.rooms_for(current_user.id)}
+    
+    except GameRoomError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@router.post("/quick-match")
+async def join_quick_match(
+    request: Request,
+    quick_match: Optional[QuickMatchRequest] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Queue for a game; the room arrives as a quick_match websocket frame"""
+    
+    try:
+        ticket = {
+            "player": _player(current_user),
+            "prefer_matches": bool(quick_match and quick_match.prefer_matches)
+        }
+        await request.app.state.game_rooms.enqueue(current_user.id, ticket)
+        
+        return {"status": "queued"}
+    
+    except GameRoomError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@router.get("/quick-match")
+async def get_quick_match_status(
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Whether the user is still queued, plus the rooms they're in"""
+    
+    try:
+        store = request.app.state.game_rooms
+        return {
+            "status": "queued" if await store.is_queued(current_user.id) else "idle",
+            "rooms": await store.rooms_for(current_user.id)
+        }
+    
+    except GameRoomError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@router.delete("/quick-match")
+async def leave_quick_match(
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Stop waiting for a quick match"""
+    
+    try:
+        await request.app.state.game_rooms.dequeue([current_user.id])
+        
+        return {"success": True}
+    
+    except GameRoomError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
 @router.get("/rooms/{room_id}")
 async def get_game_room(
     room_id: str,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get game room details"""
     
     try:
-        if room_id not in game_rooms:
+        room = await request.app.state.game_rooms.get(room_id)
+        if room is None:
             raise HTTPException(status_code=404, detail="Room not found")
         
-        room = game_rooms[room_id]
-        
         return {
             "id": room["id"],
             "players": room["players"],
             "state": room["state"],
             "current_question": room.get("current_question"),
             "selected_player": room.get("selected_player"),
-            "round": room.get("round", 1)
+            "round": room.get("round", 1),
+            "version": room.get("version", 0)
         }
         
     except HTTPException:
         raise
+    except GameRoomError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get room: {str(e)}")
\ No newline at end of file
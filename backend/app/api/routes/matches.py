@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
-from app.core.database import get_db, Match, Swipe
+from sqlalchemy import and_, or_, case
+from app.core.database import get_db, Match, Message, Swipe
 from app.models.user import User
-from app.api.routes.auth import get_current_user, UserResponse
+from app.api.routes.auth import get_current_user, UserResponse, load_interests
+from app.services.message_archiver import load_message_range
+from app.services.inbox_cache import InboxEntry, to_score, message_preview
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
+import base64
 import json
 
 router = APIRouter()
@@ -17,77 +21,268 @@ class MatchResponse(BaseModel):
     is_active: bool
     created_at: datetime
     last_message_at: datetime
-    last_message: str = None
+    last_message: Optional[str] = None
+    last_message_sender_id: Optional[str] = None
+    last_message_type: Optional[str] = None
+    unread_count: int = 0
     other_user: UserResponse
 
+def _encode_cursor(last_message_at: datetime, match_id: str) -> str:
+    raw = f"{last_message_at.isoformat()}|{match_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        last_message_at, match_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(last_message_at), match_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def match_list_query(db: Session, user_id: str):
+    """Matches joined with the other participant and the latest message.
+
+    Yields (Match, User, Message-or-None) rows. The latest message is found
+    through matches.last_seq, so it is a unique-index lookup per row rather
+    than a MAX() subquery.
+    """
+    other_user_id = case(
+        (Match.user1_id == user_id, Match.user2_id),
+        else_=Match.user1_id
+    )
+    return db.query(Match, User, Message).join(
+        User, User.id == other_user_id
+    ).outerjoin(
+        Message, and_(Message.match_id == Match.id, Message.seq == Match.last_seq)
+    ).filter(
+        (Match.user1_id == user_id) | (Match.user2_id == user_id)
+    )
+
+def _inbox_entries_from_db(db: Session, user_id: str) -> List[InboxEntry]:
+    """Every active match for the user with its last-message preview, newest first"""
+    rows = db.query(
+        Match.id, Match.last_message_at, Message.content, Message.sender_id, Message.message_type
+    ).outerjoin(
+        Message, and_(Message.match_id == Match.id, Message.seq == Match.last_seq)
+    ).filter(
+        (Match.user1_id == user_id) | (Match.user2_id == user_id),
+        Match.is_active == True
+    ).order_by(Match.last_message_at.desc(), Match.id.desc()).all()
+
+    return [
+        InboxEntry(match_id, to_score(last_message_at), message_preview({
+            "content": content,
+            "sender_id": sender_id,
+            "message_type": message_type
+        }) if sender_id else None)
+        for match_id, last_message_at, content, sender_id, message_type in rows
+    ]
+
+def _escape_like(term: str) -> str:
+    """Make LIKE wildcards in user input match literally (with escape="\\")"""
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+async def load_inbox_rows(
+    request: Request,
+    db: Session,
+    user_id: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    offset: int = 0
+):
+    """One page of the user's inbox as (Match, other User, preview) rows plus the next cursor.
+
+    Order and previews come from the inbox cache; on a miss the whole inbox
+    is rebuilt from the database with one query and stored. Only the page's
+    matches and users are then loaded, in a single query.
+    """
+    inbox = request.app.state.inbox_cache
+    before = _decode_cursor(cursor) if cursor else None
+
+    entries = await inbox.page(user_id, limit + 1, before, offset)
+    if entries is None:
+        token = await inbox.begin_load(user_id)
+        entries = _inbox_entries_from_db(db, user_id)
+        if token:
+            await inbox.load(user_id, token, entries)
+        if before:
+            before_score = to_score(before[0])
+            entries = [
+                entry for entry in entries
+                if entry.score < before_score or (entry.score == before_score and entry.match_id < before[1])
+            ]
+        else:
+            entries = entries[offset:]
+        entries = entries[:limit + 1]
+
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = _encode_cursor(entries[-1].last_message_at, entries[-1].match_id)
+
+    if not entries:
+        return [], next_cursor
+
+    other_user_id = case(
+        (Match.user1_id == user_id, Match.user2_id),
+        else_=Match.user1_id
+    )
+    loaded = {
+        match.id: (match, user) for match, user in db.query(Match, User).join(
+            User, User.id == other_user_id
+        ).filter(
+            Match.id.in_([entry.match_id for entry in entries]),
+            Match.is_active == True
+        ).all()
+    }
+
+    rows = []
+    for entry in entries:
+        if entry.match_id not in loaded:
+            # Deactivated without the cache hearing about it
+            await inbox.remove(user_id, entry.match_id)
+            continue
+        match, other_user = loaded[entry.match_id]
+        preview = Message(**entry.preview) if entry.preview else None
+        rows.append((match, other_user, preview))
+    return rows, next_cursor
+
+async def deactivate_matches(request: Request, db: Session, matches: List[Match]):
+    """Unmatch: mark inactive and drop from websocket routing and both participants' inbox and unread counts"""
+    for match in matches:
+        match.is_active = False
+    db.commit()
+
+    state = request.app.state
+    for match in matches:
+        await state.connection_manager.invalidate_match(match.id)
+        for user_id in (match.user1_id, match.user2_id):
+            await state.inbox_cache.remove(user_id, match.id)
+            await state.unread_counter.reset(user_id, match.id)
+
+async def reactivate_matches(request: Request, db: Session, matches: List[Match]):
+    """Undo deactivate_matches: routable again and back in both inboxes"""
+    for match in matches:
+        match.is_active = True
+        match.ended_by_block = False
+    db.commit()
+
+    state = request.app.state
+    for match in matches:
+        # Also clears any cached "not an active match" answer
+        await state.connection_manager.invalidate_match(match.id)
+        for user_id in (match.user1_id, match.user2_id):
+            await state.inbox_cache.touch(user_id, match.id, match.last_message_at)
+            await state.unread_counter.invalidate(user_id)
+
+def build_match_responses(db: Session, rows, unread_counts: dict) -> List[MatchResponse]:
+    interests = load_interests(db, {user.id for _, user, _ in rows})
+
+    result = []
+    for match, other_user, last_message in rows:
+        if last_message is None and (match.last_seq or 0) > 0:
+            # Latest message already moved to the archive
+            archived = load_message_range(db, match, match.last_seq, match.last_seq)
+            last_message = archived[0] if archived else None
+
+        result.append(MatchResponse(
+            id=match.id,
+            user1_id=match.user1_id,
+            user2_id=match.user2_id,
+            is_active=match.is_active,
+            created_at=match.created_at,
+            last_message_at=match.last_message_at,
+            last_message=last_message.content if last_message else None,
+            last_message_sender_id=last_message.sender_id if last_message else None,
+            last_message_type=last_message.message_type if last_message else None,
+            unread_count=unread_counts.get(match.id, 0),
+            other_user=UserResponse.model_validate(other_user, interests=interests[other_user.id])
+        ))
+    return result
+
 @router.get("/", response_model=List[MatchResponse])
 async def get_matches(
+    request: Request,
+    response: Response,
     search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    matches_query = db.query(Match).filter(
-        ((Match.user1_id == current_user.id) | (Match.user2_id == current_user.id)),
-        Match.is_active == True
-    )
-    
-    matches = matches_query.order_by(Match.last_message_at.desc()).all()
-    
-    result = []
-    seen_users = set()  # Track unique users to avoid duplicates
-    
-    for match in matches:
-        # Get other user
-        other_user_id = match.user2_id if match.user1_id == current_user.id else match.user1_id
-        
-        # Skip if we've already seen this user
-        if other_user_id in seen_users:
-            continue
-            
-        other_user = db.query(User).filter(User.id == other_user_id).first()
-        
-        if other_user:
-            # Apply search filter if provided
-            if search and search.lower() not in other_user.name.lower():
-                continue
-            
-            seen_users.add(other_user_id)
-            result.append(MatchResponse(
-                id=match.id,
-                user1_id=match.user1_id,
-                user2_id=match.user2_id,
-                is_active=match.is_active,
-                created_at=match.created_at,
-                last_message_at=match.last_message_at,
-                other_user=UserResponse.model_validate(other_user)
+    """Match list ordered by latest activity.
+
+    Paginate by passing the X-Next-Cursor response header back as ``cursor``.
+    """
+    limit = max(1, min(limit, 100))
+
+    if search:
+        # Name search bypasses the inbox cache
+        query = match_list_query(db, current_user.id).filter(
+            Match.is_active == True,
+            User.name.ilike(f"%{_escape_like(search)}%", escape="\\")
+        )
+
+        if cursor:
+            cursor_at, cursor_id = _decode_cursor(cursor)
+            query = query.filter(or_(
+                Match.last_message_at < cursor_at,
+                and_(Match.last_message_at == cursor_at, Match.id < cursor_id)
             ))
-    
-    return result
+
+        rows = query.order_by(Match.last_message_at.desc(), Match.id.desc()).limit(limit + 1).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1][0].last_message_at, rows[-1][0].id)
+    else:
+        rows, next_cursor = await load_inbox_rows(request, db, current_user.id, limit, cursor)
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    # Skip duplicate matches with the same user
+    unique_rows = []
+    seen_users = set()
+    for row in rows:
+        if row[1].id not in seen_users:
+            seen_users.add(row[1].id)
+            unique_rows.append(row)
+
+    unread_counts = await request.app.state.unread_counter.get_counts(db, current_user.id)
+    return build_match_responses(db, unique_rows, unread_counts)
 
 @router.get("/{match_id}", response_model=MatchResponse)
 async def get_match(
     match_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    row = match_list_query(db, current_user.id).filter(Match.id == match_id).first()
+
+    if not row:
+        raise HTTPException(status_code=404, detail="Match not found")
+
+    unread_counts = await request.app.state.unread_counter.get_counts(db, current_user.id)
+    return build_match_responses(db, [row], unread_counts)[0]
+
+@router.delete("/{match_id}")
+async def unmatch(
+    match_id: str,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     match = db.query(Match).filter(
         Match.id == match_id,
-        ((Match.user1_id == current_user.id) | (Match.user2_id == current_user.id))
+        ((Match.user1_id == current_user.id) | (Match.user2_id == current_user.id)),
+        Match.is_active == True
     ).first()
-    
+
     if not match:
         raise HTTPException(status_code=404, detail="Match not found")
-    
-    # Get other user
-    other_user_id = match.user2_id if match.user1_id == current_user.id else match.user1_id
-    other_user = db.query(User).filter(User.id == other_user_id).first()
-    
-    return MatchResponse(
-        id=match.id,
-        user1_id=match.user1_id,
-        user2_id=match.user2_id,
-        is_active=match.is_active,
-        created_at=match.created_at,
-        last_message_at=match.last_message_at,
-        other_user=UserResponse.model_validate(other_user)
-    )
\ No newline at end of file
+
+    await deactivate_matches(request, db, [match])
+
+    return {"message": "Unmatched successfully"}
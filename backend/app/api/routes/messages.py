@@ -1,13 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 import uuid
 
-from app.core.database import get_db, Match
+from app.core.database import get_db, Match, Message
 from app.models.user import User
 from app.api.routes.auth import get_current_user
+from app.services.message_pipeline import MessageRejected
+from app.services.message_search import search_messages
+from app.services.message_archiver import load_message_range
 
 router = APIRouter()
 
@@ -20,6 +24,7 @@ class MessageCreate(BaseModel):
 class MessageResponse(BaseModel):
     id: str
     match_id: str
+    seq: Optional[int] = None
     sender_id: str
     content: str
     message_type: str
@@ -35,63 +40,169 @@ class TypingIndicator(BaseModel):
     match_id: str
     is_typing: bool
 
+class SyncRequest(BaseModel):
+    cursors: Dict[str, int] = {}  # match_id -> last seq the client has
+    limit: int = 200  # max messages per match
+
+def _sender_names(db: Session, messages) -> Dict[str, str]:
+    sender_ids = {msg.sender_id for msg in messages if msg.sender_id != "system"}
+    names = dict(db.query(User.id, User.name).filter(User.id.in_(sender_ids)).all()) if sender_ids else {}
+    names["system"] = "System"
+    return names
+
+def _message_response(msg, sender_name: str) -> MessageResponse:
+    return MessageResponse(
+        id=str(msg.id),
+        match_id=str(msg.match_id),
+        seq=msg.seq,
+        sender_id=str(msg.sender_id),
+        content=msg.content,
+        message_type=msg.message_type,
+        image_url=msg.image_url,
+        is_read=msg.is_read,
+        created_at=msg.created_at,
+        sender_name=sender_name
+    )
+
 @router.post("/", response_model=MessageResponse)
 async def send_message(
     message_data: MessageCreate,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    pipeline = request.app.state.message_pipeline
+    
+    try:
+        message = await pipeline.submit(
+            sender_id=current_user.id,
+            match_id=message_data.match_id,
+            content=message_data.content,
+            message_type=message_data.message_type,
+            image_url=message_data.image_url
+        )
+    except MessageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    return MessageResponse(**message)
+
+@router.get("/unread-counts")
+async def get_unread_counts(
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # Verify match exists and user is participant
-    match = db.query(Match).filter(
-        Match.id == message_data.match_id,
+    """Unread counts for all of the user's matches in one lookup"""
+    counts = await request.app.state.unread_counter.get_counts(db, current_user.id)
+    
+    return {
+        "unread_counts": counts,
+        "total_unread": sum(counts.values())
+    }
+
+@router.get("/search")
+async def search_chat_messages(
+    q: str,
+    match_id: Optional[str] = None,
+    page: int = 1,
+    limit: int = 20,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Full-text search over the user's conversations, newest first"""
+    limit = max(1, min(limit, 50))
+    page = max(1, page)
+    
+    match_query = db.query(Match.id).filter(
         (Match.user1_id == current_user.id) | (Match.user2_id == current_user.id),
         Match.is_active == True
-    ).first()
+    )
+    if match_id:
+        match_query = match_query.filter(Match.id == match_id)
+    match_ids = [row[0] for row in match_query.all()]
     
-    if not match:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Match not found or you're not a participant"
-        )
+    rows = search_messages(db, match_ids, q, limit=limit, offset=(page - 1) * limit)
+    if rows is None:
+        return {"results": [], "page": page, "limit": limit, "has_more": False}
     
-    # Create message
-    from app.core.database import Message
-    message = Message(
-        match_id=message_data.match_id,
-        sender_id=current_user.id,
-        content=message_data.content,
-        message_type=message_data.message_type,
-        image_url=message_data.image_url
-    )
+    return {
+        "results": rows[:limit],
+        "page": page,
+        "limit": limit,
+        "has_more": len(rows) > limit
+    }
+
+@router.post("/sync")
+async def sync_messages(
+    sync_data: SyncRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Return messages and read watermarks newer than the client's per-match cursors.
+
+    Matches the client has no cursor for start from 0. Sequence numbers are
+    contiguous per match, so each match's window is the range
+    (cursor, cursor + limit] and all of them are fetched in one query.
+    """
+    limit = max(1, min(sync_data.limit, 500))
+    
+    matches = db.query(Match).filter(
+        (Match.user1_id == current_user.id) | (Match.user2_id == current_user.id),
+        Match.is_active == True
+    ).all()
     
-    db.add(message)
+    ranges = []
+    messages = []
+    for match in matches:
+        cursor = sync_data.cursors.get(match.id, 0)
+        if (match.last_seq or 0) <= cursor:
+            continue
+        if cursor < (match.archived_seq or 0):
+            # Rare: a client catching up on a conversation that was archived
+            messages.extend(load_message_range(db, match, cursor + 1, cursor + limit))
+        else:
+            ranges.append(and_(
+                Message.match_id == match.id,
+                Message.seq > cursor,
+                Message.seq <= cursor + limit
+            ))
     
-    # Update match last message time
-    match.last_message_at = datetime.utcnow()
+    if ranges:
+        messages.extend(db.query(Message).filter(or_(*ranges)).order_by(
+            Message.match_id, Message.seq
+        ).all())
     
-    db.commit()
-    db.refresh(message)
-    
-    # Prepare response
-    response = MessageResponse(
-        id=str(message.id),
-        match_id=str(message.match_id),
-        sender_id=str(message.sender_id),
-        content=message.content,
-        message_type=message.message_type,
-        image_url=message.image_url,
-        is_read=message.is_read,
-        created_at=message.created_at,
-        sender_name=current_user.name
-    )
+    names = _sender_names(db, messages)
+    by_match: Dict[str, list] = {}
+    for msg in messages:
+        by_match.setdefault(msg.match_id, []).append(
+            _message_response(msg, names.get(msg.sender_id, "Unknown"))
+        )
     
-    return response
+    result = []
+    for match in matches:
+        other_user_id = match.user2_id if match.user1_id == current_user.id else match.user1_id
+        match_messages = by_match.get(match.id, [])
+        cursor = sync_data.cursors.get(match.id, 0)
+        synced_to = match_messages[-1].seq if match_messages else cursor
+        
+        result.append({
+            "match_id": match.id,
+            "last_seq": match.last_seq or 0,
+            "read_seq": match.read_seq_for(current_user.id),
+            "other_read_seq": match.read_seq_for(other_user_id),
+            "messages": match_messages,
+            "has_more": synced_to < (match.last_seq or 0)
+        })
+    
+    return {"matches": result}
 
 @router.get("/{match_id}", response_model=List[MessageResponse])
 async def get_messages(
     match_id: str,
+    request: Request,
     skip: int = 0,
     limit: int = 50,
+    before_seq: Optional[int] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -107,17 +218,16 @@ async def get_messages(
             detail="Match not found"
         )
     
-    # Get messages
-    from app.core.database import Message
-    messages = db.query(Message).filter(
-        Message.match_id == match_id
-    ).order_by(
-        Message.created_at.asc()
-    ).offset(skip).limit(limit).all()
-    
-    print(f"Loading messages for match {match_id}: Found {len(messages)} messages")
-    for msg in messages:
-        print(f"Message: {msg.content[:50]}... Type: {msg.message_type} Sender: {msg.sender_id}")
+    # Sequence numbers are contiguous per match, so both paging styles map
+    # to a seq range; older ranges are read from the archive transparently
+    last_seq = match.last_seq or 0
+    if before_seq is not None:
+        range_end = min(before_seq - 1, last_seq)
+        range_start = max(1, range_end - limit + 1)
+    else:
+        range_start = skip + 1
+        range_end = min(skip + limit, last_seq)
+    messages = load_message_range(db, match, range_start, range_end)
     
     # Mark messages as read
     db.query(Message).filter(
@@ -125,63 +235,37 @@ async def get_messages(
         Message.sender_id != current_user.id,
         Message.is_read == False
     ).update({"is_read": True})
+    match.mark_read(current_user.id, match.last_seq or 0)
     db.commit()
+    await request.app.state.unread_counter.reset(current_user.id, match_id)
     
-    result = []
-    for msg in messages:
-        # Handle system messages
-        if msg.sender_id == "system":
-            sender_name = "System"
-        else:
-            # Get sender user
-            sender = db.query(User).filter(User.id == msg.sender_id).first()
-            sender_name = sender.name if sender else "Unknown"
-        
-        result.append(MessageResponse(
-            id=str(msg.id),
-            match_id=str(msg.match_id),
-            sender_id=str(msg.sender_id),
-            content=msg.content,
-            message_type=msg.message_type,
-            image_url=msg.image_url,
-            is_read=msg.is_read,
-            created_at=msg.created_at,
-            sender_name=sender_name
-        ))
-    
-    return result
+    names = _sender_names(db, messages)
+    return [_message_response(msg, names.get(msg.sender_id, "Unknown")) for msg in messages]
 
 @router.post("/{match_id}/typing")
 async def send_typing_indicator(
     match_id: str,
     typing_data: TypingIndicator,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: User = Depends(get_current_user)
 ):
-    # Verify match access
-    match = db.query(Match).filter(
-        Match.id == match_id,
-        (Match.user1_id == current_user.id) | (Match.user2_id == current_user.id)
-    ).first()
-    
-    if not match:
+    # Same throttled path as the websocket "typing" event; the match comes
+    # from the participant cache
+    if not await request.app.state.typing_indicators.update(match_id, current_user.id, typing_data.is_typing):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Match not found"
         )
     
-    # Here you would send typing indicator via WebSocket
-    # This is handled by the WebSocket manager
-    
     return {"status": "typing indicator sent"}
 
 @router.put("/{message_id}/read")
 async def mark_message_read(
     message_id: str,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    from app.core.database import Message
     message = db.query(Message).filter(Message.id == message_id).first()
     
     if not message:
@@ -199,33 +283,20 @@ async def mark_message_read(
         )
     
     message.is_read = True
+    if message.seq:
+        match.mark_read(current_user.id, message.seq)
     db.commit()
+    await request.app.state.unread_counter.invalidate(current_user.id)
     
     return {"status": "message marked as read"}
 
 @router.get("/{match_id}/unread-count")
 async def get_unread_count(
     match_id: str,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # Verify match access
-    match = db.query(Match).filter(
-        Match.id == match_id,
-        (Match.user1_id == current_user.id) | (Match.user2_id == current_user.id)
-    ).first()
-    
-    if not match:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Match not found"
-        )
-    
-    from app.core.database import Message
-    unread_count = db.query(Message).filter(
-        Message.match_id == match_id,
-        Message.sender_id != current_user.id,
-        Message.is_read == False
-    ).count()
+    counts = await request.app.state.unread_counter.get_counts(db, current_user.id)
     
-    return {"unread_count": unread_count}
\ No newline at end of file
+    return {"unread_count": counts.get(match_id, 0)}
@@ -1,34 +1,20 @@
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session
-from ...core.database import get_db
-from ...models.user import User
-from ..routes.auth import get_current_user
-from ...services.websocket_manager import ConnectionManager
-import json
+from fastapi import APIRouter, Depends, Request
+from ..routes.auth import get_current_user_id
 
 router = APIRouter()
 
 @router.post("/signaling")
 async def send_signaling_message(
     message: dict,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    user_id: str = Depends(get_current_user_id)
 ):
-    """Send WebRTC signaling message"""
+    """Send WebRTC signaling message (token-only auth, no database access)"""
     try:
-        from main import app
-        manager = app.state.connection_manager
-        
         # Add sender info
-        message['from'] = current_user.id
+        message['from'] = user_id
         
-        # Send to target user
-        target_user = message.get('to')
-        if target_user:
-            await manager.send_personal_message(
-                json.dumps(message), 
-                target_user
-            )
+        await request.app.state.signaling_relay.relay(user_id, {}, message)
         
         return {"success": True}
     except Exception as e:
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from app.core.database import get_db, Swipe, Match
 from app.models.user import User
 from app.api.routes.auth import get_current_user
+from app.services.ws_codec import Frame
 from pydantic import BaseModel
 from typing import List
 import uuid
@@ -19,6 +20,7 @@ class SwipeRequest(BaseModel):
 @router.post("/")
 async def create_swipe(
     swipe_data: SwipeRequest,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -63,10 +65,20 @@ async def create_swipe(
             # Create match
             match = Match(
                 user1_id=current_user.id,
-                user2_id=swipe_data.swiped_user_id
+                user2_id=swipe_data.swiped_user_id,
+                is_super_like=bool(swipe_data.is_super_like or reverse_swipe.is_super_like)
             )
             db.add(match)
             db.commit()
+            
+            state = request.app.state
+            for user_id, other_user_id in ((match.user1_id, match.user2_id), (match.user2_id, match.user1_id)):
+                await state.inbox_cache.touch(user_id, match.id, match.last_message_at)
+                await state.connection_manager.send_personal_message(Frame("new_match", {
+                    "match_id": match.id,
+                    "user_id": other_user_id,
+                    "is_super_like": match.is_super_like
+                }), user_id)
     
     return {"is_match": is_match, "swipe_id": swipe.id}
 
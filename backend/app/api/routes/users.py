@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
-from app.core.database import get_db, BlockedUser, Swipe, user_interests
+from app.core.database import get_db, BlockedUser, Swipe, Match, user_interests
 from app.models.user import User
 from app.api.routes.auth import get_current_user, UserResponse
+from app.api.routes.matches import deactivate_matches, reactivate_matches
 from pydantic import BaseModel
 from typing import List, Optional
 import json
@@ -146,6 +147,7 @@ async def delete_account(
 @router.post("/block")
 async def block_user(
     user_data: dict,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -171,11 +173,20 @@ async def block_user(
     db.add(new_block)
     db.commit()
     
+    # Blocking suspends any match between the two users; unblocking
+    # restores it (an explicit unmatch stays ended)
+    matches = _matches_between(db, current_user.id, user_id).filter(Match.is_active == True).all()
+    if matches:
+        for match in matches:
+            match.ended_by_block = True
+        await deactivate_matches(request, db, matches)
+    
     return {"message": "User blocked successfully"}
 
 @router.delete("/block/{user_id}")
 async def unblock_user(
     user_id: str,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -190,4 +201,23 @@ async def unblock_user(
     db.delete(blocked_user)
     db.commit()
     
-    return {"message": "User unblocked successfully"}
\ No newline at end of file
+    # Matches stay suspended while the other user still blocks this one
+    blocked_back = db.query(BlockedUser).filter(
+        BlockedUser.blocker_id == user_id,
+        BlockedUser.blocked_id == current_user.id
+    ).first()
+    if not blocked_back:
+        matches = _matches_between(db, current_user.id, user_id).filter(
+            Match.is_active == False,
+            Match.ended_by_block == True
+        ).all()
+        if matches:
+            await reactivate_matches(request, db, matches)
+    
+    return {"message": "User unblocked successfully"}
+
+def _matches_between(db: Session, user_id: str, other_user_id: str):
+    return db.query(Match).filter(
+        ((Match.user1_id == user_id) & (Match.user2_id == other_user_id)) |
+        ((Match.user1_id == other_user_id) & (Match.user2_id == user_id))
+    )
\ No newline at end of file
@@ -31,11 +31,55 @@ class Settings(BaseSettings):
     MAX_DISTANCE_KM: float = 50.0
     DEFAULT_LATITUDE: float = 28.6139
     DEFAULT_LONGITUDE: float = 77.2090
+    GEOCODER_MAX_DISTANCE_KM: float = 100.0  # coordinates further from any gazetteer place get no label
+    GEOCODER_CACHE_SIZE: int = 100000  # memoized ~5 km lookup cells
     
     # Rate Limiting
     RATE_LIMIT_PER_MINUTE: int = 60
     SWIPE_LIMIT_PER_DAY: int = 100
     
+    # Chat
+    UNREAD_COUNTER_TTL_SECONDS: int = 604800  # 7 days
+    INBOX_CACHE_TTL_SECONDS: int = 604800  # 7 days
+    MAX_MESSAGE_LENGTH: int = 5000
+    MESSAGE_BATCH_WINDOW_MS: int = 5
+    MESSAGE_BATCH_MAX_SIZE: int = 200
+    WS_SEND_QUEUE_SIZE: int = 256  # outbound frames buffered per socket
+    WS_SEND_OVERFLOW_POLICY: str = "drop_oldest"  # drop_oldest, drop_newest or disconnect
+    WS_PING_INTERVAL_SECONDS: int = 25  # ping sockets quiet for this long
+    WS_IDLE_TIMEOUT_SECONDS: int = 75  # reap sockets silent for this long
+    WS_REPLAY_BUFFER_SIZE: int = 1000  # events kept per user for resuming clients
+    WS_REPLAY_TTL_SECONDS: int = 86400
+    WS_REQUIRE_TOKEN: bool = False  # turn on once app versions connecting without ?token= are retired
+    TYPING_THROTTLE_MS: int = 500  # at most one typing indicator per sender per match in this window
+    TYPING_TIMEOUT_MS: int = 5000  # automatic 'stopped typing' after this long without a keystroke
+    PARTICIPANT_CACHE_SIZE: int = 100000  # match_id -> participants for websocket routing
+    PARTICIPANT_NEGATIVE_TTL_SECONDS: int = 10  # how long an unknown or inactive match_id is remembered
+    ACTIVITY_WINDOW_HOURS: int = 72  # decay time constant of the 'active' match sort
+    ARCHIVE_IDLE_DAYS: int = 90
+    ARCHIVE_BATCH_SIZE: int = 500
+    ARCHIVE_INTERVAL_MINUTES: int = 60  # 0 disables the background archiver
+    
+    # Games
+    GAME_ROOM_STORE: str = "redis"  # redis (shared by workers) or memory (single process)
+    GAME_ROOM_TTL_SECONDS: int = 3600  # rooms expire after this long without activity
+    GAME_ROOM_MAX_PLAYERS: int = 4
+    GAME_PLAYER_GRACE_SECONDS: int = 60  # disconnected players are evicted after this long
+    GAME_ROOM_IDLE_SECONDS: int = 1800  # rooms with no activity for this long are deleted
+    GAME_ROOM_SWEEP_INTERVAL_SECONDS: int = 30
+    GAME_ROOM_ACTOR_IDLE_SECONDS: int = 60  # a room's actor exits after this long without commands
+    GAME_QUICK_MATCH_INTERVAL_MS: int = 250  # matchmaking scheduler tick
+    GAME_QUICK_MATCH_MAX_WAIT_SECONDS: int = 10  # then start a room with fewer than GAME_ROOM_MAX_PLAYERS
+    GAME_QUICK_MATCH_TIMEOUT_SECONDS: int = 120  # drop users still unmatched after this long
+    
+    # Calls
+    SIGNALING_COALESCE_MS: int = 10  # ICE candidates sent within this window go out as one frame
+    SIGNALING_SESSION_IDLE_SECONDS: int = 7200  # forget call sessions with no signaling for this long
+    CALL_RING_TIMEOUT_SECONDS: int = 60  # unanswered calls are recorded as missed after this long
+    CALL_MAX_DURATION_SECONDS: int = 14400  # answered calls never hung up are closed after this long
+    CALL_HISTORY_FLUSH_INTERVAL_SECONDS: int = 2
+    CALL_HISTORY_BATCH_SIZE: int = 500
+    
     # Email (Optional)
     SMTP_HOST: str = ""
     SMTP_PORT: int = 587
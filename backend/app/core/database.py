@@ -1,7 +1,8 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey, Table
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey, Table, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
+import math
 import uuid
 
 from app.core.config import settings
@@ -68,23 +69,74 @@ class Swipe(Base):
     is_super_like = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+ACTIVITY_EPOCH = datetime(2024, 1, 1)
+
 class Match(Base):
     __tablename__ = "matches"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # One pair per sort order of the sorted match list, for each side of the match
+        Index('ix_matches_user1_last_message', 'user1_id', 'last_message_at'),
+        Index('ix_matches_user2_last_message', 'user2_id', 'last_message_at'),
+        Index('ix_matches_user1_created', 'user1_id', 'created_at'),
+        Index('ix_matches_user2_created', 'user2_id', 'created_at'),
+        Index('ix_matches_user1_activity', 'user1_id', 'activity_score'),
+        Index('ix_matches_user2_activity', 'user2_id', 'activity_score'),
+        Index('ix_matches_user1_super', 'user1_id', 'is_super_like', 'created_at'),
+        Index('ix_matches_user2_super', 'user2_id', 'is_super_like', 'created_at'),
+        {'extend_existing': True}
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     user1_id = Column(String, ForeignKey("users.id"), nullable=False)
     user2_id = Column(String, ForeignKey("users.id"), nullable=False)
     is_active = Column(Boolean, default=True)
+    ended_by_block = Column(Boolean, default=False, nullable=False)  # inactive only because of a block; unblocking restores it
     created_at = Column(DateTime, default=datetime.utcnow)
     last_message_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Sequence of the newest message and how far each participant has read
+    last_seq = Column(Integer, default=0, nullable=False)
+    user1_read_seq = Column(Integer, default=0, nullable=False)
+    user2_read_seq = Column(Integer, default=0, nullable=False)
+    archived_seq = Column(Integer, default=0, nullable=False)  # messages up to here live in message_archive
+    
+    is_super_like = Column(Boolean, default=False, nullable=False)  # either swipe was a super like
+    activity_score = Column(Float, default=0.0, nullable=False)  # see record_activity
+    
+    def read_seq_for(self, user_id):
+        return (self.user1_read_seq if user_id == self.user1_id else self.user2_read_seq) or 0
+    
+    def mark_read(self, user_id, seq):
+        """Advance a participant's read watermark; it never moves backwards"""
+        if user_id == self.user1_id:
+            self.user1_read_seq = max(self.user1_read_seq or 0, seq)
+        elif user_id == self.user2_id:
+            self.user2_read_seq = max(self.user2_read_seq or 0, seq)
+    
+    def record_activity(self, at):
+        """Fold one message at time ``at`` into the activity score.
+        
+        The score is log(sum(exp(t / window))) over the match's message times,
+        t measured from ACTIVITY_EPOCH. The message count decayed with an
+        ACTIVITY_WINDOW_HOURS time constant is exp(score - now / window), so
+        ordering by the stored score is ordering by recent activity at any
+        moment, without a job rewriting scores as they decay.
+        """
+        x = (at - ACTIVITY_EPOCH).total_seconds() / (settings.ACTIVITY_WINDOW_HOURS * 3600)
+        score = self.activity_score or 0.0
+        high, low = max(score, x), min(score, x)
+        self.activity_score = high + math.log1p(math.exp(low - high))
 
 class Message(Base):
     __tablename__ = "messages"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        Index('ix_messages_match_seq', 'match_id', 'seq', unique=True),
+        {'extend_existing': True}
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     match_id = Column(String, ForeignKey("matches.id"), nullable=False)
+    seq = Column(Integer)  # per-match, assigned at insert
     sender_id = Column(String, ForeignKey("users.id"), nullable=False)
     content = Column(Text, nullable=False)
     message_type = Column(String(20), default="text")
@@ -92,6 +144,36 @@ class Message(Base):
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+def append_message(db, message: Message, match: "Match" = None) -> "Match":
+    """Give ``message`` the next seq of its match and add it to the session.
+    
+    The match row is locked (FOR UPDATE) so concurrent writers on any worker
+    never share a seq; pass ``match`` when the caller already holds that lock.
+    Every message write goes through here, since readers fetch by seq range.
+    """
+    if match is None:
+        match = db.query(Match).filter(Match.id == message.match_id).with_for_update().one()
+    match.last_seq = (match.last_seq or 0) + 1
+    message.seq = match.last_seq
+    db.add(message)
+    return match
+
+class MessageArchive(Base):
+    """A compressed run of consecutive messages from an idle conversation"""
+    __tablename__ = "message_archive"
+    __table_args__ = (
+        Index('ix_message_archive_match_seq', 'match_id', 'first_seq', unique=True),
+        {'extend_existing': True}
+    )
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    match_id = Column(String, ForeignKey("matches.id"), nullable=False)
+    first_seq = Column(Integer, nullable=False)
+    last_seq = Column(Integer, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)  # zlib-compressed JSON list of messages
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class Report(Base):
     __tablename__ = "reports"
     __table_args__ = {'extend_existing': True}
@@ -115,7 +197,11 @@ class BlockedUser(Base):
 
 class CallHistory(Base):
     __tablename__ = "call_history"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        Index('ix_call_history_caller_created', 'caller_id', 'created_at'),
+        Index('ix_call_history_callee_created', 'callee_id', 'created_at'),
+        {'extend_existing': True}
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     caller_id = Column(String, ForeignKey("users.id"), nullable=False)
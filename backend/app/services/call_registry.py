@@ -0,0 +1,412 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from redis.exceptions import RedisError
+from sqlalchemy.exc import OperationalError
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.ws_codec import Frame
+
+# Server-side call log.
+#
+# The signaling relay reports each call's lifecycle here: call-offer starts
+# a ringing call, call-answer marks it answered and call-end finishes it.
+# Calls never hung up are finished by a deadline instead: an unanswered
+# call after CALL_RING_TIMEOUT_SECONDS (both sides are sent a call-end with
+# reason "timeout"), an answered one after CALL_MAX_DURATION_SECONDS.
+#
+# Finishing decides the status: completed if the call was answered (with
+# its duration), declined if the callee hung up while it rang, otherwise
+# missed. The finished call is queued in Redis, and a loop on every worker
+# drains the queue into call_history CALL_HISTORY_BATCH_SIZE rows per
+# insert. Every step is a Lua script, so a call whose two sides are on
+# different workers is still recorded exactly once.
+#
+# A flush moves its batch to a claim list and deletes that only once the
+# rows are committed; if the database is unavailable the batch goes back to
+# the head of the queue, and a claim left behind by a worker that died
+# mid-flush is requeued after _CLAIM_STALE_SECONDS. Row ids derive from the
+# call, so rows written before such a retry are skipped the second time.
+# Rows the database rejects outright are parked in call:rejected rather
+# than retried forever.
+#
+#   call:session:{caller_id}:{call_id}  hash of a call in progress
+#   call:deadlines                      zset "{caller_id}:{call_id}" -> ring or duration deadline
+#   call:finished                       list of finished calls (call_history rows as JSON)
+#   call:claims                         zset claim list key -> time claimed
+#   call:claim:{uuid}                   list of finished calls one flush is writing
+#   call:rejected                       list of finished calls the database refused
+#   call:recorded:{caller_id}:{call_id} marker kept for a day after a call is finished
+#
+# POST /api/calls/history stays for older clients; it is ignored for a call
+# this registry has tracked.
+
+SESSION_KEY_PREFIX = "call:session:"
+DEADLINES_KEY = "call:deadlines"
+FINISHED_KEY = "call:finished"
+RECORDED_KEY_PREFIX = "call:recorded:"
+CLAIMS_KEY = "call:claims"
+CLAIM_KEY_PREFIX = "call:claim:"
+REJECTED_KEY = "call:rejected"
+
+_RECORDED_TTL_SECONDS = 86400
+# A claim this old belongs to a worker that died mid-flush
+_CLAIM_STALE_SECONDS = 300
+# Calls past their deadline finished per sweep; the rest wait for the next one
+_EXPIRE_BATCH = 500
+
+# call_history ids derive from the call, so a retried insert can't duplicate it
+_CALL_ID_NAMESPACE = uuid.UUID("5b0f1f9e-8a4b-4c55-9a53-6f0f7a0c2d1e")
+
+# Returns 1 if the call was started, 0 if it is already known
+_OFFER = """
+if redis.call('EXISTS', KEYS[1]) == 1 or redis.call('EXISTS', KEYS[3]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'call_id', ARGV[1], 'caller_id', ARGV[2], 'callee_id', ARGV[3],
+    'call_type', ARGV[4], 'started_at', ARGV[5])
+redis.call('EXPIRE', KEYS[1], ARGV[7])
+redis.call('ZADD', KEYS[2], tonumber(ARGV[5]) + tonumber(ARGV[6]), ARGV[2] .. ':' .. ARGV[1])
+return 1
+"""
+
+# Returns 1 if the callee answered a ringing call
+_ANSWER = """
+if redis.call('HGET', KEYS[1], 'callee_id') ~= ARGV[1] or redis.call('HEXISTS', KEYS[1], 'answered_at') == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'answered_at', ARGV[2])
+redis.call('ZADD', KEYS[2], tonumber(ARGV[2]) + tonumber(ARGV[3]), ARGV[4])
+return 1
+"""
+
+# Returns the finished call as JSON, or nil if there was no such call (or,
+# when finishing by deadline, the deadline has since moved)
+_FINISH = """
+local fields = redis.call('HGETALL', KEYS[1])
+if #fields == 0 then
+    redis.call('ZREM', KEYS[2], ARGV[3])
+    return nil
+end
+if ARGV[5] == '1' then
+    local deadline = redis.call('ZSCORE', KEYS[2], ARGV[3])
+    if deadline and tonumber(deadline) > tonumber(ARGV[2]) then
+        return nil
+    end
+end
+local call = {}
+for i = 1, #fields, 2 do
+    call[fields[i]] = fields[i + 1]
+end
+local status, duration = 'missed', 0
+if call['answered_at'] then
+    status = 'completed'
+    duration = math.min(math.floor(tonumber(ARGV[2]) - tonumber(call['answered_at'])), tonumber(ARGV[6]))
+elseif ARGV[1] == call['callee_id'] then
+    status = 'declined'
+end
+local finished = cjson.encode({
+    call_id = call['call_id'],
+    caller_id = call['caller_id'],
+    callee_id = call['callee_id'],
+    call_type = call['call_type'],
+    duration = math.max(duration, 0),
+    status = status,
+    started_at = tonumber(call['started_at']),
+    answered = call['answered_at'] ~= nil
+})
+redis.call('RPUSH', KEYS[3], finished)
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2], ARGV[3])
+redis.call('SET', KEYS[4], 1, 'EX', ARGV[4])
+return finished
+"""
+
+# Moves up to ARGV[1] finished calls to the claim list KEYS[2]; returns them
+_CLAIM = """
+local calls = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #calls == 0 then
+    return calls
+end
+redis.call('LTRIM', KEYS[1], #calls, -1)
+redis.call('RPUSH', KEYS[2], unpack(calls))
+redis.call('ZADD', KEYS[3], ARGV[2], KEYS[2])
+return calls
+"""
+
+# Puts a claim's calls back at the head of the queue, in order; returns how many
+_RELEASE = """
+local calls = redis.call('LRANGE', KEYS[1], 0, -1)
+for i = #calls, 1, -1 do
+    redis.call('LPUSH', KEYS[2], calls[i])
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[3], KEYS[1])
+return #calls
+"""
+
+def _insert_calls(rows: List[Dict[str, Any]]) -> Tuple[int, List[Dict[str, Any]]]:
+    """Insert call_history rows in one statement, falling back to one at a time.
+
+    Rows already present (or repeated) are skipped. Returns the rows written and the rows
+    the database rejected; raises OperationalError if it can't be reached.
+    """
+    from app.core.database import SessionLocal, CallHistory
+
+    db = SessionLocal()
+    try:
+        seen = {
+            row_id for (row_id,) in db.query(CallHistory.id).filter(CallHistory.id.in_([row["id"] for row in rows]))
+        }
+        unique = []
+        for row in rows:
+            if row["id"] not in seen:
+                seen.add(row["id"])
+                unique.append(row)
+        rows = unique
+        try:
+            db.bulk_insert_mappings(CallHistory, rows)
+            db.commit()
+            return len(rows), []
+        except OperationalError:
+            db.rollback()
+            raise
+        except Exception as e:
+            db.rollback()
+            print(f"Call history batch insert failed, retrying rows one by one: {e}")
+
+        written, rejected = 0, []
+        for row in rows:
+            try:
+                db.bulk_insert_mappings(CallHistory, [row])
+                db.commit()
+                written += 1
+            except OperationalError:
+                db.rollback()
+                raise
+            except Exception as e:
+                db.rollback()
+                print(f"Rejected call history row {row['id']}: {e}")
+                rejected.append(row)
+        return written, rejected
+    finally:
+        db.close()
+
+class CallRegistry:
+    def __init__(self, redis):
+        self.redis = redis
+        self._offer = redis.register_script(_OFFER)
+        self._answer = redis.register_script(_ANSWER)
+        self._finish = redis.register_script(_FINISH)
+        self._claim = redis.register_script(_CLAIM)
+        self._release = redis.register_script(_RELEASE)
+        self.metrics: Counter = Counter()
+
+    @staticmethod
+    def _member(caller_id: str, call_id: str) -> str:
+        return f"{caller_id}:{call_id}"
+
+    def _finish_keys(self, member: str) -> List[str]:
+        return [SESSION_KEY_PREFIX + member, DEADLINES_KEY, FINISHED_KEY, RECORDED_KEY_PREFIX + member]
+
+    async def offered(self, caller_id: str, callee_id: str, call_id: str, call_type: str):
+        member = self._member(caller_id, call_id)
+        try:
+            started = await self._offer(
+                keys=[SESSION_KEY_PREFIX + member, DEADLINES_KEY, RECORDED_KEY_PREFIX + member],
+                args=[
+                    call_id,
+                    caller_id,
+                    callee_id,
+                    call_type,
+                    time.time(),
+                    settings.CALL_RING_TIMEOUT_SECONDS,
+                    settings.CALL_RING_TIMEOUT_SECONDS + settings.CALL_MAX_DURATION_SECONDS
+                ]
+            )
+        except (RedisError, OSError) as e:
+            print(f"Call registry offer failed for {member}: {e}")
+            return
+        self.metrics["calls_started"] += started
+
+    async def answered(self, caller_id: str, callee_id: str, call_id: str):
+        member = self._member(caller_id, call_id)
+        try:
+            await self._answer(
+                keys=[SESSION_KEY_PREFIX + member, DEADLINES_KEY],
+                args=[callee_id, time.time(), settings.CALL_MAX_DURATION_SECONDS, member]
+            )
+        except (RedisError, OSError) as e:
+            print(f"Call registry answer failed for {member}: {e}")
+
+    async def ended(self, user_id: str, peer_id: Optional[str], call_id: str):
+        """Finish the call ``user_id`` hung up, whichever side of it they are on"""
+        for caller_id in (user_id, peer_id):
+            if caller_id and await self._finish_call(self._member(caller_id, call_id), user_id, by_deadline=False):
+                return
+
+    async def _finish_call(self, member: str, ended_by: str, by_deadline: bool) -> Optional[Dict[str, Any]]:
+        try:
+            finished = await self._finish(
+                keys=self._finish_keys(member),
+                args=[
+                    ended_by,
+                    time.time(),
+                    member,
+                    _RECORDED_TTL_SECONDS,
+                    1 if by_deadline else 0,
+                    settings.CALL_MAX_DURATION_SECONDS
+                ]
+            )
+        except (RedisError, OSError) as e:
+            print(f"Call registry finish failed for {member}: {e}")
+            return None
+        if finished is None:
+            return None
+        self.metrics["calls_finished"] += 1
+        return json.loads(finished)
+
+    async def expire(self) -> List[Dict[str, Any]]:
+        """Finish calls past their deadline; returns them"""
+        try:
+            due = await self.redis.zrangebyscore(DEADLINES_KEY, "-inf", time.time(), start=0, num=_EXPIRE_BATCH)
+        except (RedisError, OSError) as e:
+            print(f"Call registry sweep failed: {e}")
+            return []
+
+        expired = []
+        for member in due:
+            member = member.decode() if isinstance(member, bytes) else member
+            finished = await self._finish_call(member, "", by_deadline=True)
+            if finished:
+                expired.append(finished)
+        self.metrics["calls_timed_out"] += len(expired)
+        return expired
+
+    async def tracked(self, user_id: str, other_user_id: str, call_id: str) -> bool:
+        """Whether this call is (or was) recorded here, with either user as the caller"""
+        keys = []
+        for caller_id in (user_id, other_user_id):
+            member = self._member(caller_id, call_id)
+            keys.extend([SESSION_KEY_PREFIX + member, RECORDED_KEY_PREFIX + member])
+        try:
+            return await self.redis.exists(*keys) > 0
+        except (RedisError, OSError) as e:
+            print(f"Call registry lookup failed for {call_id}: {e}")
+            return False
+
+    async def record(self, call: Dict[str, Any]):
+        """Queue a call reported by a client; written straight to the database if Redis is down"""
+        try:
+            await self.redis.rpush(FINISHED_KEY, json.dumps(call))
+        except (RedisError, OSError) as e:
+            print(f"Call registry queue failed, writing call directly: {e}")
+            await asyncio.to_thread(_insert_calls, [self._row(call)])
+
+    @staticmethod
+    def _row(call: Dict[str, Any]) -> Dict[str, Any]:
+        if call.get("call_id"):
+            row_id = str(uuid.uuid5(_CALL_ID_NAMESPACE, f"{call['caller_id']}:{call['call_id']}"))
+        else:
+            # started_at (to the microsecond) tells apart reports of the same pair
+            row_id = str(uuid.uuid5(_CALL_ID_NAMESPACE, json.dumps(call, sort_keys=True)))
+        return {
+            "id": row_id,
+            "caller_id": call["caller_id"],
+            "callee_id": call["callee_id"],
+            "call_type": call["call_type"],
+            "duration": call["duration"],
+            "status": call["status"],
+            "created_at": datetime.utcfromtimestamp(call["started_at"])
+        }
+
+    async def flush(self) -> int:
+        """Write up to one batch of finished calls to call_history; returns the batch size"""
+        claim = CLAIM_KEY_PREFIX + str(uuid.uuid4())
+        try:
+            await self._requeue_stale_claims()
+            batch = await self._claim(
+                keys=[FINISHED_KEY, claim, CLAIMS_KEY],
+                args=[settings.CALL_HISTORY_BATCH_SIZE, time.time()]
+            )
+        except (RedisError, OSError) as e:
+            print(f"Call history flush failed: {e}")
+            return 0
+        if not batch:
+            return 0
+
+        rows, queued = [], {}
+        for call in batch:
+            row = self._row(json.loads(call))
+            rows.append(row)
+            queued[row["id"]] = call
+        try:
+            written, rejected = await asyncio.to_thread(_insert_calls, rows)
+        except Exception as e:
+            print(f"Call history flush failed, requeueing {len(batch)} calls: {e}")
+            await self._requeue(claim)
+            return 0
+
+        self.metrics["calls_persisted"] += written
+        self.metrics["calls_rejected"] += len(rejected)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                if rejected:
+                    pipe.rpush(REJECTED_KEY, *(queued[row["id"]] for row in rejected))
+                pipe.delete(claim)
+                pipe.zrem(CLAIMS_KEY, claim)
+                await pipe.execute()
+        except (RedisError, OSError) as e:
+            # The claim is requeued once stale; its rows are skipped then
+            print(f"Call history claim cleanup failed for {claim}: {e}")
+        return len(batch)
+
+    async def _requeue(self, claim: str):
+        try:
+            self.metrics["calls_requeued"] += await self._release(keys=[claim, FINISHED_KEY, CLAIMS_KEY])
+        except (RedisError, OSError) as e:
+            print(f"Call history requeue failed for {claim}: {e}")
+
+    async def _requeue_stale_claims(self):
+        """Put back batches claimed by a worker that died before finishing them"""
+        for claim in await self.redis.zrangebyscore(CLAIMS_KEY, "-inf", time.time() - _CLAIM_STALE_SECONDS):
+            await self._requeue(claim.decode() if isinstance(claim, bytes) else claim)
+
+    async def stats(self) -> dict:
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zcard(DEADLINES_KEY)
+                pipe.llen(FINISHED_KEY)
+                pipe.llen(REJECTED_KEY)
+                active, queued, rejected = await pipe.execute()
+        except (RedisError, OSError) as e:
+            print(f"Call registry stats failed: {e}")
+            active = queued = rejected = None
+        return {"calls_active": active, "calls_unpersisted": queued, "calls_unwritable": rejected, **self.metrics}
+
+async def persist_calls_periodically(registry: CallRegistry, connection_manager):
+    """Background loop started from the app lifespan"""
+    while True:
+        await asyncio.sleep(settings.CALL_HISTORY_FLUSH_INTERVAL_SECONDS)
+        try:
+            for call in await registry.expire():
+                if call["answered"]:
+                    continue
+                # Stop both phones ringing
+                for sender_id, recipient_id in ((call["caller_id"], call["callee_id"]), (call["callee_id"], call["caller_id"])):
+                    await connection_manager.send_personal_message(
+                        Frame(
+                            "signaling",
+                            {"from": sender_id},
+                            data={"type": "call-end", "callId": call["call_id"], "reason": "timeout"}
+                        ),
+                        recipient_id
+                    )
+            while await registry.flush() >= settings.CALL_HISTORY_BATCH_SIZE:
+                pass
+        except Exception as e:
+            print(f"Call history persistence error: {e}")
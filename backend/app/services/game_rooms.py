@@ -0,0 +1,771 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, OrderedDict
+from redis.exceptions import RedisError
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+
+# Game room storage.
+#
+# A room is a dict: id, creator_id, players (list of player dicts in join
+# order), state, current_question, selected_player, round, created_at and
+# version. Rooms expire GAME_ROOM_TTL_SECONDS after their last activity;
+# joins, leaves, state updates and relayed game frames all count as activity.
+#
+# version goes up by one with every change to the room: joins, leaves,
+# presence changes and state updates. State updates can be made conditional
+# on the version the client last saw (compare-and-set), and each change is
+# broadcast to the room as a game_delta frame carrying only the changed
+# fields and the new version. A client that sees a gap in versions (a delta
+# it missed, or an eviction by the sweep, which isn't broadcast) reloads
+# the room's snapshot.
+#
+# GAME_ROOM_STORE picks the implementation:
+#
+#   redis   one hash per room, game:room:{room_id}, each field a JSON value.
+#           Shared by every worker and survives restarts. Join and leave
+#           are Lua scripts, so the player cap holds under concurrent joins
+#           from any worker.
+#   memory  a dict in this worker, for single-process deployments and
+#           local development without Redis.
+#
+# Lifecycle: when a player's last socket on a worker closes they are marked
+# disconnected in each of their rooms, and reconnecting (or rejoining)
+# within GAME_PLAYER_GRACE_SECONDS restores them. A periodic sweep evicts
+# players disconnected for longer, which deletes rooms left empty, and
+# deletes rooms idle for GAME_ROOM_IDLE_SECONDS. In Redis the bookkeeping
+# is kept in:
+#
+#   game:rooms                 zset room_id -> last activity (epoch seconds)
+#   game:player-rooms:{uid}    set of the rooms a user is in; its TTL is
+#                              refreshed with each of those rooms' TTL, so
+#                              it outlives every room it lists
+#   game:disconnected          zset "{room_id}:{user_id}" -> disconnected at
+#
+# The store also holds the quick-match queue (see quick_match.py): users
+# waiting for a room with their tickets, oldest first, and the lease that
+# picks which worker runs the matchmaking scheduler.
+#
+#   game:quick-match:queue     zset user_id -> enqueued at
+#   game:quick-match:tickets   hash user_id -> ticket JSON
+#   game:quick-match:scheduler worker id holding the scheduler lease
+
+ROOM_KEY_PREFIX = "game:room:"
+ROOMS_KEY = "game:rooms"
+PLAYER_ROOMS_PREFIX = "game:player-rooms:"
+DISCONNECTED_KEY = "game:disconnected"
+QUEUE_KEY = "game:quick-match:queue"
+TICKETS_KEY = "game:quick-match:tickets"
+SCHEDULER_KEY = "game:quick-match:scheduler"
+
+# (new version, players) after a change, for broadcasting it to the room
+RoomChange = Tuple[int, List[Dict[str, Any]]]
+
+# Rooms sampled to estimate the stored size of all rooms
+_SIZE_SAMPLE = 20
+# Evictions and deletions handled per sweep; the rest wait for the next one
+_SWEEP_BATCH = 500
+
+# Prepended to scripts that refresh a room's TTL, to refresh its players'
+# room indexes (PLAYER_ROOMS_PREFIX .. id) along with it
+_REFRESH_PLAYER_ROOMS = """
+local function refresh_player_rooms(players, prefix, ttl)
+    for _, player in ipairs(players) do
+        redis.call('EXPIRE', prefix .. player['id'], ttl)
+    end
+end
+"""
+
+# Returns {status, room fields...}; status is joined, rejoined (was disconnected),
+# present, full or missing
+_JOIN = _REFRESH_PLAYER_ROOMS + """
+local players_json = redis.call('HGET', KEYS[1], 'players')
+if not players_json then
+    return {'missing'}
+end
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('ZADD', KEYS[3], ARGV[5], ARGV[6])
+local players = cjson.decode(players_json)
+refresh_player_rooms(players, ARGV[7], ARGV[4])
+for _, player in ipairs(players) do
+    if player['id'] == ARGV[1] then
+        if player['is_connected'] ~= true then
+            player['is_connected'] = true
+            redis.call('HSET', KEYS[1], 'players', cjson.encode(players))
+            redis.call('HINCRBY', KEYS[1], 'version', 1)
+            redis.call('ZREM', KEYS[4], ARGV[6] .. ':' .. ARGV[1])
+            return {'rejoined', redis.call('HGETALL', KEYS[1])}
+        end
+        return {'present', redis.call('HGETALL', KEYS[1])}
+    end
+end
+if #players >= tonumber(ARGV[3]) then
+    return {'full', redis.call('HGETALL', KEYS[1])}
+end
+table.insert(players, cjson.decode(ARGV[2]))
+redis.call('HSET', KEYS[1], 'players', cjson.encode(players))
+redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('SADD', KEYS[2], ARGV[6])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return {'joined', redis.call('HGETALL', KEYS[1])}
+"""
+
+# The room's fields, refreshing its TTL; empty if it's gone
+_GET = _REFRESH_PLAYER_ROOMS + """
+local players_json = redis.call('HGET', KEYS[1], 'players')
+if not players_json then
+    return {}
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('ZADD', KEYS[2], 'XX', ARGV[2], ARGV[3])
+refresh_player_rooms(cjson.decode(players_json), ARGV[4], ARGV[1])
+return redis.call('HGETALL', KEYS[1])
+"""
+
+# Returns {status, version, players}; status is left, deleted (the last
+# player left), missing, or connected when an eviction finds the player has
+# come back. version and players are only returned with left.
+_LEAVE = _REFRESH_PLAYER_ROOMS + """
+local member = ARGV[4] .. ':' .. ARGV[1]
+local players_json = redis.call('HGET', KEYS[1], 'players')
+if not players_json then
+    redis.call('SREM', KEYS[2], ARGV[4])
+    redis.call('ZREM', KEYS[3], ARGV[4])
+    redis.call('ZREM', KEYS[4], member)
+    return {'missing'}
+end
+if ARGV[5] == '1' and not redis.call('ZSCORE', KEYS[4], member) then
+    return {'connected'}
+end
+local remaining = {}
+for _, player in ipairs(cjson.decode(players_json)) do
+    if player['id'] ~= ARGV[1] then
+        table.insert(remaining, player)
+    end
+end
+redis.call('SREM', KEYS[2], ARGV[4])
+redis.call('ZREM', KEYS[4], member)
+if #remaining == 0 then
+    redis.call('DEL', KEYS[1])
+    redis.call('ZREM', KEYS[3], ARGV[4])
+    return {'deleted'}
+end
+players_json = cjson.encode(remaining)
+redis.call('HSET', KEYS[1], 'players', players_json)
+local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+refresh_player_rooms(remaining, ARGV[6], ARGV[2])
+if ARGV[5] ~= '1' then
+    redis.call('ZADD', KEYS[3], ARGV[3], ARGV[4])
+end
+return {'left', version, players_json}
+"""
+
+# Set fields on an existing room, if its version is still ARGV[4] (when
+# given; fields start at ARGV[6]). Returns {status, version, players};
+# status is ok, conflict (with the current version) or missing.
+_UPDATE = _REFRESH_PLAYER_ROOMS + """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {'missing'}
+end
+local version = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+if ARGV[4] ~= '' and tonumber(ARGV[4]) ~= version then
+    return {'conflict', version}
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 6))
+version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[3])
+local players_json = redis.call('HGET', KEYS[1], 'players')
+refresh_player_rooms(cjson.decode(players_json), ARGV[5], ARGV[1])
+return {'ok', version, players_json}
+"""
+
+# Player list of a room, refreshing its TTL; nil if the room is gone
+_PLAYERS = _REFRESH_PLAYER_ROOMS + """
+local players_json = redis.call('HGET', KEYS[1], 'players')
+if players_json then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+    redis.call('ZADD', KEYS[2], ARGV[2], ARGV[3])
+    refresh_player_rooms(cjson.decode(players_json), ARGV[4], ARGV[1])
+end
+return players_json
+"""
+
+# Mark a player (dis)connected. Returns {1, version, players} if that changed
+# the room, {1} if not, {0} if they're not in the room, {-1} if it's gone.
+_SET_CONNECTED = """
+local players_json = redis.call('HGET', KEYS[1], 'players')
+if not players_json then
+    return {-1}
+end
+local connected = ARGV[2] == '1'
+local players = cjson.decode(players_json)
+for _, player in ipairs(players) do
+    if player['id'] == ARGV[1] then
+        if (player['is_connected'] == true) ~= connected then
+            player['is_connected'] = connected
+            players_json = cjson.encode(players)
+            redis.call('HSET', KEYS[1], 'players', players_json)
+            if connected then
+                redis.call('ZREM', KEYS[2], ARGV[4] .. ':' .. ARGV[1])
+            else
+                redis.call('ZADD', KEYS[2], ARGV[3], ARGV[4] .. ':' .. ARGV[1])
+            end
+            return {1, redis.call('HINCRBY', KEYS[1], 'version', 1), players_json}
+        end
+        return {1}
+    end
+end
+return {0}
+"""
+
+# Delete a room unless it saw activity after the cutoff; returns 1 if deleted
+_DELETE_IDLE = """
+local last_active = redis.call('ZSCORE', KEYS[2], ARGV[1])
+if last_active and tonumber(last_active) > tonumber(ARGV[2]) then
+    return 0
+end
+local players_json = redis.call('HGET', KEYS[1], 'players')
+if players_json then
+    for _, player in ipairs(cjson.decode(players_json)) do
+        redis.call('SREM', ARGV[3] .. player['id'], ARGV[1])
+        redis.call('ZREM', KEYS[3], ARGV[1] .. ':' .. player['id'])
+    end
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+return 1
+"""
+
+# Remove users from the queue; returns the ones that were still queued
+_DEQUEUE = """
+local claimed = {}
+for _, user_id in ipairs(ARGV) do
+    if redis.call('ZREM', KEYS[1], user_id) == 1 then
+        redis.call('HDEL', KEYS[2], user_id)
+        table.insert(claimed, user_id)
+    end
+end
+return claimed
+"""
+
+# Take or renew a lease; returns 1 if ARGV[1] holds it
+_ACQUIRE_LEASE = """
+local owner = redis.call('GET', KEYS[1])
+if not owner or owner == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+class GameRoomError(Exception):
+    """Raised when a room operation can't be carried out"""
+
+    def __init__(self, detail: str, status_code: int = 400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+def new_room(room_id: str, creator: Dict[str, Any], created_at: str) -> Dict[str, Any]:
+    return {
+        "id": room_id,
+        "creator_id": creator["id"],
+        "players": [creator],
+        "state": "waiting",
+        "current_question": None,
+        "selected_player": None,
+        "round": 1,
+        "created_at": created_at,
+        "version": 1
+    }
+
+def snapshot(room: Dict[str, Any]) -> Dict[str, Any]:
+    """Compact view of a room for late joiners: its current fields and version, without nulls"""
+    return {
+        field: value for field, value in room.items()
+        if value is not None and field not in ("creator_id", "created_at")
+    }
+
+class MemoryGameRoomStore:
+    """Rooms in this worker's memory; every operation completes without yielding, so each is atomic"""
+
+    def __init__(self):
+        self._rooms: Dict[str, Dict[str, Any]] = {}
+        # Monotonic timestamps
+        self._last_active: Dict[str, float] = {}
+        self._disconnected: Dict[Tuple[str, str], float] = {}
+        self._player_rooms: Dict[str, Set[str]] = {}
+        # user_id -> (ticket, enqueued at), oldest first
+        self._queue: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self.metrics: Counter = Counter()
+
+    def _live(self, room_id: str, touch: bool = True) -> Optional[Dict[str, Any]]:
+        room = self._rooms.get(room_id)
+        if room is None:
+            return None
+        now = time.monotonic()
+        if self._last_active[room_id] + settings.GAME_ROOM_TTL_SECONDS <= now:
+            self._delete(room_id)
+            return None
+        if touch:
+            self._last_active[room_id] = now
+        return room
+
+    def _delete(self, room_id: str):
+        room = self._rooms.pop(room_id, None)
+        self._last_active.pop(room_id, None)
+        for player in room["players"] if room else []:
+            self._forget_player(room_id, player["id"])
+
+    def _forget_player(self, room_id: str, user_id: str):
+        self._disconnected.pop((room_id, user_id), None)
+        rooms = self._player_rooms.get(user_id)
+        if rooms is not None:
+            rooms.discard(room_id)
+            if not rooms:
+                del self._player_rooms[user_id]
+
+    async def create(self, room: Dict[str, Any]):
+        self._rooms[room["id"]] = room
+        self._last_active[room["id"]] = time.monotonic()
+        for player in room["players"]:
+            self._player_rooms.setdefault(player["id"], set()).add(room["id"])
+
+    async def get(self, room_id: str) -> Optional[Dict[str, Any]]:
+        room = self._live(room_id)
+        return json.loads(json.dumps(room)) if room else None
+
+    async def join(self, room_id: str, player: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """Add a player (rejoining restores a disconnected one); returns the room and whether it changed"""
+        room = self._live(room_id)
+        if room is None:
+            raise GameRoomError("Room not found", 404)
+        current = next((p for p in room["players"] if p["id"] == player["id"]), None)
+        if current is not None:
+            if current.get("is_connected"):
+                return json.loads(json.dumps(room)), False
+            current["is_connected"] = True
+            self._disconnected.pop((room_id, player["id"]), None)
+        elif len(room["players"]) >= settings.GAME_ROOM_MAX_PLAYERS:
+            raise GameRoomError("Room is full")
+        else:
+            room["players"].append(player)
+            self._player_rooms.setdefault(player["id"], set()).add(room_id)
+        room["version"] = room.get("version", 0) + 1
+        return json.loads(json.dumps(room)), True
+
+    async def leave(self, room_id: str, user_id: str) -> Optional[RoomChange]:
+        """Remove a player; the room is deleted with its last player, otherwise returns the change"""
+        room = self._live(room_id)
+        if self._remove_player(room_id, user_id, touch=True) != "left":
+            return None
+        return room["version"], json.loads(json.dumps(room["players"]))
+
+    def _remove_player(self, room_id: str, user_id: str, touch: bool) -> Optional[str]:
+        room = self._live(room_id, touch)
+        if room is None:
+            self._forget_player(room_id, user_id)
+            return None
+        room["players"] = [p for p in room["players"] if p["id"] != user_id]
+        self._forget_player(room_id, user_id)
+        if not room["players"]:
+            self._delete(room_id)
+            return "deleted"
+        room["version"] = room.get("version", 0) + 1
+        return "left"
+
+    async def update(
+        self,
+        room_id: str,
+        fields: Dict[str, Any],
+        expected_version: Optional[int] = None
+    ) -> RoomChange:
+        """Set fields, if the room is still at ``expected_version`` when given"""
+        room = self._live(room_id)
+        if room is None:
+            raise GameRoomError("Room not found", 404)
+        if expected_version is not None and expected_version != room.get("version", 0):
+            raise GameRoomError("Room has changed since that version; reload it", 409)
+        room.update(fields)
+        room["version"] = room.get("version", 0) + 1
+        return room["version"], json.loads(json.dumps(room["players"]))
+
+    async def player_ids(self, room_id: str) -> List[str]:
+        room = self._live(room_id)
+        return [p["id"] for p in room["players"]] if room else []
+
+    async def rooms_for(self, user_id: str) -> List[str]:
+        return [room_id for room_id in list(self._player_rooms.get(user_id, ())) if self._live(room_id, touch=False)]
+
+    async def enqueue(self, user_id: str, ticket: Dict[str, Any]) -> bool:
+        """Queue a user for quick match; False if already queued"""
+        if user_id in self._queue:
+            return False
+        self._queue[user_id] = (ticket, time.time())
+        return True
+
+    async def dequeue(self, user_ids: List[str]) -> List[str]:
+        return [user_id for user_id in user_ids if self._queue.pop(user_id, None) is not None]
+
+    async def is_queued(self, user_id: str) -> bool:
+        return user_id in self._queue
+
+    async def queued(self, limit: int) -> List[Tuple[str, Dict[str, Any], float]]:
+        """The longest-waiting users as (user_id, ticket, enqueued at)"""
+        return [
+            (user_id, ticket, enqueued_at)
+            for user_id, (ticket, enqueued_at) in itertools.islice(self._queue.items(), limit)
+        ]
+
+    async def acquire_scheduler(self, owner: str, ttl_ms: int) -> bool:
+        # Only this worker sees this store
+        return True
+
+    async def mark_user(self, user_id: str, connected: bool) -> List[Tuple[str, RoomChange]]:
+        """Mark a user connected or disconnected in every room they're in; returns the rooms that changed"""
+        now = time.monotonic()
+        changes = []
+        for room_id in list(self._player_rooms.get(user_id, ())):
+            room = self._live(room_id, touch=False)
+            player = next((p for p in room["players"] if p["id"] == user_id), None) if room else None
+            if player is None:
+                self._forget_player(room_id, user_id)
+                continue
+            if player.get("is_connected") != connected:
+                player["is_connected"] = connected
+                if connected:
+                    self._disconnected.pop((room_id, user_id), None)
+                else:
+                    self._disconnected[(room_id, user_id)] = now
+                room["version"] = room.get("version", 0) + 1
+                changes.append((room_id, (room["version"], json.loads(json.dumps(room["players"])))))
+        return changes
+
+    async def sweep(self) -> Tuple[int, int]:
+        """Evict players past the grace period and delete idle rooms; returns (evicted, rooms deleted)"""
+        now = time.monotonic()
+        evicted = deleted = 0
+        grace_cutoff = now - settings.GAME_PLAYER_GRACE_SECONDS
+        expired = [key for key, at in self._disconnected.items() if at <= grace_cutoff]
+        for room_id, user_id in expired[:_SWEEP_BATCH]:
+            status = self._remove_player(room_id, user_id, touch=False)
+            if status:
+                evicted += 1
+                deleted += status == "deleted"
+
+        idle_cutoff = now - settings.GAME_ROOM_IDLE_SECONDS
+        idle = [room_id for room_id, at in self._last_active.items() if at <= idle_cutoff]
+        for room_id in idle[:_SWEEP_BATCH]:
+            self._delete(room_id)
+            deleted += 1
+
+        self.metrics["players_evicted"] += evicted
+        self.metrics["rooms_deleted"] += deleted
+        return evicted, deleted
+
+    async def stats(self) -> dict:
+        sample = [json.dumps(room) for room in itertools.islice(self._rooms.values(), _SIZE_SAMPLE)]
+        average = sum(map(len, sample)) / len(sample) if sample else 0
+        return {
+            "rooms": len(self._rooms),
+            "players_disconnected": len(self._disconnected),
+            "room_bytes_estimate": int(average * len(self._rooms)),
+            "quick_match_queued": len(self._queue),
+            **self.metrics
+        }
+
+class RedisGameRoomStore:
+    """Rooms as Redis hashes shared by all workers; Redis errors surface as 503s"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self._join = redis.register_script(_JOIN)
+        self._get = redis.register_script(_GET)
+        self._leave = redis.register_script(_LEAVE)
+        self._update = redis.register_script(_UPDATE)
+        self._players = redis.register_script(_PLAYERS)
+        self._set_connected = redis.register_script(_SET_CONNECTED)
+        self._delete_idle = redis.register_script(_DELETE_IDLE)
+        self._dequeue = redis.register_script(_DEQUEUE)
+        self._acquire_lease = redis.register_script(_ACQUIRE_LEASE)
+        self.metrics: Counter = Counter()
+
+    @staticmethod
+    def _key(room_id: str) -> str:
+        return f"{ROOM_KEY_PREFIX}{room_id}"
+
+    @staticmethod
+    def _player_rooms_key(user_id: str) -> str:
+        return f"{PLAYER_ROOMS_PREFIX}{user_id}"
+
+    @staticmethod
+    def _decode(fields) -> Dict[str, Any]:
+        """A room from HGETALL output, either a dict or a flat [field, value, ...] list"""
+        if isinstance(fields, list):
+            fields = dict(zip(fields[0::2], fields[1::2]))
+        room = {}
+        for field, value in fields.items():
+            field = field.decode() if isinstance(field, bytes) else field
+            room[field] = json.loads(value)
+        return room
+
+    async def create(self, room: Dict[str, Any]):
+        key = self._key(room["id"])
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(key, mapping={field: json.dumps(value) for field, value in room.items()})
+                pipe.expire(key, settings.GAME_ROOM_TTL_SECONDS)
+                pipe.zadd(ROOMS_KEY, {room["id"]: time.time()})
+                for player in room["players"]:
+                    pipe.sadd(self._player_rooms_key(player["id"]), room["id"])
+                    pipe.expire(self._player_rooms_key(player["id"]), settings.GAME_ROOM_TTL_SECONDS)
+                await pipe.execute()
+        except (RedisError, OSError) as e:
+            print(f"Game room create failed for {room['id']}: {e}")
+            raise GameRoomError("Game rooms are unavailable", 503)
+
+    async def get(self, room_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            fields = await self._get(
+                keys=[self._key(room_id), ROOMS_KEY],
+                args=[settings.GAME_ROOM_TTL_SECONDS, time.time(), room_id, PLAYER_ROOMS_PREFIX]
+            )
+        except (RedisError, OSError) as e:
+            print(f"Game room read failed for {room_id}: {e}")
+            raise GameRoomError("Game rooms are unavailable", 503)
+        return self._decode(fields) if fields else None
+
+    async def join(self, room_id: str, player: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """Add a player (rejoining restores a disconnected one); returns the room and whether it changed"""
+        try:
+            result = await self._join(
+                keys=[self._key(room_id), self._player_rooms_key(player["id"]), ROOMS_KEY, DISCONNECTED_KEY],
+                args=[
+                    player["id"],
+                    json.dumps(player),
+                    settings.GAME_ROOM_MAX_PLAYERS,
+                    settings.GAME_ROOM_TTL_SECONDS,
+                    time.time(),
+                    room_id,
+                    PLAYER_ROOMS_PREFIX
+                ]
+            )
+        except (RedisError, OSError) as e:
+            print(f"Game room join failed for {room_id}: {e}")
+            raise GameRoomError("Game rooms are unavailable", 503)
+
+        status = result[0].decode() if isinstance(result[0], bytes) else result[0]
+        if status == "missing":
+            raise GameRoomError("Room not found", 404)
+        if status == "full":
+            raise GameRoomError("Room is full")
+        return self._decode(result[1]), status in ("joined", "rejoined")
+
+    async def leave(self, room_id: str, user_id: str) -> Optional[RoomChange]:
+        """Remove a player; the room is deleted with its last player, otherwise returns the change"""
+        try:
+            result = await self._remove_player(room_id, user_id, evicting=False)
+        except (RedisError, OSError) as e:
+            print(f"Game room leave failed for {room_id}: {e}")
+            raise GameRoomError("Game rooms are unavailable", 503)
+        if result[0] not in ("left", b"left"):
+            return None
+        return int(result[1]), json.loads(result[2])
+
+    async def _remove_player(self, room_id: str, user_id: str, evicting: bool) -> list:
+        return await self._leave(
+            keys=[self._key(room_id), self._player_rooms_key(user_id), ROOMS_KEY, DISCONNECTED_KEY],
+            args=[user_id, settings.GAME_ROOM_TTL_SECONDS, time.time(), room_id, 1 if evicting else 0, PLAYER_ROOMS_PREFIX]
+        )
+
+    async def update(
+        self,
+        room_id: str,
+        fields: Dict[str, Any],
+        expected_version: Optional[int] = None
+    ) -> RoomChange:
+        """Set fields, if the room is still at ``expected_version`` when given"""
+        args = [
+            settings.GAME_ROOM_TTL_SECONDS,
+            time.time(),
+            room_id,
+            "" if expected_version is None else expected_version,
+            PLAYER_ROOMS_PREFIX
+        ]
+        for field, value in fields.items():
+            args.extend([field, json.dumps(value)])
+        try:
+            result = await self._update(keys=[self._key(room_id), ROOMS_KEY], args=args)
+        except (RedisError, OSError) as e:
+            print(f"Game room update failed for {room_id}: {e}")
+            raise GameRoomError("Game rooms are unavailable", 503)
+
+        status = result[0].decode() if isinstance(result[0], bytes) else result[0]
+        if status == "missing":
+            raise GameRoomError("Room not found", 404)
+        if status == "conflict":
+            raise GameRoomError("Room has changed since that version; reload it", 409)
+        return int(result[1]), json.loads(result[2])
+
+    async def player_ids(self, room_id: str) -> List[str]:
+        """Ids of the room's players (empty if it's gone); counts as room activity"""
+        try:
+            players = await self._players(
+                keys=[self._key(room_id), ROOMS_KEY],
+                args=[settings.GAME_ROOM_TTL_SECONDS, time.time(), room_id, PLAYER_ROOMS_PREFIX]
+            )
+        except (RedisError, OSError) as e:
+            print(f"Game room player lookup failed for {room_id}: {e}")
+            return []
+        return [p["id"] for p in json.loads(players)] if players else []
+
+    async def rooms_for(self, user_id: str) -> List[str]:
+        """Rooms the user is in, from their room index; may include rooms that have just expired"""
+        try:
+            room_ids = await self.redis.smembers(self._player_rooms_key(user_id))
+        except (RedisError, OSError) as e:
+            print(f"Game room index read failed for {user_id}: {e}")
+            raise GameRoomError("Game rooms are unavailable", 503)
+        return sorted(room_id.decode() if isinstance(room_id, bytes) else room_id for room_id in room_ids)
+
+    async def enqueue(self, user_id: str, ticket: Dict[str, Any]) -> bool:
+        """Queue a user for quick match; False if already queued"""
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.zadd(QUEUE_KEY, {user_id: time.time()}, nx=True)
+                pipe.hsetnx(TICKETS_KEY, user_id, json.dumps(ticket))
+                added, _ = await pipe.execute()
+        except (RedisError, OSError) as e:
+            print(f"Quick match enqueue failed for {user_id}: {e}")
+            raise GameRoomError("Game rooms are unavailable", 503)
+        return bool(added)
+
+    async def dequeue(self, user_ids: List[str]) -> List[str]:
+        """Remove users from the queue; returns the ones that were still queued"""
+        if not user_ids:
+            return []
+        try:
+            claimed = await self._dequeue(keys=[QUEUE_KEY, TICKETS_KEY], args=user_ids)
+        except (RedisError, OSError) as e:
+            print(f"Quick match dequeue failed: {e}")
+            raise GameRoomError("Game rooms are unavailable", 503)
+        return [user_id.decode() if isinstance(user_id, bytes) else user_id for user_id in claimed]
+
+    async def is_queued(self, user_id: str) -> bool:
+        try:
+            return await self.redis.zscore(QUEUE_KEY, user_id) is not None
+        except (RedisError, OSError) as e:
+            print(f"Quick match lookup failed for {user_id}: {e}")
+            raise GameRoomError("Game rooms are unavailable", 503)
+
+    async def queued(self, limit: int) -> List[Tuple[str, Dict[str, Any], float]]:
+        """The longest-waiting users as (user_id, ticket, enqueued at)"""
+        entries = await self.redis.zrange(QUEUE_KEY, 0, limit - 1, withscores=True)
+        if not entries:
+            return []
+        user_ids = [user_id.decode() if isinstance(user_id, bytes) else user_id for user_id, _ in entries]
+        tickets = await self.redis.hmget(TICKETS_KEY, user_ids)
+        return [
+            (user_id, json.loads(ticket) if ticket else {}, enqueued_at)
+            for user_id, ticket, (_, enqueued_at) in zip(user_ids, tickets, entries)
+        ]
+
+    async def acquire_scheduler(self, owner: str, ttl_ms: int) -> bool:
+        """Take or renew the scheduler lease; only its holder runs matchmaking"""
+        return bool(await self._acquire_lease(keys=[SCHEDULER_KEY], args=[owner, ttl_ms]))
+
+    async def mark_user(self, user_id: str, connected: bool) -> List[Tuple[str, RoomChange]]:
+        """Mark a user connected or disconnected in every room they're in; returns the rooms that changed"""
+        key = self._player_rooms_key(user_id)
+        changes = []
+        try:
+            room_ids = await self.redis.smembers(key)
+            for room_id in room_ids:
+                room_id = room_id.decode() if isinstance(room_id, bytes) else room_id
+                result = await self._set_connected(
+                    keys=[self._key(room_id), DISCONNECTED_KEY],
+                    args=[user_id, 1 if connected else 0, time.time(), room_id]
+                )
+                if result[0] != 1:
+                    await self.redis.srem(key, room_id)
+                elif len(result) > 1:
+                    changes.append((room_id, (int(result[1]), json.loads(result[2]))))
+        except (RedisError, OSError) as e:
+            print(f"Game room presence update failed for {user_id}: {e}")
+        return changes
+
+    async def sweep(self) -> Tuple[int, int]:
+        """Evict players past the grace period and delete idle rooms; returns (evicted, rooms deleted)"""
+        now = time.time()
+        evicted = deleted = 0
+        expired = await self.redis.zrangebyscore(
+            DISCONNECTED_KEY, "-inf", now - settings.GAME_PLAYER_GRACE_SECONDS, start=0, num=_SWEEP_BATCH
+        )
+        for member in expired:
+            member = member.decode() if isinstance(member, bytes) else member
+            room_id, user_id = member.split(":", 1)
+            result = await self._remove_player(room_id, user_id, evicting=True)
+            status = result[0].decode() if isinstance(result[0], bytes) else result[0]
+            if status in ("left", "deleted"):
+                evicted += 1
+                deleted += status == "deleted"
+
+        idle_cutoff = now - settings.GAME_ROOM_IDLE_SECONDS
+        idle = await self.redis.zrangebyscore(ROOMS_KEY, "-inf", idle_cutoff, start=0, num=_SWEEP_BATCH)
+        for room_id in idle:
+            room_id = room_id.decode() if isinstance(room_id, bytes) else room_id
+            deleted += await self._delete_idle(
+                keys=[self._key(room_id), ROOMS_KEY, DISCONNECTED_KEY],
+                args=[room_id, idle_cutoff, PLAYER_ROOMS_PREFIX]
+            )
+
+        self.metrics["players_evicted"] += evicted
+        self.metrics["rooms_deleted"] += deleted
+        return evicted, deleted
+
+    async def stats(self) -> dict:
+        """Gauges over all workers' rooms, plus this worker's sweep counters"""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zcard(ROOMS_KEY)
+                pipe.zcard(DISCONNECTED_KEY)
+                pipe.zcard(QUEUE_KEY)
+                pipe.zrevrange(ROOMS_KEY, 0, _SIZE_SAMPLE - 1)
+                rooms, disconnected, queued, sample = await pipe.execute()
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for room_id in sample:
+                    room_id = room_id.decode() if isinstance(room_id, bytes) else room_id
+                    pipe.hvals(self._key(room_id))
+                sizes = [sum(map(len, values)) for values in await pipe.execute()]
+        except (RedisError, OSError) as e:
+            print(f"Game room stats failed: {e}")
+            raise GameRoomError("Game rooms are unavailable", 503)
+        average = sum(sizes) / len(sizes) if sizes else 0
+        return {
+            "rooms": rooms,
+            "players_disconnected": disconnected,
+            "room_bytes_estimate": int(average * rooms),
+            "quick_match_queued": queued,
+            **self.metrics
+        }
+
+def create_game_room_store(redis):
+    if settings.GAME_ROOM_STORE == "memory":
+        return MemoryGameRoomStore()
+    return RedisGameRoomStore(redis)
+
+async def sweep_rooms_periodically(store):
+    """Background loop started from the app lifespan"""
+    while True:
+        await asyncio.sleep(settings.GAME_ROOM_SWEEP_INTERVAL_SECONDS)
+        try:
+            evicted, deleted = await store.sweep()
+            if evicted or deleted:
+                print(f"Game room sweep: evicted {evicted} player(s), deleted {deleted} room(s)")
+        except Exception as e:
+            print(f"Game room sweep error: {e}")
@@ -0,0 +1,222 @@
+import json
+import uuid
+from datetime import datetime, timedelta
+from redis.exceptions import RedisError
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+# Per-user match inbox:
+#   inbox:{user_id}          ZSET  match_id -> last activity (epoch microseconds,
+#                                  exact in a double so cursors round-trip)
+#   inbox:preview:{user_id}  HASH  match_id -> JSON last-message preview,
+#                                  plus a _loaded marker field
+#   inbox:loading:{user_id}  HASH  match_id -> JSON [score, preview] touched
+#                                  during a rebuild, plus its _token
+# Events update a loaded inbox in place; an inbox that is not loaded is left
+# alone and rebuilt from the database the next time it is read. While a
+# rebuild is reading the database, touches are collected in the loading
+# hash and applied on top of what it read, so a message stored meanwhile
+# isn't lost. A remove during a rebuild cancels it (its rows may still
+# hold the removed match), leaving the inbox to the next read.
+
+_TOUCH_IF_LOADED = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[2])
+    if ARGV[3] ~= '' then
+        redis.call('HSET', KEYS[2], ARGV[2], ARGV[3])
+    end
+    return 1
+end
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    local seen = redis.call('HGET', KEYS[3], ARGV[2])
+    if not seen or tonumber(cjson.decode(seen)[1]) <= tonumber(ARGV[1]) then
+        redis.call('HSET', KEYS[3], ARGV[2], cjson.encode({ARGV[1], ARGV[3]}))
+    end
+end
+return 0
+"""
+
+# Returns 1 if the caller now owns the rebuild (ARGV[1] is its token)
+_BEGIN_LOAD = """
+if redis.call('HEXISTS', KEYS[1], '_loaded') == 1 or redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[2], '_token', ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+# Stores the rebuilt inbox (ARGV[3..] as match_id, score, preview triples,
+# preview '' if none) with the touches collected meanwhile applied on top;
+# returns 0 if the rebuild was cancelled
+_FINISH_LOAD = """
+if redis.call('HGET', KEYS[3], '_token') ~= ARGV[1] then
+    return 0
+end
+local pending = redis.call('HGETALL', KEYS[3])
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+for i = 3, #ARGV, 3 do
+    redis.call('ZADD', KEYS[1], ARGV[i + 1], ARGV[i])
+    if ARGV[i + 2] ~= '' then
+        redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 2])
+    end
+end
+for i = 1, #pending, 2 do
+    if pending[i] ~= '_token' then
+        local touch = cjson.decode(pending[i + 1])
+        local score = redis.call('ZSCORE', KEYS[1], pending[i])
+        if not score or tonumber(score) <= tonumber(touch[1]) then
+            redis.call('ZADD', KEYS[1], touch[1], pending[i])
+            if touch[2] ~= '' then
+                redis.call('HSET', KEYS[2], pending[i], touch[2])
+            end
+        end
+    end
+end
+redis.call('HSET', KEYS[2], '_loaded', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+LOADED_FIELD = "_loaded"
+# A rebuild that hasn't finished by then is abandoned
+_LOAD_TIMEOUT_SECONDS = 30
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+def to_score(moment: datetime) -> int:
+    return (moment - _EPOCH) // _MICROSECOND
+
+def from_score(score: float) -> datetime:
+    return _EPOCH + int(score) * _MICROSECOND
+
+class InboxEntry:
+    __slots__ = ("match_id", "score", "preview")
+
+    def __init__(self, match_id: str, score: float, preview: Optional[dict]):
+        self.match_id = match_id
+        self.score = score
+        self.preview = preview
+
+    @property
+    def last_message_at(self) -> datetime:
+        return from_score(self.score)
+
+class InboxCache:
+    """Ordered match ids with last-message previews, kept in Redis per user"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self._touch = redis.register_script(_TOUCH_IF_LOADED)
+        self._begin_load = redis.register_script(_BEGIN_LOAD)
+        self._finish_load = redis.register_script(_FINISH_LOAD)
+
+    @staticmethod
+    def _keys(user_id: str) -> Tuple[str, str]:
+        return f"inbox:{user_id}", f"inbox:preview:{user_id}"
+
+    @staticmethod
+    def _loading_key(user_id: str) -> str:
+        return f"inbox:loading:{user_id}"
+
+    async def touch(self, user_id: str, match_id: str, at: datetime, preview: Optional[dict] = None):
+        """Move a match to its new position after a message or on creation"""
+        try:
+            await self._touch(
+                keys=[*self._keys(user_id), self._loading_key(user_id)],
+                args=[to_score(at), match_id, json.dumps(preview) if preview else ""]
+            )
+        except (RedisError, OSError) as e:
+            print(f"Inbox update failed for {user_id}: {e}")
+
+    async def remove(self, user_id: str, match_id: str):
+        """Drop a match after an unmatch or block"""
+        order_key, preview_key = self._keys(user_id)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.zrem(order_key, match_id)
+                pipe.hdel(preview_key, match_id)
+                pipe.delete(self._loading_key(user_id))
+                await pipe.execute()
+        except (RedisError, OSError) as e:
+            print(f"Inbox remove failed for {user_id}: {e}")
+
+    async def begin_load(self, user_id: str) -> Optional[str]:
+        """Claim the rebuild of an unloaded inbox, before reading the database.
+
+        Returns the token to pass to ``load``, or None if the inbox is loaded
+        or already being rebuilt (or Redis is unavailable).
+        """
+        token = uuid.uuid4().hex
+        try:
+            started = await self._begin_load(
+                keys=[self._keys(user_id)[1], self._loading_key(user_id)],
+                args=[token, _LOAD_TIMEOUT_SECONDS]
+            )
+        except (RedisError, OSError) as e:
+            print(f"Inbox load failed for {user_id}: {e}")
+            return None
+        return token if started else None
+
+    async def load(self, user_id: str, token: str, entries: List[InboxEntry]):
+        """Replace the user's inbox with entries rebuilt from the database
+        (unless the rebuild claimed with ``token`` was cancelled meanwhile)"""
+        args = [token, settings.INBOX_CACHE_TTL_SECONDS]
+        for entry in entries:
+            args.extend([entry.match_id, entry.score, json.dumps(entry.preview) if entry.preview else ""])
+        try:
+            await self._finish_load(keys=[*self._keys(user_id), self._loading_key(user_id)], args=args)
+        except (RedisError, OSError) as e:
+            print(f"Inbox load failed for {user_id}: {e}")
+
+    async def page(
+        self,
+        user_id: str,
+        limit: int,
+        before: Optional[Tuple[datetime, str]] = None,
+        offset: int = 0
+    ) -> Optional[List[InboxEntry]]:
+        """Up to ``limit`` entries, newest first, strictly after the ``before`` cursor
+        (or skipping the first ``offset`` entries).
+
+        Returns None when the inbox is not loaded or Redis is unavailable.
+        """
+        order_key, preview_key = self._keys(user_id)
+        try:
+            if not await self.redis.hexists(preview_key, LOADED_FIELD):
+                return None
+
+            if before:
+                max_score = to_score(before[0])
+                # Entries sharing the cursor's score are filtered by id below
+                ties = await self.redis.zcount(order_key, max_score, max_score)
+                rows = await self.redis.zrevrangebyscore(
+                    order_key, max_score, "-inf", start=0, num=limit + ties, withscores=True
+                )
+            else:
+                rows = await self.redis.zrevrange(order_key, offset, offset + limit - 1, withscores=True)
+
+            match_ids = [
+                match_id.decode() if isinstance(match_id, bytes) else match_id
+                for match_id, _ in rows
+            ]
+            previews = await self.redis.hmget(preview_key, match_ids) if match_ids else []
+        except (RedisError, OSError) as e:
+            print(f"Inbox read failed for {user_id}: {e}")
+            return None
+
+        entries = []
+        for match_id, (_, score), preview in zip(match_ids, rows, previews):
+            if before and score == max_score and match_id >= before[1]:
+                continue
+            entries.append(InboxEntry(match_id, score, json.loads(preview) if preview else None))
+        return entries[:limit]
+
+def message_preview(message: Dict) -> dict:
+    return {
+        "content": (message["content"] or "")[:200],
+        "sender_id": message["sender_id"],
+        "message_type": message["message_type"]
+    }
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from typing import List
+
+from app.core.config import settings
+from app.core.database import SessionLocal, Match, Message, MessageArchive
+
+# Conversations idle longer than ARCHIVE_IDLE_DAYS are moved out of the hot
+# messages table into message_archive, ARCHIVE_BATCH_SIZE messages per
+# compressed chunk. Each chunk is its own short transaction, so the job never
+# holds locks for a whole conversation. Sequence numbers are contiguous per
+# match, which lets readers tell from matches.archived_seq alone whether a
+# range lives in the hot table, the archive, or both.
+
+_ARCHIVED_FIELDS = ("id", "seq", "sender_id", "content", "message_type", "image_url", "is_read")
+
+def _pack(messages: List[Message]) -> bytes:
+    rows = []
+    for msg in messages:
+        row = {field: getattr(msg, field) for field in _ARCHIVED_FIELDS}
+        row["created_at"] = msg.created_at.isoformat() if msg.created_at else None
+        rows.append(row)
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode(), 9)
+
+def _unpack(chunk: MessageArchive) -> List[Message]:
+    messages = []
+    for row in json.loads(zlib.decompress(chunk.payload)):
+        created_at = row.pop("created_at")
+        # Transient instances: never added to the session
+        messages.append(Message(
+            match_id=chunk.match_id,
+            created_at=datetime.fromisoformat(created_at) if created_at else None,
+            **row
+        ))
+    return messages
+
+def _archive_chunk(db: Session, match_id: str, cutoff: datetime, batch_size: int) -> int:
+    """Move the oldest hot messages of one idle match into a single archive chunk"""
+    match = db.query(Match).filter(Match.id == match_id).with_for_update().first()
+    if not match or (match.last_message_at and match.last_message_at >= cutoff):
+        db.rollback()
+        return 0
+
+    archived_seq = match.archived_seq or 0
+    messages = db.query(Message).filter(
+        Message.match_id == match_id,
+        Message.seq > archived_seq
+    ).order_by(Message.seq).limit(batch_size).all()
+    if not messages:
+        db.rollback()
+        return 0
+
+    first_seq, last_seq = messages[0].seq, messages[-1].seq
+    db.add(MessageArchive(
+        match_id=match_id,
+        first_seq=first_seq,
+        last_seq=last_seq,
+        message_count=len(messages),
+        payload=_pack(messages)
+    ))
+    db.query(Message).filter(
+        Message.match_id == match_id,
+        Message.seq >= first_seq,
+        Message.seq <= last_seq
+    ).delete(synchronize_session=False)
+    match.archived_seq = last_seq
+    db.commit()
+    return len(messages)
+
+def archive_idle_conversations(
+    idle_days: int = None,
+    batch_size: int = None,
+    max_matches: int = 1000
+) -> int:
+    """Archive messages of conversations idle past the threshold; returns messages moved"""
+    idle_days = idle_days if idle_days is not None else settings.ARCHIVE_IDLE_DAYS
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    cutoff = datetime.utcnow() - timedelta(days=idle_days)
+
+    db = SessionLocal()
+    moved = 0
+    try:
+        match_ids = [row[0] for row in db.query(Match.id).filter(
+            Match.last_message_at < cutoff,
+            Match.last_seq > Match.archived_seq
+        ).limit(max_matches).all()]
+        db.rollback()
+
+        for match_id in match_ids:
+            while True:
+                try:
+                    count = _archive_chunk(db, match_id, cutoff, batch_size)
+                except Exception as e:
+                    # e.g. another worker archived the same chunk first
+                    db.rollback()
+                    print(f"Error archiving messages for match {match_id}: {e}")
+                    break
+                if not count:
+                    break
+                moved += count
+    finally:
+        db.close()
+
+    if moved:
+        print(f"Archived {moved} messages from {len(match_ids)} idle conversations")
+    return moved
+
+async def archive_periodically():
+    """Background loop started from the app lifespan"""
+    interval = settings.ARCHIVE_INTERVAL_MINUTES * 60
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(archive_idle_conversations)
+        except Exception as e:
+            print(f"Message archiver error: {e}")
+
+def load_message_range(db: Session, match: Match, first_seq: int, last_seq: int) -> List[Message]:
+    """Messages with first_seq <= seq <= last_seq, from the archive and/or hot table"""
+    if last_seq < first_seq:
+        return []
+
+    messages = []
+    archived_seq = match.archived_seq or 0
+    if first_seq <= archived_seq:
+        chunks = db.query(MessageArchive).filter(
+            MessageArchive.match_id == match.id,
+            MessageArchive.last_seq >= first_seq,
+            MessageArchive.first_seq <= min(last_seq, archived_seq)
+        ).order_by(MessageArchive.first_seq).all()
+        for chunk in chunks:
+            messages.extend(
+                msg for msg in _unpack(chunk) if first_seq <= msg.seq <= last_seq
+            )
+
+    if last_seq > archived_seq:
+        messages.extend(db.query(Message).filter(
+            Message.match_id == match.id,
+            Message.seq >= max(first_seq, archived_seq + 1),
+            Message.seq <= last_seq
+        ).order_by(Message.seq).all())
+
+    return messages
+
+if __name__ == "__main__":
+    archive_idle_conversations(max_matches=None)
@@ -0,0 +1,298 @@
+import asyncio
+import uuid
+from datetime import datetime
+from typing import List, Optional, Set
+
+from app.core.config import settings
+from app.core.database import SessionLocal, Match, Message, append_message
+from app.models.user import User
+from app.services.inbox_cache import message_preview
+from app.services.ws_codec import Frame
+
+class MessageRejected(Exception):
+    """Raised when a message fails validation or the sender is not a participant"""
+
+    def __init__(self, detail: str, status_code: int = 400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+class PendingMessage:
+    __slots__ = (
+        "sender_id", "match_id", "content", "message_type", "image_url",
+        "client_id", "ack", "future", "result", "error", "recipient_id"
+    )
+
+    def __init__(self, sender_id, match_id, content, message_type, image_url, client_id, ack, future):
+        self.sender_id = sender_id
+        self.match_id = match_id
+        self.content = content
+        self.message_type = message_type
+        self.image_url = image_url
+        self.client_id = client_id
+        self.ack = ack
+        self.future = future
+        self.result = None
+        self.error = None
+        self.recipient_id = None
+
+class MessagePipeline:
+    """Single path for chat messages: validate, persist, then fan out.
+
+    Both ``POST /api/messages/`` and the websocket ``new_message`` event
+    enqueue here. A background writer collects everything that arrives
+    within ``MESSAGE_BATCH_WINDOW_MS`` and persists it in one transaction,
+    then pushes each message to the recipient's live connections, bumps the
+    unread counter, moves the match to the top of both inboxes and (for
+    websocket senders) acknowledges with the server-assigned id.
+    """
+
+    def __init__(self, connection_manager, unread_counter, inbox_cache):
+        self.connection_manager = connection_manager
+        self.unread_counter = unread_counter
+        self.inbox_cache = inbox_cache
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.batch_window = settings.MESSAGE_BATCH_WINDOW_MS / 1000
+        self.max_batch_size = settings.MESSAGE_BATCH_MAX_SIZE
+        self._task: Optional[asyncio.Task] = None
+        self._background: Set[asyncio.Task] = set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            self._task.add_done_callback(self._writer_done)
+
+    def _writer_done(self, task: asyncio.Task):
+        # Restart a writer that died; queued messages are still waiting for it
+        if task is not self._task or task.cancelled() or task.exception() is None:
+            return
+        print(f"Message writer crashed, restarting: {task.exception()!r}")
+        self._task = None
+        self.start()
+
+    async def stop(self):
+        """Flush queued messages and stop the writer"""
+        if self._task is not None:
+            await self.queue.put(None)
+            await self._task
+            self._task = None
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def submit(
+        self,
+        sender_id: str,
+        match_id: str,
+        content: str,
+        message_type: str = "text",
+        image_url: Optional[str] = None,
+        client_id: Optional[str] = None,
+        ack: bool = False
+    ) -> asyncio.Future:
+        """Queue a message and return a future resolving to the stored message.
+
+        With ``ack=True`` the sender also receives a ``message_ack`` (or
+        ``message_error``) frame over the websocket once the batch commits.
+        """
+        future = asyncio.get_running_loop().create_future()
+        pending = PendingMessage(
+            sender_id, match_id, content, message_type or "text",
+            image_url, client_id, ack, future
+        )
+
+        error = self._validate(pending)
+        if error:
+            pending.error = error
+            self._spawn(self._deliver_safely(pending))
+        else:
+            self.queue.put_nowait(pending)
+        return future
+
+    def _validate(self, pending: PendingMessage) -> Optional[MessageRejected]:
+        if not pending.match_id:
+            return MessageRejected("match_id is required")
+        if not pending.content and not pending.image_url:
+            return MessageRejected("Message content is empty")
+        if pending.content and len(pending.content) > settings.MAX_MESSAGE_LENGTH:
+            return MessageRejected("Message is too long")
+        return None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            first = await self.queue.get()
+            if first is None:
+                break
+
+            batch = [first]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                try:
+                    pending = (
+                        await asyncio.wait_for(self.queue.get(), timeout)
+                        if timeout > 0 else self.queue.get_nowait()
+                    )
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                if pending is None:
+                    closing = True
+                    break
+                batch.append(pending)
+
+            try:
+                await self._process(batch)
+            finally:
+                # Even if the writer dies here, nobody is left waiting
+                for pending in batch:
+                    self._settle(pending)
+
+    async def _process(self, batch: List[PendingMessage]):
+        try:
+            await asyncio.to_thread(self._persist, batch)
+        except Exception as e:
+            print(f"Error persisting message batch: {e}")
+            for pending in batch:
+                if pending.error is None:
+                    pending.error = MessageRejected("Failed to store message", 500)
+
+        await asyncio.gather(*(self._deliver_safely(pending) for pending in batch))
+
+    def _persist(self, batch: List[PendingMessage]):
+        """Store a batch in one transaction (runs in a worker thread)"""
+        db = SessionLocal()
+        try:
+            match_ids = {pending.match_id for pending in batch}
+            matches = {
+                match.id: match for match in db.query(Match).filter(
+                    Match.id.in_(match_ids),
+                    Match.is_active == True
+                ).with_for_update().all()
+            }
+            sender_ids = {pending.sender_id for pending in batch}
+            sender_names = dict(
+                db.query(User.id, User.name).filter(User.id.in_(sender_ids)).all()
+            )
+
+            now = datetime.utcnow()
+            for pending in batch:
+                match = matches.get(pending.match_id)
+                if not match or pending.sender_id not in (match.user1_id, match.user2_id):
+                    pending.error = MessageRejected(
+                        "Match not found or you're not a participant", 404
+                    )
+                    continue
+
+                message = Message(
+                    id=str(uuid.uuid4()),
+                    match_id=pending.match_id,
+                    sender_id=pending.sender_id,
+                    content=pending.content,
+                    message_type=pending.message_type,
+                    image_url=pending.image_url,
+                    is_read=False,
+                    created_at=now
+                )
+                # Matches were locked above, for the whole batch at once
+                append_message(db, message, match)
+                match.mark_read(pending.sender_id, message.seq)
+                match.last_message_at = now
+                match.record_activity(now)
+
+                pending.recipient_id = (
+                    match.user2_id if match.user1_id == pending.sender_id else match.user1_id
+                )
+                pending.result = {
+                    "id": message.id,
+                    "match_id": message.match_id,
+                    "seq": message.seq,
+                    "sender_id": message.sender_id,
+                    "content": message.content,
+                    "message_type": message.message_type,
+                    "image_url": message.image_url,
+                    "is_read": False,
+                    "created_at": now,
+                    "sender_name": sender_names.get(pending.sender_id, "Unknown")
+                }
+
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _deliver_safely(self, pending: PendingMessage):
+        """Deliver, and settle the sender's future whatever happens"""
+        try:
+            await self._deliver(pending)
+        except Exception as e:
+            print(f"Error delivering message to match {pending.match_id}: {e!r}")
+        self._settle(pending)
+
+    @staticmethod
+    def _settle(pending: PendingMessage):
+        if pending.future.done():
+            return
+        if pending.result is not None and pending.error is None:
+            # Stored; only the fan-out failed, so a retry would duplicate it
+            pending.future.set_result(pending.result)
+        else:
+            pending.future.set_exception(pending.error or MessageRejected("Failed to store message", 500))
+            if pending.ack:
+                # Websocket senders never await the future
+                pending.future.exception()
+
+    async def _deliver(self, pending: PendingMessage):
+        manager = self.connection_manager
+
+        if pending.error is not None:
+            if pending.ack:
+                await manager.send_personal_message(Frame("message_error", {
+                    "client_id": pending.client_id,
+                    "match_id": pending.match_id,
+                    "detail": pending.error.detail
+                }), pending.sender_id)
+            if not pending.future.done():
+                pending.future.set_exception(pending.error)
+                if pending.ack:
+                    # Websocket senders never await the future
+                    pending.future.exception()
+            return
+
+        message = pending.result
+        timestamp = message["created_at"].isoformat()
+
+        await self.unread_counter.increment(pending.recipient_id, message["match_id"], message["seq"])
+        preview = message_preview(message)
+        for user_id in (pending.sender_id, pending.recipient_id):
+            await self.inbox_cache.touch(user_id, message["match_id"], message["created_at"], preview)
+        await manager.send_personal_message(Frame("new_message", {
+            "id": message["id"],
+            "match_id": message["match_id"],
+            "seq": message["seq"],
+            "sender_id": message["sender_id"],
+            "sender_name": message["sender_name"],
+            "content": message["content"],
+            "message_type": message["message_type"],
+            "image_url": message["image_url"],
+            "timestamp": timestamp
+        }), pending.recipient_id)
+
+        if pending.ack:
+            await manager.send_personal_message(Frame("message_ack", {
+                "client_id": pending.client_id,
+                "id": message["id"],
+                "match_id": message["match_id"],
+                "seq": message["seq"],
+                "timestamp": timestamp
+            }), pending.sender_id)
+
+        if not pending.future.done():
+            pending.future.set_result(message)
@@ -0,0 +1,223 @@
+import html
+import re
+from sqlalchemy import text, bindparam
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+# The search index is a side table fed by an AFTER INSERT trigger on
+# messages, so it is maintained on insert no matter which code path writes
+# the row, and it keeps archived conversations searchable after their rows
+# leave the hot messages table.
+#
+#   SQLite:   FTS5 virtual table messages_fts. The match id is indexed as
+#             a single token (match_key) so scoping to a user's matches is
+#             part of the full-text query instead of a post-filter.
+#   Postgres: message_search table with a GIN-indexed tsvector column
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+
+# The database marks hits with these control characters; the snippet is
+# HTML-escaped before they become HIGHLIGHT_START/END, so message content
+# can never inject markup into the highlight
+_HIT_START = "\x02"
+_HIT_END = "\x03"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_SQLITE_SETUP = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content,
+        match_key,
+        message_id UNINDEXED,
+        match_id UNINDEXED,
+        seq UNINDEXED,
+        sender_id UNINDEXED,
+        created_at UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages
+    BEGIN
+        INSERT INTO messages_fts (content, match_key, message_id, match_id, seq, sender_id, created_at)
+        VALUES (new.content, replace(new.match_id, '-', ''), new.id, new.match_id, new.seq, new.sender_id, new.created_at);
+    END
+    """,
+]
+
+_SQLITE_BACKFILL = """
+    INSERT INTO messages_fts (content, match_key, message_id, match_id, seq, sender_id, created_at)
+    SELECT content, replace(match_id, '-', ''), id, match_id, seq, sender_id, created_at
+    FROM messages ORDER BY created_at
+"""
+
+# Indexes built before seq was stored get it from the hot messages table;
+# rows already archived by then keep a NULL seq
+_SQLITE_ADD_SEQ = [
+    "DROP TRIGGER IF EXISTS messages_fts_insert",
+    "ALTER TABLE messages_fts RENAME TO messages_fts_old",
+    *_SQLITE_SETUP,
+    """
+    INSERT INTO messages_fts (rowid, content, match_key, message_id, match_id, seq, sender_id, created_at)
+    SELECT old.rowid, old.content, old.match_key, old.message_id, old.match_id, messages.seq,
+           old.sender_id, old.created_at
+    FROM messages_fts_old AS old LEFT JOIN messages ON messages.id = old.message_id
+    """,
+    "DROP TABLE messages_fts_old",
+]
+
+_POSTGRES_SETUP = [
+    """
+    CREATE TABLE IF NOT EXISTS message_search (
+        message_id TEXT PRIMARY KEY,
+        match_id TEXT NOT NULL,
+        seq INTEGER,
+        sender_id TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        content TEXT NOT NULL,
+        tsv TSVECTOR NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_message_search_tsv ON message_search USING GIN (tsv)",
+    "CREATE INDEX IF NOT EXISTS ix_message_search_match_created ON message_search (match_id, created_at)",
+    """
+    CREATE OR REPLACE FUNCTION messages_search_insert() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO message_search (message_id, match_id, seq, sender_id, created_at, content, tsv)
+        VALUES (NEW.id, NEW.match_id, NEW.seq, NEW.sender_id, NEW.created_at, NEW.content,
+                to_tsvector('simple', COALESCE(NEW.content, '')))
+        ON CONFLICT (message_id) DO NOTHING;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS messages_search_insert ON messages",
+    """
+    CREATE TRIGGER messages_search_insert AFTER INSERT ON messages
+    FOR EACH ROW EXECUTE FUNCTION messages_search_insert()
+    """,
+]
+
+_POSTGRES_BACKFILL = """
+    INSERT INTO message_search (message_id, match_id, seq, sender_id, created_at, content, tsv)
+    SELECT id, match_id, seq, sender_id, created_at, content, to_tsvector('simple', COALESCE(content, ''))
+    FROM messages
+    ON CONFLICT (message_id) DO NOTHING
+"""
+
+_POSTGRES_ADD_SEQ = [
+    "ALTER TABLE message_search ADD COLUMN seq INTEGER",
+    """
+    UPDATE message_search SET seq = messages.seq
+    FROM messages WHERE messages.id = message_search.message_id
+    """,
+]
+
+def ensure_search_index(engine):
+    """Create the full-text index and its insert trigger, backfilling on first run"""
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        trigger_check = "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'messages_fts_insert'"
+        seq_check = "SELECT 1 FROM pragma_table_info('messages_fts') WHERE name = 'seq'"
+        setup, backfill, add_seq = _SQLITE_SETUP, _SQLITE_BACKFILL, _SQLITE_ADD_SEQ
+    elif dialect == "postgresql":
+        trigger_check = "SELECT 1 FROM pg_trigger WHERE tgname = 'messages_search_insert'"
+        seq_check = """
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'message_search' AND column_name = 'seq'
+        """
+        setup, backfill, add_seq = _POSTGRES_SETUP, _POSTGRES_BACKFILL, _POSTGRES_ADD_SEQ
+    else:
+        print(f"Message search is not supported on {dialect}")
+        return
+
+    with engine.begin() as conn:
+        # Rows written before the trigger existed have to be indexed once
+        needs_backfill = conn.execute(text(trigger_check)).first() is None
+        if not needs_backfill and conn.execute(text(seq_check)).first() is None:
+            for statement in add_seq:
+                conn.execute(text(statement))
+            print("✅ Added seq to message search index")
+        for statement in setup:
+            conn.execute(text(statement))
+        if needs_backfill:
+            conn.execute(text(backfill))
+            print("✅ Built message search index")
+
+def _tokens(query: str) -> List[str]:
+    return _TOKEN_RE.findall(query.lower())[:10]
+
+def _fts5_query(tokens: List[str], match_ids: List[str]) -> str:
+    # Quote every token so user input can't inject FTS5 syntax. Terms are
+    # whole words: prefix queries (``term*``) merge every matching doclist
+    # up front and were ~8x slower on the benchmark corpus.
+    terms = [f'"{token}"' for token in tokens]
+    match_keys = " OR ".join(f'"{match_id.replace("-", "")}"' for match_id in match_ids)
+    return f"match_key : ({match_keys}) AND content : ({' '.join(terms)})"
+
+def _tsquery(tokens: List[str]) -> str:
+    return " & ".join(tokens)
+
+def _highlight(snippet: Optional[str]) -> str:
+    escaped = html.escape(snippet or "", quote=False)
+    return escaped.replace(_HIT_START, HIGHLIGHT_START).replace(_HIT_END, HIGHLIGHT_END)
+
+def search_messages(
+    db: Session,
+    match_ids: List[str],
+    query: str,
+    limit: int = 20,
+    offset: int = 0
+) -> Optional[List[dict]]:
+    """Newest-first full-text search within the given matches.
+
+    Returns up to ``limit + 1`` rows so callers can tell whether another page
+    exists, or None when the query has no searchable terms.
+    """
+    tokens = _tokens(query)
+    if not tokens or not match_ids:
+        return None
+
+    dialect = db.get_bind().dialect.name
+    params = {"limit": limit + 1, "offset": offset}
+    if dialect == "sqlite":
+        statement = text("""
+            SELECT message_id, match_id, seq, sender_id, created_at,
+                   snippet(messages_fts, 0, :hit_start, :hit_end, '…', 16) AS highlight
+            FROM messages_fts
+            WHERE messages_fts MATCH :query
+            ORDER BY rowid DESC
+            LIMIT :limit OFFSET :offset
+        """)
+        params["query"] = _fts5_query(tokens, match_ids)
+        params["hit_start"], params["hit_end"] = _HIT_START, _HIT_END
+    elif dialect == "postgresql":
+        statement = text("""
+            SELECT message_id, match_id, seq, sender_id, created_at,
+                   ts_headline('simple', content, to_tsquery('simple', :query), :headline_options) AS highlight
+            FROM message_search
+            WHERE tsv @@ to_tsquery('simple', :query) AND match_id IN :match_ids
+            ORDER BY created_at DESC
+            LIMIT :limit OFFSET :offset
+        """).bindparams(bindparam("match_ids", expanding=True))
+        params["query"] = _tsquery(tokens)
+        params["headline_options"] = f"StartSel={_HIT_START}, StopSel={_HIT_END}, MaxWords=16, MinWords=6"
+        params["match_ids"] = list(match_ids)
+    else:
+        return None
+
+    rows = db.execute(statement, params).fetchall()
+
+    return [
+        {
+            "message_id": row[0],
+            "match_id": row[1],
+            "seq": row[2],
+            "sender_id": row[3],
+            "created_at": row[4],
+            "highlight": _highlight(row[5])
+        }
+        for row in rows
+    ]
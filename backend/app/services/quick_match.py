@@ -0,0 +1,167 @@
+import asyncio
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.services.game_rooms import new_room, snapshot
+from app.services.ws_codec import Frame
+
+# Quick match: users queue up (POST /api/games/quick-match) and one
+# scheduler groups them into rooms of up to GAME_ROOM_MAX_PLAYERS. Every
+# worker runs the loop, but only the holder of the store's scheduler lease
+# does any matching, so users queued through any worker are grouped
+# together. Each tick reads at most _QUEUE_BATCH of the longest-waiting
+# users, so its cost doesn't grow with the queue.
+#
+# Grouping is oldest first. A user who asked to prefer their matches is
+# grouped with queued users they have an active match with before anyone
+# else. A full room forms as soon as enough users are waiting; a smaller
+# one (at least two players) once its oldest member has waited
+# GAME_QUICK_MATCH_MAX_WAIT_SECONDS. Users still waiting after
+# GAME_QUICK_MATCH_TIMEOUT_SECONDS are dropped from the queue.
+#
+# Users hear the outcome as a quick_match frame: status "matched" with the
+# room's snapshot, or "timed_out".
+
+_QUEUE_BATCH = 1000
+
+def form_groups(
+    entries: List[Tuple[str, Dict[str, Any], float]],
+    partners: Dict[str, List[str]],
+    now: float
+) -> List[List[str]]:
+    """Split queue entries (oldest first) into groups ready to play"""
+    size = settings.GAME_ROOM_MAX_PLAYERS
+    waiting = [user_id for user_id, _, _ in entries]
+    groups = []
+    taken: Set[str] = set()
+    for i, (user_id, ticket, enqueued_at) in enumerate(entries):
+        if user_id in taken:
+            continue
+        group = [user_id]
+        if ticket.get("prefer_matches"):
+            for partner_id in partners.get(user_id, ()):
+                if len(group) < size and partner_id not in taken:
+                    group.append(partner_id)
+        for other_id in waiting[i + 1:]:
+            if len(group) >= size:
+                break
+            if other_id not in taken and other_id not in group:
+                group.append(other_id)
+
+        if len(group) == size or (len(group) >= 2 and now - enqueued_at >= settings.GAME_QUICK_MATCH_MAX_WAIT_SECONDS):
+            groups.append(group)
+            taken.update(group)
+        else:
+            # Every untaken user was a candidate for this group, so no
+            # younger user can complete one either
+            break
+    return groups
+
+def load_partners(user_ids: List[str]) -> Dict[str, List[str]]:
+    """Queued users each queued user has an active match with, in queue order"""
+    from app.core.database import SessionLocal, Match
+
+    position = {user_id: i for i, user_id in enumerate(user_ids)}
+    db = SessionLocal()
+    try:
+        rows = db.query(Match.user1_id, Match.user2_id).filter(
+            Match.is_active == True,
+            Match.user1_id.in_(user_ids),
+            Match.user2_id.in_(user_ids)
+        ).all()
+    finally:
+        db.close()
+
+    partners: Dict[str, List[str]] = {}
+    for user1_id, user2_id in rows:
+        partners.setdefault(user1_id, []).append(user2_id)
+        partners.setdefault(user2_id, []).append(user1_id)
+    for matched in partners.values():
+        matched.sort(key=position.__getitem__)
+    return partners
+
+class QuickMatchScheduler:
+    def __init__(self, store, connection_manager):
+        self.store = store
+        self.connection_manager = connection_manager
+        self.owner = uuid.uuid4().hex
+        self.metrics: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        interval = settings.GAME_QUICK_MATCH_INTERVAL_MS / 1000
+        # Outlives a few missed ticks before another worker takes over
+        lease_ms = max(settings.GAME_QUICK_MATCH_INTERVAL_MS * 8, 2000)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await self.store.acquire_scheduler(self.owner, lease_ms):
+                    await self.tick()
+            except Exception as e:
+                print(f"Quick match scheduler error: {e}")
+
+    async def tick(self) -> int:
+        """Match what's queued now; returns the number of rooms formed"""
+        entries = await self.store.queued(_QUEUE_BATCH)
+        if not entries:
+            return 0
+        now = time.time()
+
+        expired = [user_id for user_id, _, enqueued_at in entries if now - enqueued_at >= settings.GAME_QUICK_MATCH_TIMEOUT_SECONDS]
+        if expired:
+            for user_id in await self.store.dequeue(expired):
+                self.metrics["quick_match_timeouts"] += 1
+                await self.connection_manager.send_personal_message(
+                    Frame("quick_match", {"status": "timed_out"}), user_id
+                )
+            expired = set(expired)
+            entries = [entry for entry in entries if entry[0] not in expired]
+        if len(entries) < 2:
+            return 0
+
+        partners = {}
+        if any(ticket.get("prefer_matches") for _, ticket, _ in entries):
+            partners = await asyncio.to_thread(load_partners, [user_id for user_id, _, _ in entries])
+
+        tickets = {user_id: ticket for user_id, ticket, _ in entries}
+        formed = 0
+        for group in form_groups(entries, partners, now):
+            formed += await self._start_room(group, tickets)
+        return formed
+
+    async def _start_room(self, group: List[str], tickets: Dict[str, Dict[str, Any]]) -> int:
+        # Users who cancelled since the queue was read are left out
+        claimed = await self.store.dequeue(group)
+        if len(claimed) < 2:
+            for user_id in claimed:
+                await self.store.enqueue(user_id, tickets[user_id])
+            return 0
+
+        room = new_room(str(uuid.uuid4())[:8], tickets[claimed[0]]["player"], datetime.now().isoformat())
+        await self.store.create(room)
+        for user_id in claimed[1:]:
+            room, _ = await self.store.join(room["id"], tickets[user_id]["player"])
+
+        self.metrics["quick_match_rooms"] += 1
+        await self.connection_manager.send_to_users(
+            Frame("quick_match", {"status": "matched", "room_id": room["id"], "room": snapshot(room)}),
+            claimed
+        )
+        return 1
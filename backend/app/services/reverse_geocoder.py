@@ -0,0 +1,117 @@
+import csv
+import math
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+# Offline reverse geocoding for feed location labels.
+#
+# The bundled gazetteer (app/data/gazetteer.csv: name, state, country,
+# latitude, longitude) is loaded once at startup into a grid of
+# _INDEX_CELL_DEGREES cells. A lookup snaps the coordinates to a
+# _LOOKUP_CELL_DEGREES cell (about 5 km) and searches outward ring by ring
+# from the grid cell it falls in, stopping once no unsearched cell can hold
+# a closer place. Labels are memoized per lookup cell, so users in the same
+# neighbourhood cost one dict hit. Places further than
+# GEOCODER_MAX_DISTANCE_KM away don't count; such coordinates get no label.
+
+GAZETTEER_PATH = Path(__file__).resolve().parent.parent / "data" / "gazetteer.csv"
+
+_INDEX_CELL_DEGREES = 1.0
+_LOOKUP_CELL_DEGREES = 0.05
+_KM_PER_DEGREE = 111.32
+_LNG_CELLS = int(360 / _INDEX_CELL_DEGREES)
+
+class Place:
+    __slots__ = ("name", "state", "country", "latitude", "longitude")
+
+    def __init__(self, name: str, state: str, country: str, latitude: float, longitude: float):
+        self.name = name
+        self.state = state
+        self.country = country
+        self.latitude = latitude
+        self.longitude = longitude
+
+    @property
+    def label(self) -> str:
+        # Indian users know places by state, everyone else by country
+        if self.state and self.country == "India":
+            return f"{self.name}, {self.state}"
+        return f"{self.name}, {self.country}"
+
+def _distance_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance (haversine)"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(min(1.0, math.sqrt(a)))
+
+def _cell(latitude: float, longitude: float) -> Tuple[int, int]:
+    return (
+        math.floor((latitude + 90) / _INDEX_CELL_DEGREES),
+        math.floor((longitude + 180) / _INDEX_CELL_DEGREES) % _LNG_CELLS
+    )
+
+class ReverseGeocoder:
+    def __init__(self, places: List[Place]):
+        self._grid: Dict[Tuple[int, int], List[Place]] = {}
+        for place in places:
+            self._grid.setdefault(_cell(place.latitude, place.longitude), []).append(place)
+        self._label_for_cell = lru_cache(maxsize=settings.GEOCODER_CACHE_SIZE)(self._lookup_cell)
+
+    @classmethod
+    def from_csv(cls, path: Path = GAZETTEER_PATH) -> "ReverseGeocoder":
+        with open(path, newline="", encoding="utf-8") as f:
+            places = [
+                Place(row["name"], row["state"], row["country"], float(row["latitude"]), float(row["longitude"]))
+                for row in csv.DictReader(f)
+            ]
+        return cls(places)
+
+    def nearest(self, latitude: float, longitude: float) -> Optional[Place]:
+        """The closest place within GEOCODER_MAX_DISTANCE_KM, if any"""
+        max_km = settings.GEOCODER_MAX_DISTANCE_KM
+        row, col = _cell(latitude, longitude)
+        # A cell r rings out is at least (r - 1) cells away; longitude cells
+        # narrow towards the poles, so size rings by the narrowest side
+        cos_lat = max(math.cos(math.radians(min(abs(latitude) + _INDEX_CELL_DEGREES, 90))), 0.01)
+        ring_km = _KM_PER_DEGREE * _INDEX_CELL_DEGREES * cos_lat
+        max_ring = min(math.ceil(max_km / ring_km) + 1, _LNG_CELLS // 2)
+
+        best, best_km = None, max_km
+        for ring in range(max_ring + 1):
+            if (ring - 1) * ring_km > best_km:
+                break
+            for cell in self._ring(row, col, ring):
+                for place in self._grid.get(cell, ()):
+                    km = _distance_km(latitude, longitude, place.latitude, place.longitude)
+                    if km <= best_km:
+                        best, best_km = place, km
+        return best
+
+    @staticmethod
+    def _ring(row: int, col: int, ring: int):
+        if ring == 0:
+            yield row, col
+            return
+        for d in range(-ring, ring + 1):
+            yield row - ring, (col + d) % _LNG_CELLS
+            yield row + ring, (col + d) % _LNG_CELLS
+        for d in range(-ring + 1, ring):
+            yield row + d, (col - ring) % _LNG_CELLS
+            yield row + d, (col + ring) % _LNG_CELLS
+
+    def _lookup_cell(self, lat_cell: int, lng_cell: int) -> Optional[str]:
+        place = self.nearest(lat_cell * _LOOKUP_CELL_DEGREES, lng_cell * _LOOKUP_CELL_DEGREES)
+        return place.label if place else None
+
+    def label(self, latitude: float, longitude: float) -> Optional[str]:
+        """The nearest place's label, or None away from any known place"""
+        # Also rejects NaN, which would otherwise fail to round
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            return None
+        return self._label_for_cell(
+            round(latitude / _LOOKUP_CELL_DEGREES),
+            round(longitude / _LOOKUP_CELL_DEGREES)
+        )
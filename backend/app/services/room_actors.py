@@ -0,0 +1,110 @@
+import asyncio
+from typing import Any, Callable, Dict, Optional
+
+from app.core.config import settings
+
+# Each game room with traffic on this worker gets an actor: a task reading
+# commands (join, leave, update) from its own mailbox and applying them one
+# at a time. A command is written to the room store and its game_delta
+# broadcast before the next command starts, so a room's players see deltas
+# in version order and a burst on one room never holds up another. The
+# store's atomic operations still arbitrate between workers; the actor
+# orders what happens on this one. An actor exits after
+# GAME_ROOM_ACTOR_IDLE_SECONDS with an empty mailbox and is recreated by
+# the next command.
+
+class RoomActor:
+    def __init__(self, room_id: str, actors: "RoomActors"):
+        self.room_id = room_id
+        self.actors = actors
+        self.mailbox: asyncio.Queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                action, args, future = await asyncio.wait_for(
+                    self.mailbox.get(), timeout=settings.GAME_ROOM_ACTOR_IDLE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                if self.mailbox.empty():
+                    self.actors._retire(self)
+                    return
+                continue
+
+            try:
+                result = await action(self.room_id, *args)
+            except asyncio.CancelledError:
+                # Stopped mid-command; don't leave its caller waiting
+                future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+class RoomActors:
+    """Per-room actors for game room mutations on this worker"""
+
+    def __init__(self, store, connection_manager):
+        self.store = store
+        self.connection_manager = connection_manager
+        self._actors: Dict[str, RoomActor] = {}
+
+    async def _submit(self, room_id: str, action: Callable, *args) -> Any:
+        actor = self._actors.get(room_id)
+        if actor is None:
+            actor = self._actors[room_id] = RoomActor(room_id, self)
+        future = asyncio.get_running_loop().create_future()
+        actor.mailbox.put_nowait((action, args, future))
+        return await future
+
+    def _retire(self, actor: RoomActor):
+        if self._actors.get(actor.room_id) is actor:
+            del self._actors[actor.room_id]
+
+    async def join(self, room_id: str, player: Dict[str, Any]) -> Dict[str, Any]:
+        """Add a player and return the room"""
+        return await self._submit(room_id, self._join, player)
+
+    async def leave(self, room_id: str, user_id: str):
+        await self._submit(room_id, self._leave, user_id)
+
+    async def update(self, room_id: str, fields: Dict[str, Any], expected_version: Optional[int] = None) -> int:
+        """Set room fields, optionally compare-and-set on the version; returns the new version"""
+        return await self._submit(room_id, self._update, fields, expected_version)
+
+    async def _join(self, room_id: str, player: Dict[str, Any]) -> Dict[str, Any]:
+        room, changed = await self.store.join(room_id, player)
+        if changed:
+            await self.connection_manager.send_game_delta(
+                room_id, room["version"], {"players": room["players"]}, room["players"]
+            )
+        return room
+
+    async def _leave(self, room_id: str, user_id: str):
+        # The room is deleted along with its last player
+        change = await self.store.leave(room_id, user_id)
+        if change:
+            version, players = change
+            await self.connection_manager.send_game_delta(room_id, version, {"players": players}, players)
+
+    async def _update(self, room_id: str, fields: Dict[str, Any], expected_version: Optional[int]) -> int:
+        version, players = await self.store.update(room_id, fields, expected_version)
+        # Only the changed fields go out to the room
+        await self.connection_manager.send_game_delta(room_id, version, fields, players)
+        return version
+
+    def __len__(self) -> int:
+        return len(self._actors)
+
+    async def stop(self):
+        """Cancel every actor; commands still queued are cancelled too"""
+        actors, self._actors = list(self._actors.values()), {}
+        for actor in actors:
+            actor.task.cancel()
+            while not actor.mailbox.empty():
+                actor.mailbox.get_nowait()[2].cancel()
+        await asyncio.gather(*(actor.task for actor in actors), return_exceptions=True)
@@ -0,0 +1,225 @@
+import asyncio
+import msgpack
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.services.ws_codec import Frame
+
+# WebRTC signaling relay for both the websocket "signaling" event and
+# POST /api/calls/signaling.
+#
+# Calls are tracked as sessions keyed by caller and the client's callId
+# (sent with call-offer, call-answer and call-end). Once this worker has
+# seen a message for a session, further messages from either side go to
+# the session's other participant; one without a callId goes to the
+# sender's most recent session. An explicit "to" always wins: a message
+# addressed to anyone but the session's peer bypasses the session (and its
+# candidate batching with that peer) and goes straight to "to", as does a
+# message outside any known session (no callId and no call here yet, or a
+# session first seen on another worker).
+#
+# Trickle ICE sends candidates in bursts, so ice-candidate messages are
+# held for SIGNALING_COALESCE_MS per (sender, recipient) and sent as one
+# signaling_batch frame {"from", "call_id", data: {"messages": [...]}}. A
+# lone candidate still goes out as an ordinary signaling frame, and any
+# other message flushes the candidates queued ahead of it first, so the
+# recipient sees everything in the order it was sent. Nothing on this path
+# reads the database.
+#
+# msgpack clients mark a candidate with a "signal": "ice-candidate" header
+# field (and may pass "call_id"), since their payload is never decoded
+# unless it ends up in a batch.
+#
+# Offers, answers and hangups carrying a callId are also reported to the
+# call registry (call_registry.py), which keeps the call log.
+
+ICE_CANDIDATE = "ice-candidate"
+CALL_OFFER = "call-offer"
+CALL_ANSWER = "call-answer"
+CALL_END = "call-end"
+
+# Prune idle sessions at most this often
+_PRUNE_INTERVAL = 60
+
+class CallSession:
+    __slots__ = ("key", "call_id", "caller_id", "callee_id", "last_active")
+
+    def __init__(self, call_id: str, caller_id: str, callee_id: str):
+        self.key = (caller_id, call_id)
+        self.call_id = call_id
+        self.caller_id = caller_id
+        self.callee_id = callee_id
+        self.last_active = time.monotonic()
+
+    def peer(self, user_id: str) -> Optional[str]:
+        if user_id == self.caller_id:
+            return self.callee_id
+        if user_id == self.callee_id:
+            return self.caller_id
+        return None
+
+class _PendingCandidates:
+    __slots__ = ("call_id", "items", "handle")
+
+    def __init__(self, call_id: Optional[str]):
+        self.call_id = call_id
+        self.items: List[Tuple[Optional[Dict[str, Any]], Optional[bytes]]] = []
+        self.handle: Optional[asyncio.TimerHandle] = None
+
+class SignalingRelay:
+    def __init__(self, connection_manager, calls=None):
+        self.connection_manager = connection_manager
+        self.calls = calls
+        self.window = settings.SIGNALING_COALESCE_MS / 1000
+        self._sessions: Dict[Tuple[str, str], CallSession] = {}
+        # user_id -> {call_id: session}, for both participants
+        self._user_calls: Dict[str, Dict[str, CallSession]] = {}
+        # user_id -> their most recent session, for messages without a callId
+        self._latest: Dict[str, CallSession] = {}
+        self._pending: Dict[Tuple[str, str], _PendingCandidates] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._pruned_at = time.monotonic()
+
+    async def relay(
+        self,
+        sender_id: str,
+        fields: Dict[str, Any],
+        data: Optional[Dict[str, Any]],
+        payload: Optional[bytes] = None
+    ) -> bool:
+        """Route one signaling message from ``sender_id``; False if it has no recipient"""
+        body = data or {}
+        kind = body.get("type") or fields.get("signal")
+        call_id = body.get("callId") or fields.get("call_id")
+        target = fields.get("to") or body.get("to")
+
+        session = self._session_for(sender_id, call_id, target, kind)
+        if session and target and session.peer(sender_id) != target:
+            # Addressed to someone else, e.g. a stale session from a previous call
+            session = None
+        recipient = session.peer(sender_id) if session else target
+        if not recipient or recipient == sender_id:
+            return False
+        if session:
+            session.last_active = time.monotonic()
+            call_id = session.call_id
+
+        key = (sender_id, recipient)
+        if kind == ICE_CANDIDATE:
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = _PendingCandidates(call_id)
+                pending.handle = asyncio.get_running_loop().call_later(self.window, self._spawn_flush, key)
+            pending.items.append((data, payload))
+            return True
+
+        # Candidates queued ahead of this message go first
+        await self._flush(key)
+        await self.connection_manager.send_personal_message(
+            Frame("signaling", {"from": sender_id}, data=data, payload=payload),
+            recipient
+        )
+        if kind == CALL_END and session:
+            self._end(session)
+        if self.calls and call_id:
+            await self._report(kind, sender_id, recipient, call_id, body, fields)
+        return True
+
+    async def _report(
+        self,
+        kind: Optional[str],
+        sender_id: str,
+        recipient: str,
+        call_id: str,
+        body: Dict[str, Any],
+        fields: Dict[str, Any]
+    ):
+        if kind == CALL_OFFER:
+            call_type = body.get("callType") or fields.get("call_type") or "audio"
+            await self.calls.offered(sender_id, recipient, call_id, call_type)
+        elif kind == CALL_ANSWER:
+            # An answer always goes back to the caller
+            await self.calls.answered(recipient, sender_id, call_id)
+        elif kind == CALL_END:
+            await self.calls.ended(sender_id, recipient, call_id)
+
+    def _session_for(
+        self,
+        sender_id: str,
+        call_id: Optional[str],
+        target: Optional[str],
+        kind: Optional[str]
+    ) -> Optional[CallSession]:
+        if not call_id:
+            return self._latest.get(sender_id)
+        session = self._user_calls.get(sender_id, {}).get(call_id)
+        if session is not None and (kind != CALL_OFFER or session.caller_id == sender_id):
+            return session
+        if not target:
+            return None
+
+        # First message of this call seen here: whoever sends the offer is
+        # the caller; otherwise the sender is answering the target's call
+        if kind == CALL_OFFER:
+            session = CallSession(call_id, sender_id, target)
+        else:
+            session = CallSession(call_id, target, sender_id)
+        self._sessions[session.key] = session
+        for user_id in (session.caller_id, session.callee_id):
+            self._user_calls.setdefault(user_id, {})[call_id] = session
+            self._latest[user_id] = session
+        self._prune()
+        return session
+
+    def _end(self, session: CallSession):
+        if self._sessions.get(session.key) is not session:
+            return
+        del self._sessions[session.key]
+        for user_id in (session.caller_id, session.callee_id):
+            calls = self._user_calls.get(user_id)
+            if calls and calls.get(session.call_id) is session:
+                del calls[session.call_id]
+                if not calls:
+                    del self._user_calls[user_id]
+            if self._latest.get(user_id) is session:
+                del self._latest[user_id]
+
+    def _prune(self):
+        now = time.monotonic()
+        if now - self._pruned_at < _PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        cutoff = now - settings.SIGNALING_SESSION_IDLE_SECONDS
+        for session in [s for s in self._sessions.values() if s.last_active < cutoff]:
+            self._end(session)
+
+    def _spawn_flush(self, key: Tuple[str, str]):
+        task = asyncio.create_task(self._flush(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, key: Tuple[str, str]):
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        pending.handle.cancel()
+        sender_id, recipient = key
+
+        if len(pending.items) == 1:
+            data, payload = pending.items[0]
+            frame = Frame("signaling", {"from": sender_id}, data=data, payload=payload)
+        else:
+            messages = [
+                data if data is not None else (msgpack.unpackb(payload) if payload else {})
+                for data, payload in pending.items
+            ]
+            frame = Frame(
+                "signaling_batch",
+                {"from": sender_id, "call_id": pending.call_id},
+                data={"messages": messages}
+            )
+        await self.connection_manager.send_personal_message(frame, recipient)
+
+    def stats(self) -> dict:
+        return {"call_sessions": len(self._sessions), "pending_candidate_batches": len(self._pending)}
@@ -0,0 +1,93 @@
+import asyncio
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from app.core.config import settings
+
+class _TypingState:
+    __slots__ = ("sent", "pending", "last_sent_at", "flush_handle", "stop_handle")
+
+    def __init__(self):
+        self.sent = False           # state the recipient last saw
+        self.pending = False        # latest state reported by the sender
+        self.last_sent_at = 0.0
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.stop_handle: Optional[asyncio.TimerHandle] = None
+
+class TypingIndicators:
+    """Throttled, coalesced typing indicators for a sender in a match.
+
+    Keystroke events only record the sender's latest state. The recipient
+    sees a change at most once per TYPING_THROTTLE_MS, and repeats of the
+    state it already has are dropped. If no typing event arrives for
+    TYPING_TIMEOUT_MS an automatic "stopped typing" is sent. Recipients are
+    resolved through the connection manager's participant cache, so a
+    keystroke does no database work once its match has been looked up.
+    """
+
+    def __init__(self, connection_manager):
+        self.connection_manager = connection_manager
+        self.throttle = settings.TYPING_THROTTLE_MS / 1000
+        self.timeout = settings.TYPING_TIMEOUT_MS / 1000
+        self._states: Dict[Tuple[str, str], _TypingState] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def update(self, match_id: str, sender_id: str, is_typing: bool) -> bool:
+        """Record a typing event; False if the sender isn't in the match"""
+        if await self.connection_manager.recipient_for(match_id, sender_id) is None:
+            return False
+
+        key = (match_id, sender_id)
+        state = self._states.get(key)
+        if state is None:
+            if not is_typing:
+                return True
+            state = self._states[key] = _TypingState()
+
+        loop = asyncio.get_running_loop()
+        if state.stop_handle:
+            state.stop_handle.cancel()
+            state.stop_handle = None
+        if is_typing:
+            state.stop_handle = loop.call_later(self.timeout, self._auto_stop, key)
+
+        state.pending = is_typing
+        if state.flush_handle is None:
+            wait = state.last_sent_at + self.throttle - time.monotonic()
+            if wait > 0:
+                state.flush_handle = loop.call_later(wait, self._flush, key)
+            else:
+                self._flush(key)
+        return True
+
+    def _auto_stop(self, key: Tuple[str, str]):
+        state = self._states.get(key)
+        if state:
+            state.stop_handle = None
+            state.pending = False
+            if state.flush_handle is None:
+                self._flush(key)
+
+    def _flush(self, key: Tuple[str, str]):
+        state = self._states.get(key)
+        if state is None:
+            return
+        state.flush_handle = None
+
+        if state.pending != state.sent:
+            state.sent = state.pending
+            state.last_sent_at = time.monotonic()
+            match_id, sender_id = key
+            task = asyncio.create_task(
+                self.connection_manager.send_typing_indicator(match_id, sender_id, state.sent)
+            )
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        if not state.sent and not state.pending and state.stop_handle is None:
+            # Idle: forget the sender once the throttle window has passed
+            remaining = state.last_sent_at + self.throttle - time.monotonic()
+            if remaining > 0:
+                state.flush_handle = asyncio.get_running_loop().call_later(remaining, self._flush, key)
+            else:
+                del self._states[key]
@@ -0,0 +1,186 @@
+import uuid
+from sqlalchemy import and_, func
+from sqlalchemy.orm import Session
+from redis.exceptions import RedisError
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+
+# Only bump a counter when the user's hash is already loaded; a missing hash
+# is rebuilt from the database on the next read, so blind increments would
+# leave it holding partial counts. While a rebuild is reading the database
+# (unread:loading:{user_id} exists), increments are collected there instead,
+# as "{match_id}:{seq}" fields. The rebuild reads each match's last_seq in
+# the same statement as its counts, so on merging it only adds the messages
+# with a later seq: those committed after its snapshot, which it missed. A
+# reset or invalidate during a rebuild cancels it: the counts it read may
+# already be stale, so they are returned but not cached.
+_INCREMENT_IF_LOADED = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('HSET', KEYS[2], ARGV[1] .. ':' .. ARGV[2], 1)
+end
+return nil
+"""
+
+# Returns 1 if the caller now owns the rebuild (ARGV[1] is its token)
+_BEGIN_LOAD = """
+if redis.call('EXISTS', KEYS[1]) == 1 or redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[2], '_token', ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+# Stores the rebuilt counts (ARGV[3..] as match_id, count, last_seq read
+# triples) plus the increments collected meanwhile for later seqs; returns 0
+# if the rebuild was cancelled
+_FINISH_LOAD = """
+if redis.call('HGET', KEYS[2], '_token') ~= ARGV[1] then
+    return 0
+end
+local pending = redis.call('HGETALL', KEYS[2])
+redis.call('DEL', KEYS[2])
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], '_loaded', 1)
+local read_seq = {}
+for i = 3, #ARGV, 3 do
+    if tonumber(ARGV[i + 1]) > 0 then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+    read_seq[ARGV[i]] = tonumber(ARGV[i + 2])
+end
+for i = 1, #pending, 2 do
+    local match_id, seq = string.match(pending[i], '^(.+):(%d+)$')
+    if match_id and tonumber(seq) > (read_seq[match_id] or 0) then
+        redis.call('HINCRBY', KEYS[1], match_id, 1)
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+LOADED_FIELD = "_loaded"
+# A rebuild that hasn't finished by then is abandoned
+_LOAD_TIMEOUT_SECONDS = 30
+
+class UnreadCounter:
+    """Per-(match, participant) unread message counters.
+
+    Counts live in one Redis hash per user (``unread:{user_id}``) so every
+    unread count for the match list is a single HGETALL. The database is the
+    source of truth: a missing hash is rebuilt with one grouped query, and
+    every call falls back to that query when Redis is unavailable.
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self._increment = redis.register_script(_INCREMENT_IF_LOADED)
+        self._begin_load = redis.register_script(_BEGIN_LOAD)
+        self._finish_load = redis.register_script(_FINISH_LOAD)
+
+    @staticmethod
+    def _key(user_id: str) -> str:
+        return f"unread:{user_id}"
+
+    @staticmethod
+    def _loading_key(user_id: str) -> str:
+        return f"unread:loading:{user_id}"
+
+    async def increment(self, user_id: str, match_id: str, seq: int):
+        """Count a new message (with sequence number ``seq``) for its recipient"""
+        try:
+            await self._increment(keys=[self._key(user_id), self._loading_key(user_id)], args=[match_id, seq])
+        except (RedisError, OSError) as e:
+            print(f"Unread counter increment failed for {user_id}: {e}")
+
+    async def reset(self, user_id: str, match_id: str):
+        """Clear the counter after the user has read a conversation"""
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hdel(self._key(user_id), match_id)
+                pipe.delete(self._loading_key(user_id))
+                await pipe.execute()
+        except (RedisError, OSError) as e:
+            print(f"Unread counter reset failed for {user_id}: {e}")
+
+    async def invalidate(self, user_id: str):
+        """Drop the cached hash so it is rebuilt from the database"""
+        try:
+            await self.redis.delete(self._key(user_id), self._loading_key(user_id))
+        except (RedisError, OSError) as e:
+            print(f"Unread counter invalidate failed for {user_id}: {e}")
+
+    async def get_counts(self, db: Session, user_id: str) -> Dict[str, int]:
+        """Return {match_id: unread_count} for every match with unread messages"""
+        key = self._key(user_id)
+        try:
+            cached = await self.redis.hgetall(key)
+        except (RedisError, OSError) as e:
+            print(f"Unread counter read failed for {user_id}, using database: {e}")
+            return count_unread_from_db(db, user_id)
+
+        if cached:
+            counts = {}
+            for field, value in cached.items():
+                field = field.decode() if isinstance(field, bytes) else field
+                if field != LOADED_FIELD and int(value) > 0:
+                    counts[field] = int(value)
+            return counts
+
+        token = await self._start_rebuild(user_id)
+        counts, read_seqs = read_unread_counts(db, user_id)
+        if token is None:
+            # Another request is rebuilding the hash
+            return counts
+        args = [token, settings.UNREAD_COUNTER_TTL_SECONDS]
+        for match_id, last_seq in read_seqs.items():
+            args.extend([match_id, counts.get(match_id, 0), last_seq])
+        try:
+            await self._finish_load(keys=[key, self._loading_key(user_id)], args=args)
+        except (RedisError, OSError) as e:
+            print(f"Unread counter rebuild failed for {user_id}: {e}")
+        return counts
+
+    async def _start_rebuild(self, user_id: str) -> Optional[str]:
+        token = uuid.uuid4().hex
+        try:
+            started = await self._begin_load(
+                keys=[self._key(user_id), self._loading_key(user_id)],
+                args=[token, _LOAD_TIMEOUT_SECONDS]
+            )
+        except (RedisError, OSError) as e:
+            print(f"Unread counter rebuild failed for {user_id}: {e}")
+            return None
+        return token if started else None
+
+def count_unread_from_db(db: Session, user_id: str) -> Dict[str, int]:
+    """Unread counts for all of a user's active matches in one grouped query"""
+    return read_unread_counts(db, user_id)[0]
+
+def read_unread_counts(db: Session, user_id: str) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """Unread counts, and the last_seq they cover, for each of a user's active matches.
+
+    One statement, so both come from the same snapshot: every message with
+    a seq up to a match's last_seq here has been counted (if unread).
+    """
+    from app.core.database import Match, Message
+
+    rows = db.query(Match.id, Match.last_seq, func.count(Message.id)).outerjoin(
+        Message, and_(
+            Message.match_id == Match.id,
+            Message.sender_id != user_id,
+            Message.is_read == False
+        )
+    ).filter(
+        (Match.user1_id == user_id) | (Match.user2_id == user_id),
+        Match.is_active == True
+    ).group_by(Match.id, Match.last_seq).all()
+
+    counts = {match_id: count for match_id, _, count in rows if count}
+    return counts, {match_id: last_seq or 0 for match_id, last_seq, _ in rows}
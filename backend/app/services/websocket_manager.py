@@ -1,115 +1,412 @@
 from fastapi import WebSocket
-from typing import Dict, List
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 from sqlalchemy.orm import Session
-import json
+import asyncio
+import itertools
+import time
+
+from app.core.config import settings
+from app.services.ws_codec import Frame, negotiate_subprotocol
+
+# Events worth replaying to a client that reconnects after missing them
+REPLAYED_FRAME_TYPES = {
+    "new_message", "new_match", "signaling", "signaling_batch", "game_update", "game_delta", "quick_match",
+    "voice_chat_signal"
+}
+
+class ParticipantCache:
+    """Bounded LRU of match_id -> (user1_id, user2_id) for active matches.
+    
+    Ids that aren't an active match are remembered for
+    PARTICIPANT_NEGATIVE_TTL_SECONDS, so repeated events for a bogus or
+    deactivated match don't each cost a query. Misses are looked up in a
+    worker thread, off the event loop.
+    """
+    
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        # match_id -> monotonic time the "not found" expires
+        self._missing: "OrderedDict[str, float]" = OrderedDict()
+    
+    async def get(self, match_id: str) -> Optional[Tuple[str, str]]:
+        participants = self._entries.get(match_id)
+        if participants is not None:
+            self._entries.move_to_end(match_id)
+            return participants
+        missing_until = self._missing.get(match_id)
+        if missing_until is not None:
+            if missing_until > time.monotonic():
+                return None
+            del self._missing[match_id]
+        
+        participants = await asyncio.to_thread(_load_participants, match_id)
+        if participants is None:
+            self._missing[match_id] = time.monotonic() + settings.PARTICIPANT_NEGATIVE_TTL_SECONDS
+            if len(self._missing) > self.max_size:
+                self._missing.popitem(last=False)
+            return None
+        
+        self._entries[match_id] = participants
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return participants
+    
+    def invalidate(self, match_id: str):
+        self._entries.pop(match_id, None)
+        self._missing.pop(match_id, None)
+
+def _load_participants(match_id: str) -> Optional[Tuple[str, str]]:
+    from app.core.database import SessionLocal, Match
+    
+    db = SessionLocal()
+    try:
+        participants = db.query(Match.user1_id, Match.user2_id).filter(
+            Match.id == match_id,
+            Match.is_active == True
+        ).first()
+    finally:
+        db.close()
+    return tuple(participants) if participants is not None else None
+
+class ClientConnection:
+    """One accepted socket with a bounded outbound queue drained by its own writer task.
+    
+    Senders only enqueue, so a slow client backs up its own queue instead of
+    stalling delivery to everyone else. What happens when the queue is full
+    is set by WS_SEND_OVERFLOW_POLICY:
+    
+        drop_oldest  discard the oldest queued frame (client sees the newest state)
+        drop_newest  discard the frame being sent
+        disconnect   close the socket; the client reconnects and resyncs
+    """
+    
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: str,
+        connection_id: str,
+        subprotocol: str,
+        on_closed,
+        metrics: Counter
+    ):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.id = connection_id
+        self.subprotocol = subprotocol
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_SEND_QUEUE_SIZE)
+        self.dropped = 0
+        self.closed = False
+        self.last_seen = time.monotonic()
+        self._held: Optional[list] = None
+        self._on_closed = on_closed
+        self._metrics = metrics
+        self._writer = asyncio.create_task(self._write())
+    
+    def touch(self):
+        """Record inbound traffic (any frame counts as a sign of life)"""
+        self.last_seen = time.monotonic()
+    
+    def hold(self):
+        """Buffer outgoing frames while a resume replay is being sent"""
+        self._held = []
+    
+    def release(self, replayed: List[Tuple[Frame, Optional[int]]], after_seq: int):
+        """Send the replay, then frames held meanwhile that it didn't already cover"""
+        held, self._held = self._held or [], None
+        for frame, event_seq in replayed:
+            self.enqueue(frame, event_seq)
+        for frame, event_seq in held:
+            if event_seq is None or event_seq > after_seq:
+                self.enqueue(frame, event_seq)
+    
+    def enqueue(self, frame: Frame, event_seq: Optional[int] = None):
+        if self.closed:
+            return
+        if self._held is not None:
+            self._held.append((frame, event_seq))
+            return
+        message = frame.encode(self.subprotocol, event_seq)
+        try:
+            self.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+        
+        policy = settings.WS_SEND_OVERFLOW_POLICY
+        self.dropped += 1
+        self._metrics["frames_dropped"] += 1
+        if policy == "drop_newest":
+            return
+        if policy == "drop_oldest":
+            self.queue.get_nowait()
+            self.queue.put_nowait(message)
+            return
+        
+        print(f"Send queue overflow for {self.user_id}, closing connection")
+        self._metrics["closed_overflow"] += 1
+        self.close(code=1013)
+    
+    async def _write(self):
+        while True:
+            message = await self.queue.get()
+            try:
+                if isinstance(message, bytes):
+                    await self.websocket.send_bytes(message)
+                else:
+                    await self.websocket.send_text(message)
+            except Exception as e:
+                print(f"Error sending message to {self.user_id}: {e}")
+                self._on_closed(self)
+                return
+    
+    def close(self, code: int):
+        """Unregister and close the socket from the server side"""
+        self._on_closed(self)
+        self._closer = asyncio.create_task(self._close(code))
+    
+    async def _close(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+    
+    def stop(self):
+        """Stop the writer; frames still queued are discarded"""
+        self.closed = True
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+    def __init__(self, broker=None, game_rooms=None):
+        # user_id -> {connection_id: connection}, one entry per open device
+        self.active_connections: Dict[str, Dict[str, ClientConnection]] = {}
+        # Optional WebSocketBroker for users connected to other workers
+        self.broker = broker
+        # Game room store, for relaying game frames to a room's players
+        self.game_rooms = game_rooms
+        self.participants = ParticipantCache(settings.PARTICIPANT_CACHE_SIZE)
+        self._connection_ids = itertools.count(1)
+        self.connection_count = 0
+        self.metrics: Counter = Counter()
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._background: Set[asyncio.Task] = set()
+    
+    async def connect(self, websocket: WebSocket, user_id: str, last_seq: Optional[int] = None) -> ClientConnection:
+        subprotocol, accepted = negotiate_subprotocol(websocket)
+        await websocket.accept(subprotocol=accepted)
+        connection = ClientConnection(
+            websocket, user_id, str(next(self._connection_ids)), subprotocol, self.disconnect, self.metrics
+        )
+        devices = self.active_connections.setdefault(user_id, {})
+        devices[connection.id] = connection
+        self.connection_count += 1
+        self.metrics["connections_opened"] += 1
+        if len(devices) == 1:
+            if self.broker:
+                await self.broker.subscribe_user(user_id)
+            if self.game_rooms:
+                # Back within the grace period: keep their game seats
+                await self._send_room_changes(await self.game_rooms.mark_user(user_id, True))
+        print(f"User {user_id} connected to WebSocket ({len(devices)} device(s))")
+        if last_seq is not None:
+            await self._resume(connection, last_seq)
+        return connection
+    
+    async def _resume(self, connection: ClientConnection, last_seq: int):
+        """Replay events the client missed since ``last_seq``, or ask it to resync"""
+        # Live events arriving meanwhile are held and sent after the replay
+        connection.hold()
+        events, current = await self.broker.replay(connection.user_id, last_seq) if self.broker else (None, 0)
+        if events is None:
+            self.metrics["resyncs_required"] += 1
+            connection.release([(Frame("resync_required", {"event_seq": current}), None)], current)
+        else:
+            self.metrics["events_replayed"] += len(events)
+            connection.release(
+                [(frame, event_seq) for event_seq, frame in events],
+                events[-1][0] if events else last_seq
+            )
+    
+    def disconnect(self, connection: ClientConnection):
+        """Remove one socket; the user's other devices stay connected"""
+        connection.stop()
+        devices = self.active_connections.get(connection.user_id)
+        if not devices or devices.pop(connection.id, None) is None:
+            return
+        self.connection_count -= 1
+        self.metrics["connections_closed"] += 1
+        if not devices:
+            del self.active_connections[connection.user_id]
+            if self.broker:
+                self.broker.release_user(connection.user_id, self.is_connected)
+            if self.game_rooms:
+                self._spawn(self._mark_offline(connection.user_id))
+        print(f"User {connection.user_id} disconnected from WebSocket")
+    
+    async def _mark_offline(self, user_id: str):
+        """Mark the user disconnected in their game rooms unless they've reconnected meanwhile.
+        
+        Only sockets on this worker are known here, so a user whose last
+        device on this worker closes is marked even if another worker still
+        has one; their next connect or rejoin restores them.
+        """
+        if not self.is_connected(user_id):
+            await self._send_room_changes(await self.game_rooms.mark_user(user_id, False))
+    
+    async def _send_room_changes(self, changes):
+        for room_id, (version, players) in changes:
+            await self.send_game_delta(room_id, version, {"players": players}, players)
     
-    async def connect(self, websocket: WebSocket, user_id: str):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
-        print(f"User {user_id} connected to WebSocket")
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
     
-    def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-            print(f"User {user_id} disconnected from WebSocket")
+    def start_heartbeat(self):
+        self._heartbeat = asyncio.create_task(self._sweep_periodically())
     
-    async def send_personal_message(self, message: str, user_id: str):
-        if user_id in self.active_connections:
+    async def stop_heartbeat(self):
+        if self._heartbeat:
+            self._heartbeat.cancel()
             try:
-                await self.active_connections[user_id].send_text(message)
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat = None
+    
+    async def _sweep_periodically(self):
+        while True:
+            await asyncio.sleep(settings.WS_PING_INTERVAL_SECONDS)
+            try:
+                self.sweep()
             except Exception as e:
-                print(f"Error sending message to {user_id}: {e}")
-                self.disconnect(user_id)
+                print(f"Websocket sweeper error: {e}")
     
-    async def broadcast_to_match(self, message: dict, match_id: str, sender_id: str):
-        from app.core.database import SessionLocal, Match
+    def sweep(self):
+        """Ping quiet sockets and reap the ones silent past WS_IDLE_TIMEOUT_SECONDS.
         
-        # Get match participants
-        db = SessionLocal()
-        try:
-            match = db.query(Match).filter(Match.id == match_id).first()
-            if match:
-                # Send to the other participant
-                recipient_id = match.user2_id if match.user1_id == sender_id else match.user1_id
-                
-                if recipient_id in self.active_connections:
-                    message_text = json.dumps({
-                        "type": "new_message",
-                        "match_id": match_id,
-                        "sender_id": sender_id,
-                        "content": message.get("content", ""),
-                        "timestamp": message.get("timestamp", ""),
-                        "message_type": message.get("message_type", "text")
-                    })
-                    await self.send_personal_message(message_text, recipient_id)
-        finally:
-            db.close()
+        Clients answer a ping with a pong; any inbound frame resets the
+        idle clock, so busy sockets are never pinged.
+        """
+        now = time.monotonic()
+        ping = Frame("ping", {})
+        reaped = 0
+        for devices in list(self.active_connections.values()):
+            for connection in list(devices.values()):
+                idle = now - connection.last_seen
+                if idle >= settings.WS_IDLE_TIMEOUT_SECONDS:
+                    connection.close(code=1001)
+                    reaped += 1
+                elif idle >= settings.WS_PING_INTERVAL_SECONDS:
+                    connection.enqueue(ping)
+                    self.metrics["pings_sent"] += 1
+        if reaped:
+            self.metrics["reaped_idle"] += reaped
+            print(f"Reaped {reaped} idle websocket connection(s)")
     
-    async def send_typing_indicator(self, match_id: str, sender_id: str, is_typing: bool):
-        from app.core.database import SessionLocal, Match
+    def stats(self) -> dict:
+        return {
+            "connections": self.connection_count,
+            "users": len(self.active_connections),
+            **self.metrics
+        }
+    
+    def is_connected(self, user_id: str) -> bool:
+        return user_id in self.active_connections
+    
+    async def send_local(self, message: Frame, user_id: str, event_seq: Optional[int] = None) -> bool:
+        """Queue a frame on each of the user's sockets on this worker; False if they have none"""
+        devices = self.active_connections.get(user_id)
+        if not devices:
+            return False
+        for connection in list(devices.values()):
+            connection.enqueue(message, event_seq)
+        return True
+    
+    async def send_personal_message(self, message: Frame, user_id: str):
+        if self.broker and message.type in REPLAYED_FRAME_TYPES:
+            # Sequenced and buffered for resume, then delivered everywhere
+            event_seq = await self.broker.publish_event(user_id, message)
+            await self.send_local(message, user_id, event_seq)
+            return
+        await self.send_local(message, user_id)
+        if self.broker:
+            # The user may have other devices on other workers
+            await self.broker.publish_to_user(user_id, message)
+    
+    async def send_to_users(self, message: Frame, user_ids: Iterable[str]):
+        """Fan one frame out to several users concurrently.
         
-        db = SessionLocal()
-        try:
-            match = db.query(Match).filter(Match.id == match_id).first()
-            if match:
-                recipient_id = match.user2_id if match.user1_id == sender_id else match.user1_id
-                
-                if recipient_id in self.active_connections:
-                    typing_message = json.dumps({
-                        "type": "typing_indicator",
-                        "match_id": match_id,
-                        "sender_id": sender_id,
-                        "is_typing": is_typing
-                    })
-                    await self.send_personal_message(typing_message, recipient_id)
-        finally:
-            db.close()
-    
-    async def send_game_update(self, room_id: str, game_data: dict):
+        The frame is encoded once per wire format; local sockets are only
+        enqueued onto.
+        """
+        await asyncio.gather(*(self.send_personal_message(message, user_id) for user_id in user_ids))
+    
+    async def recipient_for(self, match_id: str, sender_id: str) -> Optional[str]:
+        """The other participant of an active match, or None if sender_id isn't in it"""
+        participants = await self.participants.get(match_id)
+        if not participants or sender_id not in participants:
+            return None
+        return participants[1] if participants[0] == sender_id else participants[0]
+    
+    async def invalidate_match(self, match_id: str):
+        """Forget a deactivated match here and on every other worker"""
+        self.participants.invalidate(match_id)
+        if self.broker:
+            await self.broker.publish_match_invalidated(match_id)
+    
+    async def broadcast_to_match(self, message: dict, match_id: str, sender_id: str):
+        recipient_id = await self.recipient_for(match_id, sender_id)
+        if recipient_id:
+            await self.send_personal_message(Frame("new_message", {
+                "match_id": match_id,
+                "sender_id": sender_id,
+                "content": message.get("content", ""),
+                "timestamp": message.get("timestamp", ""),
+                "message_type": message.get("message_type", "text")
+            }), recipient_id)
+    
+    async def send_typing_indicator(self, match_id: str, sender_id: str, is_typing: bool):
+        recipient_id = await self.recipient_for(match_id, sender_id)
+        if recipient_id:
+            await self.send_personal_message(Frame("typing_indicator", {
+                "match_id": match_id,
+                "sender_id": sender_id,
+                "is_typing": is_typing
+            }), recipient_id)
+    
+    async def send_game_update(self, room_id: str, game_data: Optional[dict], payload: Optional[bytes] = None):
         """Send game update to all players in room"""
-        from app.api.routes.games import game_rooms
+        if not self.game_rooms:
+            return
         
-        if room_id in game_rooms:
-            room = game_rooms[room_id]
-            players = room.get('players', [])
-            
-            message = {
-                "type": "game_update",
-                "room_id": room_id,
-                "data": game_data
-            }
+        players = await self.game_rooms.player_ids(room_id)
+        if players:
+            message = Frame("game_update", {"room_id": room_id}, data=game_data, payload=payload)
             
-            for player in players:
-                player_id = player.get('id')
-                if player_id and player_id in self.active_connections:
-                    await self.send_personal_message(
-                        json.dumps(message), 
-                        player_id
-                    )
-    
-    async def send_voice_chat_signal(self, room_id: str, signal_data: dict, sender_id: str):
+            await self.send_to_users(message, players)
+    
+    async def send_game_delta(self, room_id: str, version: int, changes: dict, players: List[dict]):
+        """Send the fields of a room that changed, with its new version, to the room's players"""
+        message = Frame("game_delta", {"room_id": room_id, "version": version, "changes": changes})
+        await self.send_to_users(message, [player["id"] for player in players])
+    
+    async def send_voice_chat_signal(
+        self,
+        room_id: str,
+        signal_data: Optional[dict],
+        sender_id: str,
+        payload: Optional[bytes] = None
+    ):
         """Send voice chat signal to all players in room except sender"""
-        from app.api.routes.games import game_rooms
+        if not self.game_rooms:
+            return
         
-        if room_id in game_rooms:
-            room = game_rooms[room_id]
-            players = room.get('players', [])
-            
-            message = {
-                "type": "voice_chat_signal",
-                "room_id": room_id,
-                "data": signal_data
-            }
+        players = await self.game_rooms.player_ids(room_id)
+        recipients = [player_id for player_id in players if player_id != sender_id]
+        if recipients:
+            message = Frame("voice_chat_signal", {"room_id": room_id}, data=signal_data, payload=payload)
             
-            # Send to all players except sender
-            for player in players:
-                player_id = player.get('id')
-                if player_id and player_id != sender_id and player_id in self.active_connections:
-                    await self.send_personal_message(
-                        json.dumps(message), 
-                        player_id
-                    )
\ No newline at end of file
+            await self.send_to_users(message, recipients)
@@ -0,0 +1,221 @@
+import asyncio
+import msgpack
+import uuid
+from redis.exceptions import RedisError
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.services.ws_codec import Frame
+
+# Cross-worker websocket delivery over Redis pub/sub.
+#
+# Every worker subscribes to ws:user:{user_id} for each user with a socket
+# open on it. Frames are written to local sockets and also published to
+# that channel, since the user may have other devices connected elsewhere;
+# every worker holding one of their sockets writes it out. Envelopes carry
+# the publishing worker's id so a worker never re-delivers its own frames.
+# Envelopes are MessagePack so opaque relay payloads cross workers as bytes. If Redis is unavailable delivery degrades to local-only.
+# Match deactivations are announced on ws:match-invalidated so every worker
+# drops the match from its participant cache.
+#
+# Events worth replaying after a reconnect also get a per-user sequence
+# number and go into a capped Redis stream, ws:events:{user_id}, with stream
+# id "{seq}-0". One Lua call assigns the sequence, appends to the stream and
+# publishes, so every worker sees events in sequence order. A reconnecting
+# client passes its last seen sequence and is replayed whatever it missed,
+# or told to resync if the stream no longer reaches back that far.
+#
+# Messages on user channels are "{seq}|{envelope}" (seq empty when the
+# frame isn't sequenced).
+
+USER_CHANNEL_PREFIX = "ws:user:"
+MATCH_INVALIDATED_CHANNEL = "ws:match-invalidated"
+
+_PUBLISH_EVENT = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[1], seq .. '-0', 'f', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+redis.call('PUBLISH', ARGV[4], seq .. '|' .. ARGV[5])
+return seq
+"""
+
+def user_channel(user_id: str) -> str:
+    return f"{USER_CHANNEL_PREFIX}{user_id}"
+
+def _event_keys(user_id: str) -> List[str]:
+    return [f"ws:event-seq:{user_id}", f"ws:events:{user_id}"]
+
+class WebSocketBroker:
+    """Routes websocket frames to users connected to other workers"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.worker_id = uuid.uuid4().hex
+        self.pubsub = redis.pubsub()
+        self._publish_event = redis.register_script(_PUBLISH_EVENT)
+        self._deliver_local: Optional[Callable[[Frame, str, Optional[int]], Awaitable[None]]] = None
+        self._invalidate_match: Optional[Callable[[str], None]] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Task] = set()
+
+    async def start(
+        self,
+        deliver_local: Callable[[Frame, str, Optional[int]], Awaitable[None]],
+        invalidate_match: Optional[Callable[[str], None]] = None
+    ):
+        """Begin relaying frames published for local users to ``deliver_local(frame, user_id, event_seq)``
+        and match deactivations from other workers to ``invalidate_match(match_id)``.
+        """
+        self._deliver_local = deliver_local
+        self._invalidate_match = invalidate_match
+        if invalidate_match:
+            try:
+                await self.pubsub.subscribe(MATCH_INVALIDATED_CHANNEL)
+            except (RedisError, OSError) as e:
+                print(f"Broker subscribe failed for match invalidations: {e}")
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        try:
+            await self.pubsub.aclose()
+        except (RedisError, OSError):
+            pass
+
+    async def subscribe_user(self, user_id: str):
+        """Called when a user's first device connects to this worker"""
+        try:
+            await self.pubsub.subscribe(user_channel(user_id))
+        except (RedisError, OSError) as e:
+            print(f"Broker subscribe failed for {user_id}: {e}")
+
+    def release_user(self, user_id: str, is_connected: Callable[[str], bool]):
+        """Called when a user's last device on this worker disconnects; unsubscribes in the background.
+
+        ``is_connected`` is checked again when the task runs so a quick
+        reconnect keeps its subscription.
+        """
+        async def unsubscribe():
+            if is_connected(user_id):
+                return
+            try:
+                await self.pubsub.unsubscribe(user_channel(user_id))
+            except (RedisError, OSError) as e:
+                print(f"Broker unsubscribe failed for {user_id}: {e}")
+
+        task = asyncio.get_running_loop().create_task(unsubscribe())
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def publish_to_user(self, user_id: str, frame: Frame) -> int:
+        """Publish a frame for the user's devices on other workers; returns the number of subscribed workers"""
+        try:
+            return await self.redis.publish(user_channel(user_id), b"|" + self._envelope(frame))
+        except (RedisError, OSError) as e:
+            print(f"Broker publish failed for {user_id}: {e}")
+            return 0
+
+    async def publish_event(self, user_id: str, frame: Frame) -> Optional[int]:
+        """Sequence, buffer and publish a replayable event; returns its sequence, None if Redis failed"""
+        try:
+            return await self._publish_event(
+                keys=_event_keys(user_id),
+                args=[
+                    settings.WS_REPLAY_BUFFER_SIZE,
+                    msgpack.packb(frame.to_wire()),
+                    settings.WS_REPLAY_TTL_SECONDS,
+                    user_channel(user_id),
+                    self._envelope(frame)
+                ]
+            )
+        except (RedisError, OSError) as e:
+            print(f"Broker event publish failed for {user_id}: {e}")
+            return None
+
+    async def replay(self, user_id: str, after_seq: int) -> Tuple[Optional[List[Tuple[int, Frame]]], int]:
+        """Events after ``after_seq`` as [(seq, frame)] plus the current sequence.
+
+        The list is None when they can't all be replayed: the buffer rolled
+        over or expired, or Redis is unavailable.
+        """
+        seq_key, stream_key = _event_keys(user_id)
+        try:
+            current = int(await self.redis.get(seq_key) or 0)
+            if current <= after_seq:
+                # Nothing missed, or the sequence was reset after expiring
+                return ([] if current == after_seq else None), current
+            entries = await self.redis.xrange(stream_key, min=f"{after_seq + 1}-0")
+        except (RedisError, OSError) as e:
+            print(f"Broker replay failed for {user_id}: {e}")
+            return None, 0
+
+        events = []
+        for entry_id, fields in entries:
+            if isinstance(entry_id, bytes):
+                entry_id = entry_id.decode()
+            events.append((int(entry_id.split("-")[0]), Frame.from_wire(msgpack.unpackb(fields[b"f"]))))
+        if not events or events[0][0] != after_seq + 1:
+            return None, current
+        return events, current
+
+    def _envelope(self, frame: Frame) -> bytes:
+        return msgpack.packb({"origin": self.worker_id, "frame": frame.to_wire()})
+
+    async def publish_match_invalidated(self, match_id: str):
+        try:
+            await self.redis.publish(
+                MATCH_INVALIDATED_CHANNEL,
+                msgpack.packb({"origin": self.worker_id, "match_id": match_id})
+            )
+        except (RedisError, OSError) as e:
+            print(f"Broker publish failed for match {match_id}: {e}")
+
+    async def _listen(self):
+        while True:
+            try:
+                if not self.pubsub.subscribed:
+                    await asyncio.sleep(0.1)
+                    continue
+                event = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except (RedisError, OSError) as e:
+                # The pubsub connection resubscribes its channels on reconnect
+                print(f"Broker listener error: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            if not event or event.get("type") != "message":
+                continue
+
+            channel = event["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            data = event["data"]
+            event_seq = None
+            try:
+                if channel != MATCH_INVALIDATED_CHANNEL:
+                    seq, data = data.split(b"|", 1)
+                    event_seq = int(seq) if seq else None
+                envelope = msgpack.unpackb(data)
+            except (TypeError, ValueError, msgpack.UnpackException):
+                continue
+            if envelope.get("origin") == self.worker_id:
+                continue
+
+            try:
+                if channel == MATCH_INVALIDATED_CHANNEL:
+                    self._invalidate_match(envelope["match_id"])
+                else:
+                    await self._deliver_local(
+                        Frame.from_wire(envelope["frame"]), channel[len(USER_CHANNEL_PREFIX):], event_seq
+                    )
+            except Exception as e:
+                print(f"Broker delivery error: {e}")
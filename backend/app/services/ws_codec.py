@@ -0,0 +1,173 @@
+import json
+import msgpack
+from fastapi import WebSocket, WebSocketDisconnect
+from typing import Any, Dict, Optional, Tuple, Union
+
+# Websocket wire formats, negotiated per connection via Sec-WebSocket-Protocol.
+#
+#   amora.json     (default) text frames: {"type": ..., **fields, "data": {...}}
+#   amora.msgpack  binary frames: [type_tag, fields] or, for relayed events,
+#                  [type_tag, fields, payload] where payload is the event data
+#                  as an embedded MessagePack blob
+#
+# Events kept in the per-user replay buffer also carry the user's event
+# sequence: an "event_seq" member in JSON, a fourth array element (after a
+# nil payload if there is none) in MessagePack.
+#
+# The server never needs to look inside signaling, game and voice chat data,
+# so a payload from a msgpack client is kept as bytes and forwarded to other
+# msgpack clients as-is. It is only decoded when a JSON client receives it.
+
+JSON_SUBPROTOCOL = "amora.json"
+MSGPACK_SUBPROTOCOL = "amora.msgpack"
+
+FRAME_TAGS = {
+    "new_message": 1,
+    "message_ack": 2,
+    "message_error": 3,
+    "typing": 4,
+    "typing_indicator": 5,
+    "signaling": 6,
+    "game_update": 7,
+    "voice_chat_signal": 8,
+    "ping": 9,
+    "pong": 10,
+    "new_match": 11,
+    "resync_required": 12,
+    "game_delta": 13,
+    "quick_match": 14,
+    "signaling_batch": 15,
+}
+FRAME_TYPES = {tag: frame_type for frame_type, tag in FRAME_TAGS.items()}
+
+# Signaling has always reached JSON clients as the bare signaling data
+_BARE_JSON_TYPES = {"signaling"}
+
+class FrameDecodeError(ValueError):
+    """An inbound frame that isn't valid for either wire format; skip it"""
+
+class Frame:
+    """An outbound event, encoded at most once per wire format.
+
+    ``data`` (a dict) or ``payload`` (the same data as a MessagePack blob)
+    carries relayed event data; whichever form arrived is forwarded.
+    """
+    __slots__ = ("type", "fields", "data", "payload", "_encoded")
+
+    def __init__(
+        self,
+        frame_type: str,
+        fields: Dict[str, Any],
+        data: Optional[Dict[str, Any]] = None,
+        payload: Optional[bytes] = None
+    ):
+        self.type = frame_type
+        self.fields = fields
+        self.data = data
+        self.payload = payload
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+
+    @property
+    def relayed(self) -> bool:
+        return self.data is not None or self.payload is not None
+
+    def _data(self) -> Dict[str, Any]:
+        if self.data is None and self.payload is not None:
+            self.data = msgpack.unpackb(self.payload)
+        return self.data or {}
+
+    def encode(self, subprotocol: str, event_seq: Optional[int] = None) -> Union[str, bytes]:
+        encoded = self._encoded.get(subprotocol)
+        if encoded is None:
+            if subprotocol == MSGPACK_SUBPROTOCOL:
+                encoded = self._encode_msgpack()
+            else:
+                encoded = self._encode_json()
+            self._encoded[subprotocol] = encoded
+        if event_seq is None:
+            return encoded
+
+        # Splice the per-recipient sequence into the shared encoding
+        if subprotocol == MSGPACK_SUBPROTOCOL:
+            body = encoded[1:] if encoded[0] == 0x93 else encoded[1:] + b"\xc0"
+            return b"\x94" + body + msgpack.packb(event_seq)
+        if encoded == "{}":
+            return f'{{"event_seq": {event_seq}}}'
+        return f'{encoded[:-1]}, "event_seq": {event_seq}}}'
+
+    def _encode_json(self) -> str:
+        if self.type in _BARE_JSON_TYPES:
+            return json.dumps({**self._data(), **self.fields})
+        body = {"type": self.type, **self.fields}
+        if self.relayed:
+            body["data"] = self._data()
+        return json.dumps(body)
+
+    def _encode_msgpack(self) -> bytes:
+        tag = FRAME_TAGS[self.type]
+        if not self.relayed:
+            return msgpack.packb([tag, self.fields])
+        if self.payload is None:
+            self.payload = msgpack.packb(self.data)
+        return msgpack.packb([tag, self.fields, self.payload])
+
+    def to_wire(self) -> list:
+        """Compact form for the cross-worker broker"""
+        return [self.type, self.fields, self.data if self.payload is None else None, self.payload]
+
+    @classmethod
+    def from_wire(cls, wire: list) -> "Frame":
+        return cls(*wire)
+
+def negotiate_subprotocol(websocket: WebSocket) -> Tuple[str, Optional[str]]:
+    """Pick the wire format from the client's offer: (format, subprotocol to echo back)"""
+    offered = websocket.scope.get("subprotocols") or []
+    if MSGPACK_SUBPROTOCOL in offered:
+        return MSGPACK_SUBPROTOCOL, MSGPACK_SUBPROTOCOL
+    if JSON_SUBPROTOCOL in offered:
+        return JSON_SUBPROTOCOL, JSON_SUBPROTOCOL
+    return JSON_SUBPROTOCOL, None
+
+async def receive_frame(websocket: WebSocket) -> Tuple[Optional[str], Dict[str, Any], Optional[Dict[str, Any]], Optional[bytes]]:
+    """Read one inbound event as (type, fields, data, payload).
+
+    Text frames are JSON and binary frames MessagePack, whatever was
+    negotiated. For JSON the "data" member is split out of the fields; for
+    MessagePack the payload blob is returned undecoded. Raises
+    FrameDecodeError for a frame that can't be decoded or has an unknown type.
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+
+    if message.get("bytes") is not None:
+        return decode_msgpack_frame(message["bytes"])
+    return decode_json_frame(message.get("text") or "")
+
+def decode_msgpack_frame(raw: bytes) -> Tuple[str, Dict[str, Any], None, Optional[bytes]]:
+    try:
+        decoded = msgpack.unpackb(raw)
+    except (ValueError, TypeError, msgpack.UnpackException) as e:
+        raise FrameDecodeError(f"Invalid msgpack frame: {e}")
+    if not isinstance(decoded, list) or not 2 <= len(decoded) <= 3 or not isinstance(decoded[1], dict):
+        raise FrameDecodeError("Malformed msgpack frame")
+    frame_type = FRAME_TYPES.get(decoded[0]) if isinstance(decoded[0], int) else None
+    if frame_type is None:
+        raise FrameDecodeError(f"Unknown frame tag {decoded[0]!r}")
+    payload = decoded[2] if len(decoded) > 2 else None
+    if payload is not None and not isinstance(payload, bytes):
+        raise FrameDecodeError("Frame payload must be a msgpack blob")
+    return frame_type, decoded[1], None, payload
+
+def decode_json_frame(text: str) -> Tuple[str, Dict[str, Any], Optional[Dict[str, Any]], None]:
+    try:
+        fields = json.loads(text)
+    except ValueError as e:
+        raise FrameDecodeError(f"Invalid JSON frame: {e}")
+    if not isinstance(fields, dict):
+        raise FrameDecodeError("Malformed JSON frame")
+    frame_type = fields.pop("type", None)
+    if frame_type not in FRAME_TAGS:
+        raise FrameDecodeError(f"Unknown frame type {frame_type!r}")
+    data = fields.pop("data", None)
+    return frame_type, fields, data if isinstance(data, dict) else None, None
@@ -0,0 +1,141 @@
+"""Message search benchmark.
+
+Builds a synthetic chat corpus (1,000,000 messages by default) in a
+throwaway SQLite database with the real search trigger installed, then
+compares full-text search against a ``LIKE '%q%'`` scan for users scoped to
+their own matches.
+
+    cd backend
+    python -m benchmarks.message_search_benchmark --messages 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+VOCABULARY = (
+    "hey hi hello good morning night coffee tea dinner lunch movie music song "
+    "weekend plans today tomorrow travel beach mountain city park walk run gym "
+    "book read game play dog cat pizza pasta sushi chai biryani dance party "
+    "work office college exam study trip photo smile laugh funny cute sweet "
+    "call later soon busy free maybe sure yes no okay great awesome love like"
+).split()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--matches-per-user", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--db", help="SQLite file to use (default: a temp file)")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def report(label, samples):
+    print(
+        f"{label:<14} p50 {percentile(samples, 50) * 1000:8.2f} ms   "
+        f"p99 {percentile(samples, 99) * 1000:8.2f} ms   "
+        f"mean {statistics.mean(samples) * 1000:8.2f} ms"
+    )
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="amora-search-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from sqlalchemy import text
+    from app.core.database import engine, SessionLocal, Match, Message
+    from app.services.message_search import ensure_search_index, search_messages
+
+    Match.__table__.create(engine, checkfirst=True)
+    Message.__table__.create(engine, checkfirst=True)
+    ensure_search_index(engine)
+
+    users = [str(uuid.uuid4()) for _ in range(args.users)]
+    match_count = args.users * args.matches_per_user // 2
+    matches = [
+        (str(uuid.uuid4()), random.choice(users), random.choice(users))
+        for _ in range(match_count)
+    ]
+    with engine.begin() as conn:
+        conn.execute(Match.__table__.insert(), [
+            {"id": match_id, "user1_id": u1, "user2_id": u2, "is_active": True,
+             "last_seq": 0, "user1_read_seq": 0, "user2_read_seq": 0}
+            for match_id, u1, u2 in matches
+        ])
+
+    print(f"Inserting {args.messages:,} messages across {match_count:,} matches into {db_path}")
+    seqs = {}
+    started = datetime.utcnow() - timedelta(days=365)
+    insert_start = time.perf_counter()
+    batch = []
+    for i in range(args.messages):
+        match_id, u1, u2 = random.choice(matches)
+        seqs[match_id] = seqs.get(match_id, 0) + 1
+        batch.append({
+            "id": str(uuid.uuid4()),
+            "match_id": match_id,
+            "seq": seqs[match_id],
+            "sender_id": random.choice((u1, u2)),
+            "content": " ".join(random.choices(VOCABULARY, k=random.randint(3, 14))),
+            "message_type": "text",
+            "is_read": True,
+            "created_at": started + timedelta(seconds=i * 30)
+        })
+        if len(batch) == 10_000:
+            with engine.begin() as conn:
+                conn.execute(Message.__table__.insert(), batch)
+            batch = []
+    if batch:
+        with engine.begin() as conn:
+            conn.execute(Message.__table__.insert(), batch)
+    insert_elapsed = time.perf_counter() - insert_start
+    print(f"Inserted in {insert_elapsed:.1f}s ({args.messages / insert_elapsed:,.0f} msg/s, index maintained by trigger)")
+
+    user_matches = {}
+    for match_id, u1, u2 in matches:
+        user_matches.setdefault(u1, []).append(match_id)
+        user_matches.setdefault(u2, []).append(match_id)
+    searchers = [user for user in user_matches if user_matches[user]]
+
+    fts_samples, like_samples = [], []
+    db = SessionLocal()
+    try:
+        for _ in range(args.queries):
+            match_ids = user_matches[random.choice(searchers)]
+            word = random.choice(VOCABULARY)
+
+            t0 = time.perf_counter()
+            search_messages(db, match_ids, word, limit=20)
+            fts_samples.append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            placeholders = ", ".join(f":m{i}" for i in range(len(match_ids)))
+            db.execute(text(f"""
+                SELECT id, match_id, content FROM messages
+                WHERE match_id IN ({placeholders}) AND content LIKE :pattern
+                ORDER BY created_at DESC LIMIT 21
+            """), {"pattern": f"%{word}%", **{f"m{i}": m for i, m in enumerate(match_ids)}}).fetchall()
+            like_samples.append(time.perf_counter() - t0)
+
+        print(f"\n{args.queries} single-word searches, scoped to one user's matches:")
+        report("full-text", fts_samples)
+        report("LIKE scan", like_samples)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
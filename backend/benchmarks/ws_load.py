@@ -0,0 +1,373 @@
+"""Websocket load and soak benchmark.
+
+Seeds users, matches and game rooms, starts the app under a local uvicorn
+(or targets one already running), then opens ``--clients`` simulated
+clients on ``/ws/{user_id}?token=...``. Clients are paired through a match and
+grouped four to a game room, and each one sends ``new_message``,
+``signaling`` and ``game_update`` frames at the configured per-client
+rates. Every frame carries its send time, so receivers measure delivery
+latency end to end.
+
+Reports p50/p99 delivery latency per frame type, sent and delivered
+throughput, and the server's RSS sampled over the run (Linux /proc).
+
+    cd backend
+    python -m benchmarks.ws_load --clients 2000 --duration 60
+    python -m benchmarks.ws_load --clients 5000 --duration 1800 --workers 4 --database-url postgresql:///amora_bench
+
+The default temp SQLite database serializes every write behind one file
+lock, so it is only good for a single-worker smoke run; ``--workers`` above
+1 requires ``--database-url`` pointing at a real server.
+
+To target a server you started yourself, pass ``--url`` together with the
+``--database-url`` and ``--secret-key`` that server uses, so the seeded
+users and tokens are valid for it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds after ramp-up")
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--message-rate", type=float, default=0.2, help="new_message frames/s per client")
+    parser.add_argument("--signaling-rate", type=float, default=0.5, help="signaling frames/s per client")
+    parser.add_argument("--game-rate", type=float, default=0.5, help="game_update frames/s per client")
+    parser.add_argument("--subprotocol", choices=("amora.json", "amora.msgpack"), default="amora.json")
+    parser.add_argument("--connect-concurrency", type=int, default=200)
+    parser.add_argument("--sample-interval", type=float, default=10, help="seconds between RSS/throughput samples")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the local server")
+    parser.add_argument("--url", help="base URL of a running server, e.g. http://127.0.0.1:8000")
+    parser.add_argument("--server-pid", type=int, help="pid to sample RSS from when using --url")
+    parser.add_argument("--database-url", help="database to seed (default: a temp SQLite file)")
+    parser.add_argument("--secret-key", default="ws-load-benchmark")
+    parser.add_argument("--redis-url", default=os.environ.get("REDIS_URL", "redis://localhost:6379"))
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    if args.workers > 1 and not args.database_url and not args.url:
+        parser.error("--workers above 1 needs --database-url; the temp SQLite default is for smoke runs only")
+    return args
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def rss_bytes(pid):
+    """Resident memory of a process and its children (uvicorn workers), from /proc"""
+    children = defaultdict(list)
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+                children[ppid].append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+def seed(args, user_count):
+    """Create users, pair them into matches; returns (user_ids, partner_of, tokens)"""
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["SECRET_KEY"] = args.secret_key
+    sys.path.insert(0, BACKEND_DIR)
+
+    from app.core.database import Base, engine, Match
+    from app.models.user import User
+    from app.api.routes.auth import create_access_token
+
+    for table in Base.metadata.sorted_tables:
+        try:
+            table.create(engine, checkfirst=True)
+        except Exception:
+            pass
+
+    run = uuid.uuid4().hex[:8]
+    user_ids = [str(uuid.uuid4()) for _ in range(user_count)]
+    partner_of = {}
+    matches = []
+    for a, b in zip(user_ids[0::2], user_ids[1::2]):
+        match_id = str(uuid.uuid4())
+        partner_of[a] = (b, match_id)
+        partner_of[b] = (a, match_id)
+        matches.append({"id": match_id, "user1_id": a, "user2_id": b, "is_active": True})
+
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"id": user_id, "email": f"ws-{run}-{i}@bench.local", "hashed_password": "x",
+             "name": f"bench{i}", "age": 25, "gender": "other", "photos": "[]"}
+            for i, user_id in enumerate(user_ids)
+        ])
+        conn.execute(Match.__table__.insert(), matches)
+
+    lifetime = timedelta(seconds=args.warmup + args.duration + 3600)
+    tokens = {user_id: create_access_token({"sub": user_id}, lifetime) for user_id in user_ids}
+    return user_ids, partner_of, tokens
+
+def start_server(args):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    env = dict(os.environ, DATABASE_URL=args.database_url, SECRET_KEY=args.secret_key, REDIS_URL=args.redis_url)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL
+    )
+    return server, f"http://127.0.0.1:{port}"
+
+async def wait_healthy(http, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await http.get("/health")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("Server did not become healthy")
+
+async def create_rooms(http, user_ids, tokens):
+    """Groups of four users share a room; returns user_id -> room_id"""
+    room_of = {}
+    for start in range(0, len(user_ids), 4):
+        group = user_ids[start:start + 4]
+        response = await http.post("/api/games/rooms/create", headers={"Authorization": f"Bearer {tokens[group[0]]}"})
+        room_id = response.json()["room_id"]
+        for user_id in group[1:]:
+            await http.post(f"/api/games/rooms/{room_id}/join", headers={"Authorization": f"Bearer {tokens[user_id]}"})
+        for user_id in group:
+            room_of[user_id] = room_id
+    return room_of
+
+class Stats:
+    def __init__(self):
+        self.measuring = False
+        self.sent = defaultdict(int)
+        self.delivered = defaultdict(int)
+        self.latencies = defaultdict(list)
+        self.errors = 0
+        self.connected = 0
+
+    def record(self, kind, sent_ns):
+        if self.measuring:
+            self.delivered[kind] += 1
+            self.latencies[kind].append((time.time_ns() - sent_ns) / 1e6)
+
+class Client:
+    def __init__(self, args, base_ws, user_id, token, partner_id, match_id, room_id, stats):
+        self.args = args
+        self.url = f"{base_ws}/ws/{user_id}?token={token}"
+        self.user_id = user_id
+        self.partner_id = partner_id
+        self.match_id = match_id
+        self.room_id = room_id
+        self.stats = stats
+        self.msgpack = args.subprotocol == "amora.msgpack"
+
+    def encode(self, frame_type, fields, data=None):
+        if self.msgpack:
+            from app.services.ws_codec import FRAME_TAGS
+            frame = [FRAME_TAGS[frame_type], fields]
+            if data is not None:
+                frame.append(self.packb(data))
+            return self.packb(frame)
+        body = {"type": frame_type, **fields}
+        if data is not None:
+            body["data"] = data
+        return json.dumps(body)
+
+    def decode(self, raw):
+        """Returns (type, fields, data)"""
+        if self.msgpack:
+            from app.services.ws_codec import FRAME_TYPES
+            frame = self.unpackb(raw)
+            payload = frame[2] if len(frame) > 2 else None
+            return FRAME_TYPES.get(frame[0]), frame[1], self.unpackb(payload) if payload else None
+        body = json.loads(raw)
+        if "type" not in body or body.get("type") in ("offer", "answer", "ice-candidate", "bench"):
+            # Signaling arrives as the bare signaling data
+            return "signaling", {}, body
+        return body.pop("type"), body, body.pop("data", None)
+
+    async def run(self, connect_gate, stop):
+        import msgpack
+        import websockets
+        self.packb, self.unpackb = msgpack.packb, msgpack.unpackb
+
+        async with connect_gate:
+            try:
+                ws = await websockets.connect(
+                    self.url, subprotocols=[self.args.subprotocol], max_size=None, ping_interval=None
+                )
+            except Exception:
+                self.stats.errors += 1
+                return
+        self.stats.connected += 1
+        try:
+            await asyncio.gather(
+                self.receive(ws, stop),
+                self.send_loop(ws, stop, "new_message", self.args.message_rate),
+                self.send_loop(ws, stop, "signaling", self.args.signaling_rate),
+                self.send_loop(ws, stop, "game_update", self.args.game_rate),
+            )
+        finally:
+            await ws.close()
+
+    async def send_loop(self, ws, stop, kind, rate):
+        if rate <= 0:
+            return
+        while not stop.is_set():
+            await asyncio.sleep(random.expovariate(rate))
+            ts = time.time_ns()
+            if kind == "new_message":
+                frame = self.encode("new_message", {"match_id": self.match_id, "content": f"bench {ts}"})
+            elif kind == "signaling":
+                if self.msgpack:
+                    frame = self.encode("signaling", {"to": self.partner_id}, {"type": "bench", "ts": ts})
+                else:
+                    frame = self.encode("signaling", {}, {"type": "bench", "to": self.partner_id, "ts": ts})
+            else:
+                frame = self.encode("game_update", {"room_id": self.room_id}, {"from": self.user_id, "ts": ts})
+            try:
+                await ws.send(frame)
+            except Exception:
+                self.stats.errors += 1
+                return
+            if self.stats.measuring:
+                self.stats.sent[kind] += 1
+
+    async def receive(self, ws, stop):
+        while not stop.is_set():
+            try:
+                raw = await asyncio.wait_for(ws.recv(), timeout=1)
+            except asyncio.TimeoutError:
+                continue
+            except Exception:
+                self.stats.errors += 1
+                return
+            frame_type, fields, data = self.decode(raw)
+            if frame_type == "ping":
+                await ws.send(self.encode("pong", {}))
+            elif frame_type == "new_message" and fields.get("sender_id") == self.partner_id:
+                self.stats.record("new_message", int(fields["content"].split()[1]))
+            elif frame_type == "signaling" and data:
+                self.stats.record("signaling", data["ts"])
+            elif frame_type == "game_update" and data and data.get("from") != self.user_id:
+                self.stats.record("game_update", data["ts"])
+
+def report(stats, elapsed, rss_samples):
+    print(f"\n{stats.connected} clients connected, {stats.errors} errors, {elapsed:.0f}s measured")
+    print(f"{'frame':<13} {'sent/s':>9} {'delivered/s':>12} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for kind in ("new_message", "signaling", "game_update"):
+        samples = stats.latencies[kind]
+        if not samples and not stats.sent[kind]:
+            continue
+        p50 = percentile(samples, 50) if samples else float("nan")
+        p99 = percentile(samples, 99) if samples else float("nan")
+        print(
+            f"{kind:<13} {stats.sent[kind] / elapsed:9.0f} {stats.delivered[kind] / elapsed:12.0f} "
+            f"{p50:9.2f} {p99:9.2f} {max(samples, default=float('nan')):9.2f}"
+        )
+    if rss_samples:
+        first, last = rss_samples[0][1], rss_samples[-1][1]
+        peak = max(rss for _, rss in rss_samples)
+        print(
+            f"\nServer RSS: start {first / 2**20:.1f} MB, end {last / 2**20:.1f} MB, "
+            f"peak {peak / 2**20:.1f} MB, growth {(last - first) / 2**20:+.1f} MB"
+        )
+
+async def main_async(args):
+    import httpx
+
+    random.seed(args.seed)
+    user_count = args.clients - args.clients % 2
+    user_ids, partner_of, tokens = seed(args, user_count)
+    print(f"Seeded {user_count:,} users and {user_count // 2:,} matches into {args.database_url}")
+
+    server = None
+    base_url = args.url
+    server_pid = args.server_pid
+    if not base_url:
+        server, base_url = start_server(args)
+        server_pid = server.pid
+
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as http:
+            await wait_healthy(http)
+            room_of = await create_rooms(http, user_ids, tokens)
+
+        stats = Stats()
+        stop = asyncio.Event()
+        gate = asyncio.Semaphore(args.connect_concurrency)
+        base_ws = base_url.replace("http", "ws", 1)
+        ramp_start = time.monotonic()
+        tasks = [
+            asyncio.create_task(Client(
+                args, base_ws, user_id, tokens[user_id], partner_of[user_id][0], partner_of[user_id][1], room_of[user_id], stats
+            ).run(gate, stop))
+            for user_id in user_ids
+        ]
+        while stats.connected + stats.errors < len(tasks) and time.monotonic() - ramp_start < 120:
+            await asyncio.sleep(0.2)
+        print(f"Connected {stats.connected:,} clients in {time.monotonic() - ramp_start:.1f}s; warming up {args.warmup:.0f}s")
+        await asyncio.sleep(args.warmup)
+
+        rss_samples = []
+        stats.measuring = True
+        measure_start = time.monotonic()
+        last_delivered = 0
+        print(f"{'elapsed':>8} {'delivered/s':>12} {'rss MB':>9}")
+        while time.monotonic() - measure_start < args.duration:
+            await asyncio.sleep(min(args.sample_interval, args.duration - (time.monotonic() - measure_start)))
+            elapsed = time.monotonic() - measure_start
+            delivered = sum(stats.delivered.values())
+            rss = rss_bytes(server_pid) if server_pid else 0
+            if server_pid:
+                rss_samples.append((elapsed, rss))
+            print(f"{elapsed:8.0f} {(delivered - last_delivered) / args.sample_interval:12.0f} {rss / 2**20:9.1f}")
+            last_delivered = delivered
+        elapsed = time.monotonic() - measure_start
+        stats.measuring = False
+
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        report(stats, elapsed, rss_samples)
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+
+def main():
+    args = parse_args()
+    if not args.database_url:
+        args.database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='amora-ws-'), 'bench.db')}"
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,33 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, HTMLResponse
 import redis.asyncio as redis
 from contextlib import asynccontextmanager
-import json
-from typing import Dict, List
-from datetime import datetime
+import asyncio
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+from sqlalchemy import or_
 
 from app.core.config import settings
-from app.core.database import engine, Base
+from app.core.database import engine, Base, SessionLocal, Match, CallHistory
+from app.api.routes.auth import decode_user_id
 from app.api.routes import auth, users, swipes, matches, messages, upload, notifications, emergency, support, features, verification, feed, games, calls, signaling, boost
 from app.services.websocket_manager import ConnectionManager
+from app.services.ws_broker import WebSocketBroker
+from app.services.typing_indicator import TypingIndicators
+from app.services.game_rooms import GameRoomError, create_game_room_store, sweep_rooms_periodically
+from app.services.room_actors import RoomActors
+from app.services.quick_match import QuickMatchScheduler
+from app.services.signaling_relay import SignalingRelay
+from app.services.call_registry import CallRegistry, persist_calls_periodically
+from app.services.reverse_geocoder import ReverseGeocoder
+from app.services.ws_codec import Frame, FrameDecodeError, receive_frame
+from app.services.unread_counter import UnreadCounter
+from app.services.inbox_cache import InboxCache
+from app.services.message_pipeline import MessagePipeline
+from app.services.message_search import ensure_search_index
+from app.services.message_archiver import archive_periodically
 
 # Create tables
 try:
@@ -73,19 +89,155 @@ try:
         except Exception as e:
             print(f"Error checking/adding columns: {e}")
         
+        # Per-match message sequence numbers and read watermarks
+        try:
+            result = conn.execute(text("PRAGMA table_info(matches)"))
+            match_columns = [row[1] for row in result.fetchall()]
+            
+            for column in ("last_seq", "user1_read_seq", "user2_read_seq", "archived_seq"):
+                if column not in match_columns:
+                    conn.execute(text(f"ALTER TABLE matches ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0"))
+                    print(f"✅ Added {column} column")
+            
+            result = conn.execute(text("PRAGMA table_info(messages)"))
+            message_columns = [row[1] for row in result.fetchall()]
+            
+            if 'seq' not in message_columns:
+                conn.execute(text("ALTER TABLE messages ADD COLUMN seq INTEGER"))
+                # Number existing messages in send order within each match
+                conn.execute(text("""
+                    UPDATE messages SET seq = (
+                        SELECT COUNT(*) FROM messages AS earlier
+                        WHERE earlier.match_id = messages.match_id
+                        AND (earlier.created_at < messages.created_at
+                             OR (earlier.created_at = messages.created_at AND earlier.id <= messages.id))
+                    )
+                """))
+                conn.execute(text("""
+                    UPDATE matches SET last_seq = COALESCE(
+                        (SELECT MAX(seq) FROM messages WHERE messages.match_id = matches.id), 0
+                    )
+                """))
+                conn.execute(text(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS ix_messages_match_seq ON messages (match_id, seq)"
+                ))
+                print("✅ Added message sequence numbers")
+                
+        except Exception as e:
+            print(f"Error adding message sequence columns: {e}")
+        
+        # Sort keys for the sorted match list
+        try:
+            result = conn.execute(text("PRAGMA table_info(matches)"))
+            match_columns = [row[1] for row in result.fetchall()]
+            
+            if 'is_super_like' not in match_columns:
+                conn.execute(text("ALTER TABLE matches ADD COLUMN is_super_like BOOLEAN NOT NULL DEFAULT FALSE"))
+                conn.execute(text("""
+                    UPDATE matches SET is_super_like = EXISTS (
+                        SELECT 1 FROM swipes WHERE swipes.is_super_like = 1 AND (
+                            (swipes.swiper_id = matches.user1_id AND swipes.swiped_id = matches.user2_id)
+                            OR (swipes.swiper_id = matches.user2_id AND swipes.swiped_id = matches.user1_id)
+                        )
+                    )
+                """))
+                print("✅ Added is_super_like column")
+            
+            if 'activity_score' not in match_columns:
+                conn.execute(text("ALTER TABLE matches ADD COLUMN activity_score FLOAT NOT NULL DEFAULT 0"))
+                # Replay recent messages; older ones have decayed to nothing
+                window = timedelta(hours=settings.ACTIVITY_WINDOW_HOURS)
+                rows = conn.execute(text("""
+                    SELECT match_id, created_at FROM messages
+                    WHERE created_at >= :since ORDER BY match_id, created_at
+                """), {"since": datetime.utcnow() - 20 * window}).fetchall()
+                scores = {}
+                for match_id, created_at in rows:
+                    if isinstance(created_at, str):
+                        created_at = datetime.fromisoformat(created_at)
+                    match = scores.setdefault(match_id, Match(activity_score=0.0))
+                    match.record_activity(created_at)
+                for match_id, match in scores.items():
+                    conn.execute(
+                        text("UPDATE matches SET activity_score = :score WHERE id = :id"),
+                        {"score": match.activity_score, "id": match_id}
+                    )
+                print("✅ Added activity_score column")
+            
+            if 'ended_by_block' not in match_columns:
+                conn.execute(text("ALTER TABLE matches ADD COLUMN ended_by_block BOOLEAN NOT NULL DEFAULT FALSE"))
+                print("✅ Added ended_by_block column")
+            
+            for index in Match.__table__.indexes:
+                index.create(conn, checkfirst=True)
+        
+        except Exception as e:
+            print(f"Error adding match sort columns: {e}")
+        
+        # Per-user call log indexes
+        try:
+            for index in CallHistory.__table__.indexes:
+                index.create(conn, checkfirst=True)
+        except Exception as e:
+            print(f"Error adding call history indexes: {e}")
+        
         conn.commit()
         print("✅ Feed likes table created successfully")
         
 except Exception as e:
     print(f"Database tables already exist or error: {e}")
 
+try:
+    ensure_search_index(engine)
+except Exception as e:
+    print(f"Error creating message search index: {e}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     app.state.redis = redis.from_url(settings.REDIS_URL)
-    app.state.connection_manager = ConnectionManager()
+    app.state.geocoder = ReverseGeocoder.from_csv()
+    app.state.ws_broker = WebSocketBroker(app.state.redis)
+    app.state.game_rooms = create_game_room_store(app.state.redis)
+    app.state.connection_manager = ConnectionManager(app.state.ws_broker, app.state.game_rooms)
+    await app.state.ws_broker.start(
+        app.state.connection_manager.send_local,
+        app.state.connection_manager.participants.invalidate
+    )
+    app.state.connection_manager.start_heartbeat()
+    app.state.typing_indicators = TypingIndicators(app.state.connection_manager)
+    app.state.call_registry = CallRegistry(app.state.redis)
+    app.state.signaling_relay = SignalingRelay(app.state.connection_manager, app.state.call_registry)
+    app.state.room_actors = RoomActors(app.state.game_rooms, app.state.connection_manager)
+    app.state.quick_match = QuickMatchScheduler(app.state.game_rooms, app.state.connection_manager)
+    app.state.quick_match.start()
+    app.state.unread_counter = UnreadCounter(app.state.redis)
+    app.state.inbox_cache = InboxCache(app.state.redis)
+    app.state.message_pipeline = MessagePipeline(
+        app.state.connection_manager,
+        app.state.unread_counter,
+        app.state.inbox_cache
+    )
+    app.state.message_pipeline.start()
+    archiver = (
+        asyncio.create_task(archive_periodically())
+        if settings.ARCHIVE_INTERVAL_MINUTES > 0 else None
+    )
+    room_sweeper = asyncio.create_task(sweep_rooms_periodically(app.state.game_rooms))
+    call_persister = asyncio.create_task(
+        persist_calls_periodically(app.state.call_registry, app.state.connection_manager)
+    )
     yield
     # Shutdown
+    if archiver:
+        archiver.cancel()
+    room_sweeper.cancel()
+    call_persister.cancel()
+    await app.state.room_actors.stop()
+    await app.state.quick_match.stop()
+    await app.state.message_pipeline.stop()
+    await app.state.connection_manager.stop_heartbeat()
+    await app.state.ws_broker.stop()
     await app.state.redis.close()
 
 app = FastAPI(
@@ -102,6 +254,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Static files
@@ -224,52 +377,127 @@ async def get_latest_release():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics/websocket")
+async def websocket_metrics():
+    """Per-worker websocket gauges and counters (connections, reaped, dropped frames, call sessions)"""
+    return {**app.state.connection_manager.stats(), **app.state.signaling_relay.stats()}
+
+@app.get("/metrics/games")
+async def game_metrics():
+    """Game room gauges (rooms, disconnected players, estimated size, quick match queue) and this worker's counters"""
+    try:
+        return {
+            **await app.state.game_rooms.stats(),
+            **app.state.quick_match.metrics,
+            "room_actors": len(app.state.room_actors)
+        }
+    except GameRoomError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@app.get("/metrics/calls")
+async def call_metrics():
+    """Calls in progress, finished calls not yet written to the database, and this worker's counters"""
+    return await app.state.call_registry.stats()
+
 # WebSocket for real-time chat
+def _is_participant(user_id: str, match_id: str) -> bool:
+    db = SessionLocal()
+    try:
+        return db.query(Match.id).filter(
+            Match.id == match_id,
+            Match.is_active == True,
+            or_(Match.user1_id == user_id, Match.user2_id == user_id)
+        ).first() is not None
+    finally:
+        db.close()
+
 @app.websocket("/ws/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: str):
+async def websocket_endpoint(websocket: WebSocket, user_id: str, token: Optional[str] = None, last_seq: Optional[int] = None):
+    # Browsers can't set headers on a websocket, so the bearer token comes
+    # as ?token=; it must belong to the user in the path. Older app builds
+    # send none and are let in until WS_REQUIRE_TOKEN is turned on.
+    if token is not None and decode_user_id(token) != user_id:
+        await websocket.close(code=1008)
+        return
+    if token is None and settings.WS_REQUIRE_TOKEN:
+        await websocket.close(code=1008)
+        return
+    # Reconnecting clients pass the last event_seq they saw to get what they missed
     manager = app.state.connection_manager
-    await manager.connect(websocket, user_id)
+    connection = await manager.connect(websocket, user_id, last_seq)
+    if token is None:
+        manager.metrics["unauthenticated_connections"] += 1
+    # Matches this user was checked against, so each costs one query per socket
+    member_of = set()
     
     try:
         while True:
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+            try:
+                message_type, fields, data, payload = await receive_frame(websocket)
+            except FrameDecodeError:
+                manager.metrics["frames_rejected"] += 1
+                continue
+            connection.touch()
+            if data is None and payload is None:
+                data = {}
+            
+            if message_type == "pong":
+                # Heartbeat reply; touch() above already recorded it
+                continue
+            
+            elif message_type == "ping":
+                connection.enqueue(Frame("pong", {}))
             
-            message_type = message_data.get("type")
+            elif message_type == "new_message":
+                # Chat message - persisted and fanned out by the pipeline,
+                # which acks back to this socket with the server id
+                match_id = fields.get("match_id")
+                if match_id and match_id not in member_of:
+                    if not await asyncio.to_thread(_is_participant, user_id, match_id):
+                        connection.enqueue(Frame("message_error", {
+                            "client_id": fields.get("client_id"),
+                            "match_id": match_id,
+                            "detail": "Match not found or you're not a participant"
+                        }))
+                        continue
+                    member_of.add(match_id)
+                app.state.message_pipeline.submit(
+                    sender_id=user_id,
+                    match_id=match_id,
+                    content=fields.get("content", ""),
+                    message_type=fields.get("message_type", "text"),
+                    image_url=fields.get("image_url"),
+                    client_id=fields.get("client_id"),
+                    ack=True
+                )
             
-            if message_type == "new_message":
-                # Chat message
-                match_id = message_data.get("match_id")
+            elif message_type == "typing":
+                # Keystroke-rate events; throttled and coalesced before relaying
+                match_id = fields.get("match_id")
                 if match_id:
-                    await manager.broadcast_to_match(message_data, match_id, user_id)
+                    await app.state.typing_indicators.update(
+                        match_id, user_id, bool(fields.get("is_typing", True))
+                    )
             
             elif message_type == "signaling":
-                # WebRTC signaling
-                signaling_data = message_data.get("data", {})
-                target_user = signaling_data.get("to")
-                if target_user:
-                    signaling_data["from"] = user_id
-                    await manager.send_personal_message(
-                        json.dumps(signaling_data), 
-                        target_user
-                    )
+                # WebRTC signaling, routed by call session; ICE candidates
+                # are coalesced into batches
+                await app.state.signaling_relay.relay(user_id, fields, data, payload)
             
             elif message_type == "game_update":
                 # Game state update
-                room_id = message_data.get("room_id")
-                game_data = message_data.get("data", {})
+                room_id = fields.get("room_id")
                 if room_id:
-                    await manager.send_game_update(room_id, game_data)
+                    await manager.send_game_update(room_id, data, payload)
             
             elif message_type == "voice_chat_signal":
                 # Voice chat signaling for games
-                room_id = message_data.get("room_id")
-                signal_data = message_data.get("data", {})
+                room_id = fields.get("room_id")
                 if room_id:
-                    await manager.send_voice_chat_signal(room_id, signal_data, user_id)
+                    await manager.send_voice_chat_signal(room_id, data, user_id, payload)
                 
     except WebSocketDisconnect:
-        manager.disconnect(user_id)
+        manager.disconnect(connection)
 
 if __name__ == "__main__":
     import uvicorn
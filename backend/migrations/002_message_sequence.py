@@ -0,0 +1,38 @@
+"""Add per-match message sequence numbers and read watermarks
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.add_column('matches', sa.Column('last_seq', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('matches', sa.Column('user1_read_seq', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('matches', sa.Column('user2_read_seq', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('messages', sa.Column('seq', sa.Integer()))
+    
+    # Number existing messages in send order within each match
+    op.execute("""
+        UPDATE messages SET seq = numbered.seq
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY match_id ORDER BY created_at, id) AS seq
+            FROM messages
+        ) AS numbered
+        WHERE messages.id = numbered.id
+    """)
+    op.execute("""
+        UPDATE matches SET last_seq = COALESCE(
+            (SELECT MAX(seq) FROM messages WHERE messages.match_id = matches.id), 0
+        )
+    """)
+    op.create_index('ix_messages_match_seq', 'messages', ['match_id', 'seq'], unique=True)
+
+def downgrade():
+    op.drop_index('ix_messages_match_seq', table_name='messages')
+    op.drop_column('messages', 'seq')
+    op.drop_column('matches', 'user2_read_seq')
+    op.drop_column('matches', 'user1_read_seq')
+    op.drop_column('matches', 'last_seq')
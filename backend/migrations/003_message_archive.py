@@ -0,0 +1,28 @@
+"""Add message archive for idle conversations
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.add_column('matches', sa.Column('archived_seq', sa.Integer(), nullable=False, server_default='0'))
+    op.create_table(
+        'message_archive',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('match_id', sa.String(), sa.ForeignKey('matches.id'), nullable=False),
+        sa.Column('first_seq', sa.Integer(), nullable=False),
+        sa.Column('last_seq', sa.Integer(), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime()),
+    )
+    op.create_index('ix_message_archive_match_seq', 'message_archive', ['match_id', 'first_seq'], unique=True)
+
+def downgrade():
+    op.drop_index('ix_message_archive_match_seq', table_name='message_archive')
+    op.drop_table('message_archive')
+    op.drop_column('matches', 'archived_seq')
@@ -0,0 +1,67 @@
+"""Add super like flag, activity score and sort indexes to matches
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19
+
+"""
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.config import settings
+from app.core.database import ACTIVITY_EPOCH
+
+SORT_INDEXES = {
+    'last_message': ['last_message_at'],
+    'created': ['created_at'],
+    'activity': ['activity_score'],
+    'super': ['is_super_like', 'created_at'],
+}
+
+def upgrade():
+    op.add_column('matches', sa.Column('is_super_like', sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.add_column('matches', sa.Column('activity_score', sa.Float(), nullable=False, server_default='0'))
+    op.execute("""
+        UPDATE matches SET is_super_like = EXISTS (
+            SELECT 1 FROM swipes WHERE swipes.is_super_like AND (
+                (swipes.swiper_id = matches.user1_id AND swipes.swiped_id = matches.user2_id)
+                OR (swipes.swiper_id = matches.user2_id AND swipes.swiped_id = matches.user1_id)
+            )
+        )
+    """)
+    # Match.record_activity folded over recent messages, as a log-sum-exp
+    # per match; older messages have decayed to nothing
+    window = timedelta(hours=settings.ACTIVITY_WINDOW_HOURS)
+    op.execute(sa.text("""
+        UPDATE matches SET activity_score = scored.score
+        FROM (
+            SELECT match_id, MAX(peak) + LN(SUM(EXP(x - peak))) AS score
+            FROM (
+                SELECT match_id, x, MAX(x) OVER (PARTITION BY match_id) AS peak
+                FROM (
+                    SELECT match_id,
+                           CAST(EXTRACT(EPOCH FROM created_at - CAST(:epoch AS TIMESTAMP)) AS DOUBLE PRECISION) / :window AS x
+                    FROM messages
+                    WHERE created_at >= :since
+                ) AS scaled
+            ) AS peaked
+            GROUP BY match_id
+        ) AS scored
+        WHERE matches.id = scored.match_id
+    """).bindparams(
+        epoch=ACTIVITY_EPOCH,
+        window=window.total_seconds(),
+        since=datetime.utcnow() - 20 * window
+    ))
+    for name, columns in SORT_INDEXES.items():
+        for side in ('user1', 'user2'):
+            op.create_index(f'ix_matches_{side}_{name}', 'matches', [f'{side}_id'] + columns)
+
+def downgrade():
+    for name in SORT_INDEXES:
+        for side in ('user1', 'user2'):
+            op.drop_index(f'ix_matches_{side}_{name}', table_name='matches')
+    op.drop_column('matches', 'activity_score')
+    op.drop_column('matches', 'is_super_like')
@@ -0,0 +1,16 @@
+"""Add per-user indexes to call history
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+def upgrade():
+    for side in ('caller', 'callee'):
+        op.create_index(f'ix_call_history_{side}_created', 'call_history', [f'{side}_id', 'created_at'])
+
+def downgrade():
+    for side in ('caller', 'callee'):
+        op.drop_index(f'ix_call_history_{side}_created', table_name='call_history')
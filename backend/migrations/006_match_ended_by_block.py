@@ -0,0 +1,15 @@
+"""Remember which matches were ended by a block
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.add_column('matches', sa.Column('ended_by_block', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+def downgrade():
+    op.drop_column('matches', 'ended_by_block')
@@ -0,0 +1,74 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Settings are read at import time, so point them at a throwaway database
+# before anything from the app is imported
+_db_file = tempfile.NamedTemporaryFile(prefix="amora-test-", suffix=".db", delete=False)
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_file.name}"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakeredis
+import redis.asyncio
+
+# Every client the app opens shares one in-memory Redis
+_redis_server = fakeredis.FakeServer()
+redis.asyncio.from_url = lambda *args, **kwargs: fakeredis.aioredis.FakeRedis(server=_redis_server)
+
+import main
+from fastapi.testclient import TestClient
+from app.api.routes.auth import create_access_token
+from app.core.database import Base, SessionLocal, engine, Match
+from app.models.user import User
+from app.services.message_search import ensure_search_index
+
+for table in Base.metadata.sorted_tables:
+    table.create(engine, checkfirst=True)
+ensure_search_index(engine)
+
+@pytest.fixture
+def redis_server():
+    fakeredis.FakeStrictRedis(server=_redis_server).flushall()
+    return _redis_server
+
+@pytest.fixture
+def fake_redis(redis_server):
+    """An async client on the shared server, for testing services directly"""
+    return fakeredis.aioredis.FakeRedis(server=redis_server)
+
+@pytest.fixture
+def client(redis_server):
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+@pytest.fixture
+def make_user(db):
+    def make(name: str = "user") -> User:
+        user = User(email=f"{name}-{os.urandom(4).hex()}@example.com", hashed_password="x", name=name, age=25, gender="female")
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        return user
+    return make
+
+@pytest.fixture
+def match_pair(db, make_user):
+    """Two users and an active match between them"""
+    alice, bob = make_user("alice"), make_user("bob")
+    match = Match(user1_id=alice.id, user2_id=bob.id)
+    db.add(match)
+    db.commit()
+    db.refresh(match)
+    return alice, bob, match
+
+def auth_headers(user: User) -> dict:
+    return {"Authorization": f"Bearer {create_access_token({'sub': user.id})}"}
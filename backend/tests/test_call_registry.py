@@ -0,0 +1,88 @@
+import asyncio
+import json
+import time
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.core.database import CallHistory
+from app.services import call_registry
+from app.services.call_registry import CLAIMS_KEY, FINISHED_KEY, REJECTED_KEY, CallRegistry
+
+def _call(caller, callee, call_id, **overrides):
+    call = {
+        "call_id": call_id,
+        "caller_id": caller.id,
+        "callee_id": callee.id,
+        "call_type": "audio",
+        "duration": 30,
+        "status": "completed",
+        "started_at": time.time()
+    }
+    call.update(overrides)
+    return call
+
+@pytest.fixture
+def registry(fake_redis):
+    return CallRegistry(fake_redis)
+
+def test_failed_flush_requeues_batch(registry, fake_redis, match_pair, db, monkeypatch):
+    alice, bob, match = match_pair
+    before = db.query(CallHistory).count()
+
+    async def scenario():
+        for n in range(3):
+            await registry.record(_call(alice, bob, f"c{n}"))
+        queued = await fake_redis.lrange(FINISHED_KEY, 0, -1)
+
+        def database_down(rows):
+            raise OperationalError("INSERT", {}, Exception("connection refused"))
+
+        with monkeypatch.context() as patch:
+            patch.setattr(call_registry, "_insert_calls", database_down)
+            assert await registry.flush() == 0
+        # Nothing lost, nothing reordered, no claim left behind
+        assert await fake_redis.lrange(FINISHED_KEY, 0, -1) == queued
+        assert await fake_redis.zcard(CLAIMS_KEY) == 0
+
+        assert await registry.flush() == 3
+        assert await fake_redis.llen(FINISHED_KEY) == 0
+
+    asyncio.run(scenario())
+    db.expire_all()
+    assert db.query(CallHistory).count() == before + 3
+
+def test_stale_claim_is_requeued_without_duplicates(registry, fake_redis, match_pair, db, monkeypatch):
+    alice, bob, match = match_pair
+    before = db.query(CallHistory).count()
+
+    async def scenario():
+        await registry.record(_call(alice, bob, "c1"))
+        await registry.flush()
+        # A worker that wrote the rows but died before dropping its claim
+        await fake_redis.rpush("call:claim:dead", json.dumps(_call(alice, bob, "c1")))
+        await fake_redis.zadd(CLAIMS_KEY, {"call:claim:dead": time.time() - 3600})
+
+        assert await registry.flush() == 1
+        assert await fake_redis.zcard(CLAIMS_KEY) == 0
+        assert not await fake_redis.exists("call:claim:dead")
+
+    asyncio.run(scenario())
+    db.expire_all()
+    assert db.query(CallHistory).count() == before + 1
+
+def test_rejected_rows_are_parked(registry, fake_redis, match_pair, db):
+    alice, bob, match = match_pair
+    before = db.query(CallHistory).count()
+
+    async def scenario():
+        await registry.record(_call(alice, bob, "good"))
+        await registry.record(_call(alice, bob, "bad", call_type=None))
+        assert await registry.flush() == 2
+        parked = await fake_redis.lrange(REJECTED_KEY, 0, -1)
+        assert [json.loads(call)["call_id"] for call in parked] == ["bad"]
+        assert registry.metrics["calls_rejected"] == 1
+
+    asyncio.run(scenario())
+    db.expire_all()
+    assert db.query(CallHistory).count() == before + 1
@@ -0,0 +1,16 @@
+from conftest import auth_headers
+
+def test_alert_is_sequenced_into_history_and_sync(client, match_pair):
+    alice, bob, match = match_pair
+    client.post("/api/messages/", json={"match_id": match.id, "content": "hi"}, headers=auth_headers(alice))
+
+    response = client.post("/api/emergency/alert", json={"timestamp": "now"}, headers=auth_headers(alice))
+    assert response.json()["alerts_sent"] == 1
+
+    history = client.get(f"/api/messages/{match.id}", headers=auth_headers(bob)).json()
+    assert [(m["seq"], m["message_type"]) for m in history] == [(1, "text"), (2, "emergency")]
+
+    synced = client.post("/api/messages/sync", json={"cursors": {match.id: 1}}, headers=auth_headers(alice)).json()
+    [entry] = synced["matches"]
+    assert entry["last_seq"] == 2
+    assert [m["message_type"] for m in entry["messages"]] == ["emergency"]
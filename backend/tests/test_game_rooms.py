@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.game_rooms import GameRoomError, MemoryGameRoomStore, RedisGameRoomStore, new_room
+
+def _player(user_id):
+    return {"id": user_id, "name": user_id, "avatar": None, "is_connected": True, "is_muted": False}
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request, redis_server):
+    if request.param == "memory":
+        return MemoryGameRoomStore()
+    return RedisGameRoomStore(request.getfixturevalue("fake_redis"))
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_player_index_lives_as_long_as_an_active_room(store, monkeypatch):
+    monkeypatch.setattr(settings, "GAME_ROOM_TTL_SECONDS", 1)
+
+    async def scenario():
+        await store.create(new_room("r1", _player("alice"), "2026-01-01T00:00:00"))
+        await store.join("r1", _player("bob"))
+        # Busy for longer than the TTL, through every kind of activity
+        for touch in (store.get("r1"), store.update("r1", {"round": 2}), store.player_ids("r1")):
+            await asyncio.sleep(0.6)
+            await touch
+        assert await store.rooms_for("alice") == ["r1"]
+        assert await store.rooms_for("bob") == ["r1"]
+        [(room_id, (version, players))] = await store.mark_user("bob", False)
+        assert room_id == "r1"
+        assert [p["is_connected"] for p in players] == [True, False]
+
+    run(scenario())
+
+def test_join_enforces_the_player_cap(store, monkeypatch):
+    monkeypatch.setattr(settings, "GAME_ROOM_MAX_PLAYERS", 3)
+
+    async def join(user_id):
+        try:
+            await store.join("r1", _player(user_id))
+            return user_id
+        except GameRoomError as e:
+            assert (e.detail, e.status_code) == ("Room is full", 400)
+            return None
+
+    async def scenario():
+        await store.create(new_room("r1", _player("alice"), "2026-01-01T00:00:00"))
+        joined = await asyncio.gather(*(join(f"user{i}") for i in range(6)))
+        assert len([user_id for user_id in joined if user_id]) == 2
+        room = await store.get("r1")
+        assert len(room["players"]) == 3
+        assert room["version"] == 3
+
+        # Already in the room: not a change, and doesn't count against the cap
+        room, changed = await store.join("r1", _player("alice"))
+        assert not changed and room["version"] == 3
+        with pytest.raises(GameRoomError) as error:
+            await store.join("nope", _player("alice"))
+        assert error.value.status_code == 404
+
+    run(scenario())
+
+def test_last_player_leaving_deletes_the_room(store):
+    async def scenario():
+        await store.create(new_room("r1", _player("alice"), "2026-01-01T00:00:00"))
+        await store.join("r1", _player("bob"))
+
+        version, players = await store.leave("r1", "alice")
+        assert version == 3
+        assert [p["id"] for p in players] == ["bob"]
+        assert await store.rooms_for("alice") == []
+
+        assert await store.leave("r1", "bob") is None
+        assert await store.get("r1") is None
+        assert await store.rooms_for("bob") == []
+        assert await store.leave("r1", "bob") is None
+
+    run(scenario())
+
+def test_update_is_compare_and_set_on_version(store):
+    async def scenario():
+        await store.create(new_room("r1", _player("alice"), "2026-01-01T00:00:00"))
+
+        version, players = await store.update("r1", {"state": "playing"}, expected_version=1)
+        assert version == 2
+        assert [p["id"] for p in players] == ["alice"]
+
+        # A second writer that read version 1 loses
+        with pytest.raises(GameRoomError) as error:
+            await store.update("r1", {"state": "finished"}, expected_version=1)
+        assert error.value.status_code == 409
+        room = await store.get("r1")
+        assert (room["state"], room["version"]) == ("playing", 2)
+
+        # Without an expected version the write always applies
+        version, _ = await store.update("r1", {"round": 2, "current_question": {"text": "?"}})
+        room = await store.get("r1")
+        assert version == room["version"] == 3
+        assert (room["round"], room["current_question"]) == (2, {"text": "?"})
+
+        with pytest.raises(GameRoomError) as error:
+            await store.update("nope", {"round": 2})
+        assert error.value.status_code == 404
+
+    run(scenario())
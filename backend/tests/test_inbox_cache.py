@@ -0,0 +1,35 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.services.inbox_cache import InboxCache, InboxEntry, to_score
+
+def test_touch_during_rebuild_is_kept(fake_redis):
+    inbox = InboxCache(fake_redis)
+    now = datetime.utcnow()
+
+    async def scenario():
+        token = await inbox.begin_load("u1")
+        assert token
+        # Only one request rebuilds at a time
+        assert await inbox.begin_load("u1") is None
+        # A message the database read below doesn't include yet
+        await inbox.touch("u1", "m2", now, {"content": "new"})
+        await inbox.load("u1", token, [
+            InboxEntry("m1", to_score(now - timedelta(minutes=5)), {"content": "old"}),
+            InboxEntry("m2", to_score(now - timedelta(minutes=10)), {"content": "older"})
+        ])
+        return await inbox.page("u1", 10)
+
+    entries = asyncio.run(scenario())
+    assert [(entry.match_id, entry.preview["content"]) for entry in entries] == [("m2", "new"), ("m1", "old")]
+
+def test_remove_during_rebuild_cancels_it(fake_redis):
+    inbox = InboxCache(fake_redis)
+
+    async def scenario():
+        token = await inbox.begin_load("u1")
+        await inbox.remove("u1", "m1")
+        await inbox.load("u1", token, [InboxEntry("m1", to_score(datetime.utcnow()), None)])
+        return await inbox.page("u1", 10)
+
+    assert asyncio.run(scenario()) is None
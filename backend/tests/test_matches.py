@@ -0,0 +1,53 @@
+from app.core.database import Match
+from conftest import auth_headers
+
+def test_search_matches_wildcards_literally(client, db, make_user):
+    alice = make_user("alice")
+    for name in ("50%_off", "5000"):
+        db.add(Match(user1_id=alice.id, user2_id=make_user(name).id))
+    db.commit()
+
+    response = client.get("/api/matches/", params={"search": "0%_"}, headers=auth_headers(alice))
+    assert response.status_code == 200
+    assert [match["other_user"]["name"] for match in response.json()] == ["50%_off"]
+
+def _match_ids(client, user):
+    response = client.get("/api/matches/", headers=auth_headers(user))
+    assert response.status_code == 200
+    return [match["id"] for match in response.json()]
+
+def test_unblocking_restores_a_match_the_block_ended(client, db, match_pair):
+    alice, bob, match = match_pair
+    assert _match_ids(client, bob) == [match.id]
+
+    assert client.post("/api/users/block", json={"user_id": bob.id}, headers=auth_headers(alice)).status_code == 200
+    assert _match_ids(client, bob) == []
+    db.refresh(match)
+    assert not match.is_active
+
+    assert client.delete(f"/api/users/block/{bob.id}", headers=auth_headers(alice)).status_code == 200
+    assert _match_ids(client, bob) == [match.id]
+    assert _match_ids(client, alice) == [match.id]
+    db.refresh(match)
+    assert match.is_active and not match.ended_by_block
+
+def test_unblocking_keeps_unmatched_and_mutually_blocked_matches_ended(client, db, match_pair, make_user):
+    alice, bob, match = match_pair
+    carol = make_user("carol")
+    other = Match(user1_id=alice.id, user2_id=carol.id)
+    db.add(other)
+    db.commit()
+
+    # Unmatched before the block: unblocking doesn't bring it back
+    assert client.delete(f"/api/matches/{other.id}", headers=auth_headers(alice)).status_code == 200
+    client.post("/api/users/block", json={"user_id": carol.id}, headers=auth_headers(alice))
+    client.delete(f"/api/users/block/{carol.id}", headers=auth_headers(alice))
+    assert _match_ids(client, carol) == []
+
+    # Still suspended while the other side's block stands
+    client.post("/api/users/block", json={"user_id": bob.id}, headers=auth_headers(alice))
+    client.post("/api/users/block", json={"user_id": alice.id}, headers=auth_headers(bob))
+    client.delete(f"/api/users/block/{bob.id}", headers=auth_headers(alice))
+    assert _match_ids(client, alice) == []
+    client.delete(f"/api/users/block/{alice.id}", headers=auth_headers(bob))
+    assert _match_ids(client, alice) == [match.id]
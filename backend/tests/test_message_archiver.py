@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+
+from app.core.database import Message, MessageArchive, append_message
+from app.services.message_archiver import archive_idle_conversations, load_message_range
+
+def _send(db, match, sender, count):
+    for _ in range(count):
+        append_message(db, Message(match_id=match.id, sender_id=sender.id, content="", message_type="text"))
+        db.flush()
+    db.commit()
+
+def test_range_spans_archive_chunks_and_hot_rows(db, match_pair):
+    alice, bob, match = match_pair
+    _send(db, match, alice, 10)
+    match.last_message_at = datetime.utcnow() - timedelta(days=30)
+    db.commit()
+
+    assert archive_idle_conversations(idle_days=1, batch_size=4) == 10
+    db.expire_all()
+    assert match.archived_seq == 10
+    assert db.query(MessageArchive).filter(MessageArchive.match_id == match.id).count() == 3
+
+    # The conversation picks up again after archiving
+    _send(db, match, bob, 2)
+    assert db.query(Message).filter(Message.match_id == match.id).count() == 2
+
+    messages = load_message_range(db, match, 7, 12)
+    assert [msg.seq for msg in messages] == [7, 8, 9, 10, 11, 12]
+    assert [msg.sender_id for msg in messages] == [alice.id] * 4 + [bob.id] * 2
+    assert [msg.seq for msg in load_message_range(db, match, 1, 3)] == [1, 2, 3]
+    assert [msg.seq for msg in load_message_range(db, match, 11, 20)] == [11, 12]
+    assert load_message_range(db, match, 5, 4) == []
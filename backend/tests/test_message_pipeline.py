@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+from conftest import auth_headers
+
+def test_failed_fan_out_settles_sender_and_keeps_writer(client, match_pair, monkeypatch):
+    alice, bob, match = match_pair
+    manager = main.app.state.connection_manager
+
+    async def broken_send(*args, **kwargs):
+        raise RuntimeError("fan-out down")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(manager, "send_personal_message", broken_send)
+        response = client.post("/api/messages/", json={"match_id": match.id, "content": "one"}, headers=auth_headers(alice))
+    # Stored even though delivery failed
+    assert response.status_code == 200
+    assert response.json()["seq"] == 1
+
+    response = client.post("/api/messages/", json={"match_id": match.id, "content": "two"}, headers=auth_headers(bob))
+    assert response.json()["seq"] == 2
+    assert not main.app.state.message_pipeline._task.done()
+
+def test_crashed_writer_is_restarted(client, match_pair, monkeypatch):
+    alice, bob, match = match_pair
+    pipeline = main.app.state.message_pipeline
+    crashed = pipeline._task
+
+    async def crash(*args, **kwargs):
+        raise RuntimeError("writer bug")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(pipeline, "_deliver_safely", crash)
+        response = client.post("/api/messages/", json={"match_id": match.id, "content": "lost?"}, headers=auth_headers(alice))
+    assert response.status_code == 200
+
+    assert crashed.done() and pipeline._task is not crashed
+    response = client.post("/api/messages/", json={"match_id": match.id, "content": "after"}, headers=auth_headers(alice))
+    assert response.json()["seq"] == 2
+
+def test_concurrent_submits_get_contiguous_seqs(client, match_pair):
+    alice, bob, match = match_pair
+
+    def send(n):
+        sender = alice if n % 2 else bob
+        response = client.post("/api/messages/", json={"match_id": match.id, "content": f"m{n}"}, headers=auth_headers(sender))
+        return response.json()["seq"]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        seqs = list(pool.map(send, range(40)))
+    assert sorted(seqs) == list(range(1, 41))
+
+    history = client.get(f"/api/messages/{match.id}", params={"limit": 100}, headers=auth_headers(alice)).json()
+    assert [m["seq"] for m in history] == list(range(1, 41))
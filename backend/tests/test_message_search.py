@@ -0,0 +1,42 @@
+from app.core.database import Match, Message, append_message
+from conftest import auth_headers
+
+def _send(db, match, sender, *contents):
+    for content in contents:
+        append_message(db, Message(match_id=match.id, sender_id=sender.id, content=content), match)
+    db.commit()
+
+def _search(client, user, **params):
+    response = client.get("/api/messages/search", params=params, headers=auth_headers(user))
+    assert response.status_code == 200
+    return response.json()
+
+def test_highlight_escapes_message_content(client, db, match_pair):
+    alice, bob, match = match_pair
+    _send(db, match, bob, "<img src=x onerror=alert(1)> hello & bye")
+
+    [result] = _search(client, alice, q="hello")["results"]
+    assert result["highlight"] == "&lt;img src=x onerror=alert(1)&gt; <mark>hello</mark> &amp; bye"
+    assert result["seq"] == 1
+    assert result["match_id"] == match.id
+
+def test_search_only_covers_own_matches(client, db, match_pair, make_user):
+    alice, bob, match = match_pair
+    carol, dave = make_user("carol"), make_user("dave")
+    other = Match(user1_id=carol.id, user2_id=dave.id)
+    db.add(other)
+    db.commit()
+    _send(db, match, bob, "picnic on sunday?")
+    _send(db, other, dave, "picnic on saturday?")
+
+    results = _search(client, alice, q="picnic")["results"]
+    assert [result["match_id"] for result in results] == [match.id]
+    assert _search(client, alice, q="picnic", match_id=other.id)["results"] == []
+
+def test_search_pages_newest_first(client, db, match_pair):
+    alice, bob, match = match_pair
+    _send(db, match, bob, *[f"coffee number {i}" for i in range(5)])
+
+    pages = [_search(client, alice, q="coffee", limit=2, page=page) for page in (1, 2, 3)]
+    assert [[result["seq"] for result in page["results"]] for page in pages] == [[5, 4], [3, 2], [1]]
+    assert [page["has_more"] for page in pages] == [True, True, False]
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+
+from app.services import websocket_manager
+from app.services.websocket_manager import ParticipantCache
+
+def _counting_loader(monkeypatch):
+    """Wrap the DB lookup, recording which thread each call ran on"""
+    calls = []
+    load = websocket_manager._load_participants
+
+    def counted(match_id):
+        calls.append(threading.get_ident())
+        return load(match_id)
+
+    monkeypatch.setattr(websocket_manager, "_load_participants", counted)
+    return calls
+
+def test_hits_are_served_from_memory_and_misses_off_the_loop(match_pair, monkeypatch):
+    alice, bob, match = match_pair
+    calls = _counting_loader(monkeypatch)
+    cache = ParticipantCache(max_size=10)
+
+    async def scenario():
+        first = await cache.get(match.id)
+        second = await cache.get(match.id)
+        return first, second, threading.get_ident()
+
+    first, second, loop_thread = asyncio.run(scenario())
+    assert first == second == (alice.id, bob.id)
+    assert len(calls) == 1
+    assert calls[0] != loop_thread
+
+def test_unknown_matches_are_remembered_briefly(db, match_pair, monkeypatch):
+    alice, bob, match = match_pair
+    calls = _counting_loader(monkeypatch)
+    cache = ParticipantCache(max_size=10)
+
+    async def lookup_twice(match_id):
+        return [await cache.get(match_id), await cache.get(match_id)]
+
+    assert asyncio.run(lookup_twice("no-such-match")) == [None, None]
+    assert len(calls) == 1
+
+    match.is_active = False
+    db.commit()
+    assert asyncio.run(lookup_twice(match.id)) == [None, None]
+    assert len(calls) == 2
+
+    # Reactivation invalidates, so the next lookup goes back to the DB
+    match.is_active = True
+    db.commit()
+    cache.invalidate(match.id)
+    assert asyncio.run(cache.get(match.id)) == (alice.id, bob.id)
+    assert len(calls) == 3
+
+def test_negative_entries_expire(monkeypatch):
+    calls = _counting_loader(monkeypatch)
+    monkeypatch.setattr(websocket_manager.settings, "PARTICIPANT_NEGATIVE_TTL_SECONDS", 0)
+    cache = ParticipantCache(max_size=10)
+
+    async def lookup_twice():
+        return [await cache.get("no-such-match"), await cache.get("no-such-match")]
+
+    assert asyncio.run(lookup_twice()) == [None, None]
+    assert len(calls) == 2
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.game_rooms import MemoryGameRoomStore, RedisGameRoomStore
+from app.services.quick_match import QuickMatchScheduler, form_groups
+
+class RecordingConnections:
+    def __init__(self):
+        self.frames = []
+
+    async def send_personal_message(self, frame, user_id):
+        self.frames.append((user_id, frame.type, frame.fields))
+
+    async def send_to_users(self, frame, user_ids):
+        for user_id in user_ids:
+            await self.send_personal_message(frame, user_id)
+
+def _ticket(user_id, prefer_matches=False):
+    player = {"id": user_id, "name": user_id, "avatar": None, "is_connected": True, "is_muted": False}
+    return {"player": player, "prefer_matches": prefer_matches}
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request, redis_server):
+    if request.param == "memory":
+        return MemoryGameRoomStore()
+    return RedisGameRoomStore(request.getfixturevalue("fake_redis"))
+
+@pytest.mark.parametrize("entries, partners, expected", [
+    # Full rooms form straight away, oldest first
+    ([("a", {}, 100), ("b", {}, 101), ("c", {}, 102), ("d", {}, 103)], {}, [["a", "b", "c"]]),
+    # Short of a full room, the oldest hasn't waited long enough yet
+    ([("a", {}, 100), ("b", {}, 101)], {}, []),
+    # ... until it has
+    ([("a", {}, 80), ("b", {}, 101)], {}, [["a", "b"]]),
+    # A user preferring their matches is grouped with them first
+    ([("a", {"prefer_matches": True}, 100), ("b", {}, 101), ("c", {}, 102), ("d", {}, 103)],
+     {"a": ["d"]}, [["a", "d", "b"]]),
+])
+def test_form_groups(entries, partners, expected, monkeypatch):
+    monkeypatch.setattr(settings, "GAME_ROOM_MAX_PLAYERS", 3)
+    monkeypatch.setattr(settings, "GAME_QUICK_MATCH_MAX_WAIT_SECONDS", 10)
+    assert form_groups(entries, partners, now=105) == expected
+
+def test_tick_pairs_queued_users_into_rooms(store, monkeypatch):
+    monkeypatch.setattr(settings, "GAME_ROOM_MAX_PLAYERS", 2)
+    connections = RecordingConnections()
+    scheduler = QuickMatchScheduler(store, connections)
+
+    async def scenario():
+        for user_id in ("a", "b", "c", "d", "e"):
+            await store.enqueue(user_id, _ticket(user_id))
+        assert await scheduler.tick() == 2
+        assert [user_id for user_id, _, _ in await store.queued(10)] == ["e"]
+        rooms = {}
+        for user_id, frame_type, fields in connections.frames:
+            assert (frame_type, fields["status"]) == ("quick_match", "matched")
+            rooms.setdefault(fields["room_id"], []).append(user_id)
+            assert await store.rooms_for(user_id) == [fields["room_id"]]
+        assert sorted(rooms.values()) == [["a", "b"], ["c", "d"]]
+
+    asyncio.run(scenario())
+
+def test_tick_times_out_users_left_waiting(store, monkeypatch):
+    monkeypatch.setattr(settings, "GAME_QUICK_MATCH_TIMEOUT_SECONDS", 0)
+    connections = RecordingConnections()
+    scheduler = QuickMatchScheduler(store, connections)
+
+    async def scenario():
+        await store.enqueue("a", _ticket("a"))
+        assert await scheduler.tick() == 0
+        assert not await store.is_queued("a")
+
+    asyncio.run(scenario())
+    assert connections.frames == [("a", "quick_match", {"status": "timed_out"})]
+
+def test_only_the_lease_holder_schedules(fake_redis):
+    store = RedisGameRoomStore(fake_redis)
+
+    async def scenario():
+        assert await store.acquire_scheduler("worker-1", 100)
+        assert not await store.acquire_scheduler("worker-2", 100)
+        # The holder renews its lease
+        await asyncio.sleep(0.06)
+        assert await store.acquire_scheduler("worker-1", 100)
+        await asyncio.sleep(0.06)
+        assert not await store.acquire_scheduler("worker-2", 100)
+        # Another worker takes over once the holder stops renewing
+        await asyncio.sleep(0.1)
+        assert await store.acquire_scheduler("worker-2", 100)
+        assert not await store.acquire_scheduler("worker-1", 100)
+
+    asyncio.run(scenario())
@@ -0,0 +1,26 @@
+import pytest
+
+from app.services.reverse_geocoder import ReverseGeocoder
+
+@pytest.fixture(scope="module")
+def geocoder():
+    return ReverseGeocoder.from_csv()
+
+@pytest.mark.parametrize("latitude, longitude, expected", [
+    # Known places; Indian ones are labelled by state
+    (12.9716, 77.5946, "Bengaluru, Karnataka"),
+    (24.8607, 67.0011, "Karachi, Pakistan"),
+    # A few km out still snaps to the nearest place
+    (12.99, 77.62, "Bengaluru, Karnataka"),
+    # Open ocean, beyond GEOCODER_MAX_DISTANCE_KM of anything
+    (0.0, -140.0, None),
+    (-60.0, 80.0, None),
+    # Out of range or not a number
+    (95.0, 0.0, None),
+    (-91.0, 10.0, None),
+    (12.9716, 437.5946, None),
+    (12.9716, -200.0, None),
+    (float("nan"), 77.5946, None),
+])
+def test_label(geocoder, latitude, longitude, expected):
+    assert geocoder.label(latitude, longitude) == expected
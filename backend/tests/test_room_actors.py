@@ -0,0 +1,87 @@
+import asyncio
+
+from app.core.config import settings
+from app.services.game_rooms import GameRoomError, MemoryGameRoomStore, new_room
+from app.services.room_actors import RoomActors
+
+class RecordingConnections:
+    """Stands in for the connection manager; earlier deltas take longer to send"""
+
+    def __init__(self):
+        self.deltas = []
+
+    async def send_game_delta(self, room_id, version, fields, players):
+        await asyncio.sleep(0.01 / version)
+        self.deltas.append((room_id, version, fields))
+
+def _player(user_id):
+    return {"id": user_id, "name": user_id, "avatar": None, "is_connected": True, "is_muted": False}
+
+async def _actors_with_room(*room_ids):
+    store, connections = MemoryGameRoomStore(), RecordingConnections()
+    for room_id in room_ids:
+        await store.create(new_room(room_id, _player("alice"), "2026-01-01T00:00:00"))
+    return RoomActors(store, connections), connections
+
+def test_deltas_go_out_in_version_order():
+    async def scenario():
+        actors, connections = await _actors_with_room("r1", "r2")
+        versions = await asyncio.gather(
+            *(actors.update("r1", {"round": i}) for i in range(5)),
+            actors.update("r2", {"round": 1})
+        )
+        await actors.stop()
+        return versions, connections.deltas
+
+    versions, deltas = asyncio.run(scenario())
+    assert versions == [2, 3, 4, 5, 6, 2]
+    assert [(version, fields) for room_id, version, fields in deltas if room_id == "r1"] == [
+        (2, {"round": 0}), (3, {"round": 1}), (4, {"round": 2}), (5, {"round": 3}), (6, {"round": 4})
+    ]
+
+def test_errors_reach_the_caller_and_the_actor_carries_on(monkeypatch):
+    monkeypatch.setattr(settings, "GAME_ROOM_MAX_PLAYERS", 1)
+
+    async def scenario():
+        actors, connections = await _actors_with_room("r1")
+        results = await asyncio.gather(
+            actors.update("r1", {"state": "playing"}, expected_version=1),
+            actors.update("r1", {"state": "finished"}, expected_version=1),
+            actors.join("r1", _player("bob")),
+            actors.update("r1", {"round": 2}),
+            return_exceptions=True
+        )
+        await actors.stop()
+        return results, connections.deltas
+
+    (first, conflict, full, last), deltas = asyncio.run(scenario())
+    assert first == 2 and last == 3
+    assert isinstance(conflict, GameRoomError) and conflict.status_code == 409
+    assert isinstance(full, GameRoomError) and full.detail == "Room is full"
+    assert [version for _, version, _ in deltas] == [2, 3]
+
+def test_idle_actors_retire_and_come_back(monkeypatch):
+    monkeypatch.setattr(settings, "GAME_ROOM_ACTOR_IDLE_SECONDS", 0.05)
+
+    async def scenario():
+        actors, _ = await _actors_with_room("r1")
+        await actors.update("r1", {"round": 2})
+        assert len(actors) == 1
+        await asyncio.sleep(0.1)
+        assert len(actors) == 0
+        assert await actors.update("r1", {"round": 3}) == 3
+        await actors.stop()
+
+    asyncio.run(scenario())
+
+def test_stop_cancels_queued_commands():
+    async def scenario():
+        actors, _ = await _actors_with_room("r1")
+        pending = [asyncio.ensure_future(actors.update("r1", {"round": i})) for i in range(3)]
+        # The first is mid-broadcast, the rest still in the mailbox
+        await asyncio.sleep(0.001)
+        await actors.stop()
+        return await asyncio.gather(*pending, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
@@ -0,0 +1,32 @@
+import asyncio
+
+from app.services.signaling_relay import SignalingRelay
+
+class RecordingManager:
+    def __init__(self):
+        self.sent = []
+
+    async def send_personal_message(self, frame, user_id):
+        self.sent.append((user_id, frame))
+
+def test_explicit_to_overrides_latest_session():
+    async def scenario():
+        manager = RecordingManager()
+        relay = SignalingRelay(manager)
+        relay.window = 0.01
+        await relay.relay("bob", {"to": "alice"}, {"type": "call-offer", "callId": "c1"})
+
+        # No callId: follows bob's latest call unless addressed elsewhere
+        await relay.relay("bob", {}, {"type": "ice-candidate", "candidate": "a"})
+        await relay.relay("bob", {"to": "carol"}, {"type": "ice-candidate", "candidate": "c"})
+        await relay.relay("bob", {"to": "carol"}, {"type": "offer", "sdp": "x"})
+        await asyncio.sleep(0.05)
+        return manager.sent
+
+    received = {}
+    for user_id, frame in asyncio.run(scenario()):
+        received.setdefault(user_id, []).append(frame.data)
+    assert received == {
+        "alice": [{"type": "call-offer", "callId": "c1"}, {"type": "ice-candidate", "candidate": "a"}],
+        "carol": [{"type": "ice-candidate", "candidate": "c"}, {"type": "offer", "sdp": "x"}]
+    }
@@ -0,0 +1,65 @@
+import asyncio
+
+import fakeredis
+
+from app.core.database import Message, append_message
+from app.services import unread_counter
+from app.services.unread_counter import UnreadCounter
+
+def test_increment_during_rebuild_counts_only_unread_messages_missed(fake_redis, redis_server, db, monkeypatch):
+    counter = UnreadCounter(fake_redis)
+    # Another worker, storing messages while this one reads the database
+    other = fakeredis.FakeStrictRedis(server=redis_server)
+    increment = other.register_script(unread_counter._INCREMENT_IF_LOADED)
+
+    def read_counts(db, user_id):
+        for match_id, seq in (("m1", 5), ("m1", 6), ("m2", 1)):
+            increment(keys=["unread:u1", "unread:loading:u1"], args=[match_id, seq])
+        # The read saw m1 up to seq 5, so seq 6 and m2 came after it
+        return {"m1": 2}, {"m1": 5, "m2": 0}
+
+    async def scenario():
+        assert await counter.get_counts(db, "u1") == {"m1": 2}
+        # Served from the cache now; seq 5 isn't counted twice
+        assert await counter.get_counts(db, "u1") == {"m1": 3, "m2": 1}
+
+    monkeypatch.setattr(unread_counter, "read_unread_counts", read_counts)
+    asyncio.run(scenario())
+
+def test_message_committed_before_rebuild_is_counted_once(fake_redis, redis_server, db, match_pair, monkeypatch):
+    alice, bob, match = match_pair
+    counter = UnreadCounter(fake_redis)
+    other = fakeredis.FakeStrictRedis(server=redis_server)
+    increment = other.register_script(unread_counter._INCREMENT_IF_LOADED)
+    for content in ("one", "two"):
+        append_message(db, Message(match_id=match.id, sender_id=bob.id, content=content, message_type="text"))
+        db.commit()
+    read_from_db = unread_counter.read_unread_counts
+    keys = [f"unread:{alice.id}", f"unread:loading:{alice.id}"]
+
+    def read_counts(db, user_id):
+        counts = read_from_db(db, user_id)
+        # The sender's worker only now gets round to counting "two"
+        increment(keys=keys, args=[match.id, 2])
+        return counts
+
+    async def scenario():
+        assert await counter.get_counts(db, alice.id) == {match.id: 2}
+        assert await counter.get_counts(db, alice.id) == {match.id: 2}
+
+    monkeypatch.setattr(unread_counter, "read_unread_counts", read_counts)
+    asyncio.run(scenario())
+
+def test_reset_during_rebuild_skips_caching(fake_redis, redis_server, db, monkeypatch):
+    counter = UnreadCounter(fake_redis)
+    other = fakeredis.FakeStrictRedis(server=redis_server)
+
+    def read_counts(db, user_id):
+        # Read before the user opened the conversation elsewhere
+        other.hdel("unread:u1", "m1")
+        other.delete("unread:loading:u1")
+        return {"m1": 2}, {"m1": 2}
+
+    monkeypatch.setattr(unread_counter, "read_unread_counts", read_counts)
+    asyncio.run(counter.get_counts(db, "u1"))
+    assert not other.exists("unread:u1")
@@ -0,0 +1,196 @@
+import asyncio
+import json
+from collections import Counter
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app.api.routes.auth import create_access_token
+from app.core.config import settings
+from app.services.websocket_manager import ClientConnection
+from app.services.ws_codec import JSON_SUBPROTOCOL, Frame
+
+def _ws_url(user, token=None):
+    token = token if token is not None else create_access_token({"sub": user.id})
+    return f"/ws/{user.id}?token={token}"
+
+def test_socket_rejects_another_users_token(client, match_pair):
+    alice, bob, match = match_pair
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(_ws_url(alice, create_access_token({"sub": bob.id}))) as ws:
+            ws.receive_json()
+
+def test_tokenless_socket_is_allowed_until_required(client, match_pair, monkeypatch):
+    alice, bob, match = match_pair
+    with client.websocket_connect(f"/ws/{alice.id}") as ws:
+        ws.send_json({"type": "ping"})
+        assert ws.receive_json() == {"type": "pong"}
+
+    monkeypatch.setattr(settings, "WS_REQUIRE_TOKEN", True)
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(f"/ws/{alice.id}") as ws:
+            ws.receive_json()
+
+def test_socket_messages_only_reach_own_matches(client, match_pair, make_user):
+    alice, bob, match = match_pair
+    mallory = make_user("mallory")
+    with client.websocket_connect(_ws_url(mallory)) as ws:
+        ws.send_json({"type": "new_message", "match_id": match.id, "content": "hi", "client_id": "c1"})
+        frame = ws.receive_json()
+    assert frame["type"] == "message_error"
+    assert frame["client_id"] == "c1"
+
+    with client.websocket_connect(_ws_url(alice)) as ws:
+        ws.send_json({"type": "new_message", "match_id": match.id, "content": "hi", "client_id": "c2"})
+        frame = ws.receive_json()
+    assert frame["type"] == "message_ack"
+    assert frame["seq"] == 1
+
+def test_socket_survives_malformed_frames(client, match_pair):
+    alice, bob, match = match_pair
+    with client.websocket_connect(_ws_url(alice)) as ws:
+        ws.send_bytes(b"\x93\x01")
+        ws.send_bytes(b"\x92\x63\x80")
+        ws.send_text("[1, 2]")
+        ws.send_json({"type": "ping"})
+        assert ws.receive_json() == {"type": "pong"}
+
+class StalledSocket:
+    """A client that has stopped reading: every send waits until resumed"""
+
+    def __init__(self):
+        self.sent = []
+        self.reading = asyncio.Event()
+        self.closed_with = None
+
+    async def send_text(self, text):
+        await self.reading.wait()
+        self.sent.append(json.loads(text)["n"])
+
+    async def close(self, code):
+        self.closed_with = code
+
+@pytest.mark.parametrize("policy, delivered", [
+    ("drop_oldest", [0, 3, 4]),
+    ("drop_newest", [0, 1, 2]),
+    ("disconnect", []),
+])
+def test_send_queue_overflow_policy(policy, delivered, monkeypatch):
+    monkeypatch.setattr(settings, "WS_SEND_QUEUE_SIZE", 2)
+    monkeypatch.setattr(settings, "WS_SEND_OVERFLOW_POLICY", policy)
+
+    async def scenario():
+        socket, metrics = StalledSocket(), Counter()
+        connection = ClientConnection(socket, "alice", "1", JSON_SUBPROTOCOL, lambda c: c.stop(), metrics)
+        connection.enqueue(Frame("new_message", {"n": 0}))
+        # The writer picks up frame 0 and blocks sending it; 1 and 2 fill the queue
+        await asyncio.sleep(0.01)
+        for n in range(1, 5):
+            connection.enqueue(Frame("new_message", {"n": n}))
+        socket.reading.set()
+        await asyncio.sleep(0.01)
+        connection.stop()
+        return socket, connection, metrics
+
+    socket, connection, metrics = asyncio.run(scenario())
+    assert socket.sent == delivered
+    if policy == "disconnect":
+        # Closed on the first overflow, with frame 0 still in flight
+        assert socket.closed_with == 1013
+        assert metrics["closed_overflow"] == 1
+    else:
+        assert socket.closed_with is None
+        assert connection.dropped == metrics["frames_dropped"] == 2
+
+def test_messages_reach_every_device_until_it_disconnects(client, match_pair):
+    alice, bob, match = match_pair
+    manager = client.app.state.connection_manager
+
+    def send(ws, content):
+        ws.send_json({"type": "new_message", "match_id": match.id, "content": content, "client_id": content})
+        assert ws.receive_json()["type"] == "message_ack"
+
+    with client.websocket_connect(_ws_url(alice)) as sender, \
+            client.websocket_connect(_ws_url(bob)) as phone:
+        with client.websocket_connect(_ws_url(bob)) as laptop:
+            assert len(manager.active_connections[bob.id]) == 2
+            send(sender, "first")
+            for device in (phone, laptop):
+                frame = device.receive_json()
+                assert (frame["type"], frame["content"]) == ("new_message", "first")
+
+        # Closing the laptop leaves the phone connected
+        phone.send_json({"type": "ping"})
+        assert phone.receive_json() == {"type": "pong"}
+        assert len(manager.active_connections[bob.id]) == 1
+        send(sender, "second")
+        frame = phone.receive_json()
+        assert (frame["type"], frame["content"]) == ("new_message", "second")
+
+def test_heartbeat_pings_quiet_sockets_and_reaps_silent_ones(client, match_pair):
+    alice, bob, match = match_pair
+    manager = client.app.state.connection_manager
+
+    with client.websocket_connect(_ws_url(alice)) as ws:
+        [connection] = manager.active_connections[alice.id].values()
+        connection.last_seen -= settings.WS_PING_INTERVAL_SECONDS
+        client.portal.call(manager.sweep)
+        assert ws.receive_json() == {"type": "ping"}
+        assert manager.metrics["pings_sent"] == 1
+
+        # The pong counts as a sign of life, so the next sweep leaves it be
+        ws.send_json({"type": "pong"})
+        ws.send_json({"type": "ping"})
+        assert ws.receive_json() == {"type": "pong"}
+        client.portal.call(manager.sweep)
+        assert manager.metrics["pings_sent"] == 1
+
+        connection.last_seen -= settings.WS_IDLE_TIMEOUT_SECONDS
+        client.portal.call(manager.sweep)
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+        assert closed.value.code == 1001
+        assert manager.metrics["reaped_idle"] == 1
+        assert not manager.is_connected(alice.id)
+
+def test_reconnecting_client_gets_missed_events_replayed(client, match_pair):
+    alice, bob, match = match_pair
+    manager = client.app.state.connection_manager
+
+    def notify(n):
+        client.portal.call(manager.send_personal_message, Frame("new_match", {"match_id": f"m{n}"}), bob.id)
+
+    with client.websocket_connect(_ws_url(bob)) as ws:
+        for n in (1, 2):
+            notify(n)
+        assert [ws.receive_json()["event_seq"] for _ in range(2)] == [1, 2]
+    for n in (3, 4):
+        notify(n)
+
+    with client.websocket_connect(_ws_url(bob) + "&last_seq=2") as ws:
+        frames = [ws.receive_json() for _ in range(2)]
+    assert [(frame["match_id"], frame["event_seq"]) for frame in frames] == [("m3", 3), ("m4", 4)]
+
+    # A sequence the server can't replay from means starting over
+    with client.websocket_connect(_ws_url(bob) + "&last_seq=99") as ws:
+        assert ws.receive_json() == {"type": "resync_required", "event_seq": 4}
+
+def test_events_held_during_a_replay_follow_it_without_duplicates():
+    async def scenario():
+        socket = StalledSocket()
+        socket.reading.set()
+        connection = ClientConnection(socket, "alice", "1", JSON_SUBPROTOCOL, lambda c: c.stop(), Counter())
+        connection.hold()
+        # Live events published while the replay was being read
+        connection.enqueue(Frame("new_match", {"n": 3}), 3)
+        connection.enqueue(Frame("pong", {"n": "live"}))
+        connection.enqueue(Frame("new_match", {"n": 4}), 4)
+        await asyncio.sleep(0.01)
+        assert socket.sent == []
+
+        connection.release([(Frame("new_match", {"n": n}), n) for n in (1, 2, 3)], 3)
+        await asyncio.sleep(0.01)
+        connection.stop()
+        return socket.sent
+
+    assert asyncio.run(scenario()) == [1, 2, 3, "live", 4]
@@ -0,0 +1,47 @@
+import json
+
+import msgpack
+import pytest
+
+from app.services.ws_codec import (
+    JSON_SUBPROTOCOL, MSGPACK_SUBPROTOCOL, Frame, FrameDecodeError, decode_json_frame, decode_msgpack_frame
+)
+
+def test_msgpack_round_trip():
+    frame = Frame("game_update", {"room_id": "r1"}, data={"move": [1, 2]})
+    frame_type, fields, data, payload = decode_msgpack_frame(frame.encode(MSGPACK_SUBPROTOCOL))
+    assert (frame_type, fields, data) == ("game_update", {"room_id": "r1"}, None)
+    assert msgpack.unpackb(payload) == {"move": [1, 2]}
+
+    frame_type, fields, data, payload = decode_msgpack_frame(Frame("ping", {}).encode(MSGPACK_SUBPROTOCOL))
+    assert (frame_type, fields, payload) == ("ping", {}, None)
+
+def test_json_round_trip():
+    frame = Frame("game_update", {"room_id": "r1"}, data={"move": [1, 2]})
+    assert decode_json_frame(frame.encode(JSON_SUBPROTOCOL)) == (
+        "game_update", {"room_id": "r1"}, {"move": [1, 2]}, None
+    )
+
+@pytest.mark.parametrize("raw", [
+    b"\xc1",                                         # never used in msgpack
+    msgpack.packb({"type": 1}),                      # not a list
+    msgpack.packb([1]),                              # no fields
+    msgpack.packb([99, {}]),                         # unknown tag
+    msgpack.packb(["new_message", {}]),              # tag isn't an int
+    msgpack.packb([1, ["match_id"]]),                # fields not a map
+    msgpack.packb([6, {}, {"type": "offer"}]),       # payload not a blob
+])
+def test_malformed_msgpack_is_rejected(raw):
+    with pytest.raises(FrameDecodeError):
+        decode_msgpack_frame(raw)
+
+@pytest.mark.parametrize("text", [
+    "",
+    "{not json",
+    json.dumps(["new_message"]),
+    json.dumps({"match_id": "m1"}),
+    json.dumps({"type": "no_such_event"}),
+])
+def test_malformed_json_is_rejected(text):
+    with pytest.raises(FrameDecodeError):
+        decode_json_frame(text)
@@ -569,4 +569,5 @@ class ApiService {
   }
   
   bool get isAuthenticated => _token != null;
+  String? get token => _token;
 }
\ No newline at end of file
@@ -10,6 +10,7 @@ class WebSocketService {
   
   WebSocketChannel? _channel;
   String? _userId;
+  String? _token;
   
   // Callbacks
   Function(Map<String, dynamic>)? onSignalingMessage;
@@ -17,10 +18,14 @@ class WebSocketService {
   
   String get wsUrl => AppConstants.wsBaseUrl;
   
-  Future<void> connect(String userId) async {
+  Future<void> connect(String userId, String? token) async {
     try {
       _userId = userId;
-      final uri = Uri.parse('$wsUrl/$userId');
+      _token = token;
+      // The server checks the token belongs to userId
+      final uri = Uri.parse('$wsUrl/$userId').replace(
+        queryParameters: token != null ? {'token': token} : null,
+      );
       print('Connecting to WebSocket: $uri');
       
       _channel = WebSocketChannel.connect(uri);
@@ -82,7 +87,7 @@ class WebSocketService {
     if (_userId != null) {
       Future.delayed(const Duration(seconds: 5), () {
         print('Attempting to reconnect WebSocket...');
-        connect(_userId!);
+        connect(_userId!, _token);
       });
     }
   }
@@ -91,6 +96,7 @@ class WebSocketService {
     await _channel?.sink.close();
     _channel = null;
     _userId = null;
+    _token = null;
     print('WebSocket disconnected');
   }
   
@@ -104,7 +104,7 @@ class AuthBloc extends Bloc<AuthEvent, AuthState> {
       if (_apiService.isAuthenticated) {
         final user = await _apiService.getCurrentUser();
         try {
-          await _wsService.connect(user.id);
+          await _wsService.connect(user.id, _apiService.token);
         } catch (e) {
           print('WebSocket connection failed: $e');
         }
@@ -135,7 +135,7 @@ class AuthBloc extends Bloc<AuthEvent, AuthState> {
       );
       
       final user = UserModel.fromJson(response['user']);
-      await _wsService.connect(user.id);
+      await _wsService.connect(user.id, _apiService.token);
       emit(AuthAuthenticated(user));
     } catch (e) {
       emit(AuthError(e.toString()));
@@ -155,7 +155,7 @@ class AuthBloc extends Bloc<AuthEvent, AuthState> {
       );
       
       final user = UserModel.fromJson(response['user']);
-      await _wsService.connect(user.id);
+      await _wsService.connect(user.id, _apiService.token);
       emit(AuthAuthenticated(user));
     } catch (e) {
       emit(AuthError(e.toString()));